@@ -10,8 +10,9 @@ import pymq
 from pymq.typing import deep_from_dict
 from redis import Redis
 
+from galileo.util import redis_time
 from galileo.worker.api import RegisterWorkerCommand, ClientDescription, CreateClientCommand, ClientConfig, \
-    StartTracingCommand, PauseTracingCommand, SetWorkloadCommand, StopWorkloadCommand
+    StartTracingCommand, PauseTracingCommand, SetWorkloadCommand, StopWorkloadCommand, ScheduleWorkloadCommand
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +37,18 @@ class ClusterController:
     def unregister_worker(self, name: str):
         raise NotImplementedError
 
+    def report_dropped_traces(self, name: str, n: int):
+        raise NotImplementedError
+
+    def get_dropped_traces(self, name: str) -> int:
+        raise NotImplementedError
+
+    def set_clock_offset(self, name: str, offset: float):
+        raise NotImplementedError
+
+    def get_clock_offset(self, name: str) -> Optional[float]:
+        raise NotImplementedError
+
     def list_workers(self, pattern: str = ''):
         raise NotImplementedError
 
@@ -54,18 +67,24 @@ class ClusterController:
     def get_client_description(self, client_id: str) -> Optional[ClientDescription]:
         raise NotImplementedError
 
-    def start_tracing(self):
+    def start_tracing(self, sampling: str = None):
         raise NotImplementedError
 
     def stop_tracing(self):
         raise NotImplementedError
 
-    def set_workload(self, client_id, ia=None, n: int = None):
+    def set_workload(self, client_id, ia=None, n: int = None, start_at: float = None, users: int = None):
         raise NotImplementedError
 
     def stop_workload(self, client_id):
         raise NotImplementedError
 
+    def schedule_workload(self, client_id, ticks: List[float], interval: float, start: float = None):
+        raise NotImplementedError
+
+    def time(self) -> float:
+        raise NotImplementedError
+
 
 def pack(n, workers, nr_clients):
     """
@@ -93,6 +112,8 @@ def pack(n, workers, nr_clients):
 class RedisClusterController(ClusterController):
     worker_key = 'galileo:workers'
     worker_clients_key = 'galileo:worker:%s:clients'
+    worker_dropped_traces_key = 'galileo:worker:%s:dropped_traces'
+    worker_clock_offset_key = 'galileo:worker:%s:clock_offset'
     client_key = 'galileo:client:%s'
 
     def __init__(self, rds, eventbus=None) -> None:
@@ -121,6 +142,29 @@ class RedisClusterController(ClusterController):
         logger.info('unregistering worker %s', name)
         self.rds.srem(self.worker_key, name)
         self.rds.delete(self.worker_clients_key % name)
+        self.rds.delete(self.worker_clock_offset_key % name)
+
+    def report_dropped_traces(self, name: str, n: int):
+        """
+        Adds the number of traces that clients of the given worker have dropped to the dropped traces counter of the
+        worker, which is kept apart from the worker labels (see ``get_dropped_traces``).
+        """
+        self.rds.incrby(self.worker_dropped_traces_key % name, n)
+
+    def get_dropped_traces(self, name: str) -> int:
+        value = self.rds.get(self.worker_dropped_traces_key % name)
+        return int(value) if value else 0
+
+    def set_clock_offset(self, name: str, offset: float):
+        """
+        Stores the estimated offset of the redis server clock to the clock of the given worker, which is kept apart
+        from the worker labels.
+        """
+        self.rds.set(self.worker_clock_offset_key % name, '%.6f' % offset)
+
+    def get_clock_offset(self, name: str) -> Optional[float]:
+        value = self.rds.get(self.worker_clock_offset_key % name)
+        return float(value) if value else None
 
     def list_workers(self, pattern: str = ''):
         workers = self.rds.smembers(self.worker_key)
@@ -222,15 +266,17 @@ class RedisClusterController(ClusterController):
 
         return deserialize_client_description(doc)
 
-    def start_tracing(self):
-        return self.eventbus.publish(StartTracingCommand())
+    def start_tracing(self, sampling: str = None):
+        return self.eventbus.publish(StartTracingCommand(sampling))
 
     def stop_tracing(self):
         return self.eventbus.publish(PauseTracingCommand())
 
-    def set_workload(self, client_id, ia=None, n: int = None):
-        if ia is None and n is None:
-            raise ValueError('need interarrival or number of messages')
+    def set_workload(self, client_id, ia=None, n: int = None, start_at: float = None, users: int = None):
+        if ia is None and n is None and not users:
+            raise ValueError('need interarrival, number of messages, or users')
+        if users is not None and users < 1:
+            raise ValueError('users must be at least 1')
 
         dist, params = 'constant', None
 
@@ -239,12 +285,25 @@ class RedisClusterController(ClusterController):
         elif isinstance(ia, tuple):
             dist, params = ia[0], ia[1:]
 
-        cmd = SetWorkloadCommand(client_id, num=n, distribution=dist, parameters=params)
+        cmd = SetWorkloadCommand(client_id, num=n, distribution=dist, parameters=params, start_at=start_at, users=users)
         return self.eventbus.publish(cmd)
 
     def stop_workload(self, client_id):
         return self.eventbus.publish(StopWorkloadCommand(client_id))
 
+    def schedule_workload(self, client_id, ticks: List[float], interval: float, start: float = None):
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+
+        cmd = ScheduleWorkloadCommand(client_id, ticks=list(ticks), interval=interval, start=start)
+        return self.eventbus.publish(cmd)
+
+    def time(self) -> float:
+        """
+        Returns the time of the redis server, which is the reference clock for workload start times.
+        """
+        return redis_time(self.rds)
+
     def count_worker_clients(self, worker_labels: Dict[str, str] = None):
         workers_labels = self.list_workers_info()
         workers = list(map(lambda x: x[0], workers_labels))
@@ -7,6 +7,9 @@ from galileo.controller import ClusterController
 from galileo.shell.shell import Galileo
 
 
+schedule_lead_time = 1.
+
+
 def run_experiment(ctrl: ClusterController, exp: ExperimentConfiguration):
     g = Galileo(ctrl)
     workload_clients = {}
@@ -17,12 +20,14 @@ def run_experiment(ctrl: ClusterController, exp: ExperimentConfiguration):
 
     ticks = int(math.ceil(exp.duration / exp.interval))
 
-    for t in range(ticks):
-        for workload, clients in workload_clients.items():
-            service_rps = workload.ticks[t]
-            clients.rps(service_rps / workload.clients_per_host)
+    # the clients switch the rates on their own, the lead time gives all clients time to receive the schedule
+    start = ctrl.time() + schedule_lead_time
+
+    for workload, clients in workload_clients.items():
+        client_ticks = [service_rps / workload.clients_per_host for service_rps in workload.ticks[:ticks]]
+        clients.schedule(client_ticks, exp.interval, start)
 
-        time.sleep(exp.interval)
+    time.sleep(schedule_lead_time + ticks * exp.interval)
 
     for clients in workload_clients.values():
         clients.rps(0)
@@ -1,7 +1,8 @@
 from galileo.routing.balancer import Balancer, WeightedRoundRobinBalancer, StaticLocalhostBalancer, \
-    WeightedRandomBalancer, StaticHostBalancer
-from galileo.routing.router import ServiceRequest, Router, StaticRouter, HostRouter, ServiceRouter
-from galileo.routing.table import RoutingRecord, RoutingTable, RedisRoutingTable, ReadOnlyListeningRedisRoutingTable
+    WeightedRandomBalancer, StaticHostBalancer, LeastOutstandingRequestsBalancer
+from galileo.routing.router import ServiceRequest, Router, StaticRouter, HostRouter, ServiceRouter, create_session
+from galileo.routing.table import RoutingRecord, RoutingTable, RedisRoutingTable, ReadOnlyListeningRedisRoutingTable, \
+    RevalidatingRoutingTable
 
 __all__ = [
     'ServiceRequest',
@@ -9,13 +10,16 @@ __all__ = [
     'StaticRouter',
     'HostRouter',
     'ServiceRouter',
+    'create_session',
     'RoutingRecord',
     'RoutingTable',
     'RedisRoutingTable',
     'ReadOnlyListeningRedisRoutingTable',
+    'RevalidatingRoutingTable',
     'Balancer',
     'WeightedRoundRobinBalancer',
     'StaticLocalhostBalancer',
     'WeightedRandomBalancer',
-    'StaticHostBalancer'
+    'StaticHostBalancer',
+    'LeastOutstandingRequestsBalancer'
 ]
@@ -1,10 +1,12 @@
 import abc
+import itertools
 import math
 import random
 import threading
 from functools import reduce
+from typing import List, Dict
 
-from galileo.routing.table import RoutingTable
+from galileo.routing.table import RoutingTable, RoutingRecord
 
 
 class Balancer(abc.ABC):
@@ -12,6 +14,19 @@ class Balancer(abc.ABC):
     def next_host(self, service=None):
         raise NotImplementedError
 
+    def release(self, host):
+        """
+        Called by the router once the request sent to a host returned by ``next_host`` has completed (successfully or
+        not). Balancers that track outstanding requests override this, the default does nothing.
+        """
+        pass
+
+    def outstanding(self) -> Dict[str, int]:
+        """
+        Returns the number of outstanding requests per host, for balancers that track them.
+        """
+        return dict()
+
 
 class StaticHostBalancer(Balancer):
     host: str
@@ -30,78 +45,306 @@ class StaticLocalhostBalancer(StaticHostBalancer):
         super().__init__('localhost')
 
 
-class WeightedRandomBalancer(Balancer):
-    _rtbl: RoutingTable
+class CompiledRecord(abc.ABC):
+    """
+    A routing record compiled into a data structure that a balancer can pick hosts from efficiently. Implementations
+    must be immutable or otherwise safe to use by multiple threads.
+    """
+    record: RoutingRecord
+
+    def next(self) -> str:
+        raise NotImplementedError
+
+
+class CompilingBalancer(Balancer, abc.ABC):
+    """
+    Base class of balancers that compile each routing record once (see ``_compile_record``) and pick hosts from the
+    compiled record. ``next_host`` can be called concurrently, and takes a lock only when a record needs to be compiled.
+
+    If the routing table notifies listeners (see ``RoutingTable.add_listener``), the compiled record of a service is
+    evicted when the table reports a change of the service (including its removal), and compiled again on the next
+    request. Otherwise, the record is fetched from the table for every request, and compiled again if it differs from
+    the one that was compiled. Compiled records of services that no longer have a record are evicted.
+    """
 
     def __init__(self, rtbl: RoutingTable) -> None:
         super().__init__()
         self._rtbl = rtbl
+        self._compiled: Dict[str, CompiledRecord] = dict()
+        self._lock = threading.Lock()
+        self._listening = rtbl.add_listener(self._on_routing_update)
+
+    def _compile_record(self, record: RoutingRecord) -> CompiledRecord:
+        raise NotImplementedError
+
+    def _on_routing_update(self, service):
+        with self._lock:
+            self._compiled.pop(service, None)
+
+    def _compile(self, service) -> CompiledRecord:
+        with self._lock:
+            # updates reported while the record is compiled evict it once the lock is released
+            compiled = self._compiled.get(service)
+            if compiled is not None:
+                return compiled
+
+            return self._store(self._get_routing(service))
+
+    def _get_routing(self, service) -> RoutingRecord:
+        try:
+            return self._rtbl.get_routing(service)
+        except ValueError:
+            self._compiled.pop(service, None)
+            raise
+
+    def _store(self, record: RoutingRecord) -> CompiledRecord:
+        compiled = self._compile_record(record)
+        self._compiled[record.service] = compiled
+        return compiled
+
+    def _require_compiled(self, service) -> CompiledRecord:
+        compiled = self._compiled.get(service)
+
+        if self._listening:
+            if compiled is not None:
+                return compiled
+            return self._compile(service)
+
+        record = self._get_routing(service)
+        if compiled is not None and (compiled.record is record or compiled.record == record):
+            return compiled
+        return self._store(record)
 
     def next_host(self, service=None):
         if not service:
             raise ValueError
 
-        record = self._rtbl.get_routing(service)
-        host = random.choices(record.hosts, record.weights, k=1)[0]
+        return self._require_compiled(service).next()
 
-        return host
+
+class AliasTable(CompiledRecord):
+    """
+    Alias table of a routing record (Vose's alias method), which picks a host with a probability proportional to its
+    weight in O(1), using a single random number and no allocations.
+    """
+
+    def __init__(self, record: RoutingRecord, rnd: random.Random = None) -> None:
+        super().__init__()
+        self.record = record
+        self._random = (rnd or random).random
+
+        n = len(record.hosts)
+        total = float(sum(record.weights)) if n else 0.
+        if total <= 0 or min(record.weights) < 0:
+            raise ValueError('weights must be non-negative and have a positive sum')
+
+        self.hosts = list(record.hosts)
+        self.alias = list(range(n))
+        self.prob = [1.] * n
+
+        scaled = [w * n / total for w in record.weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+
+            scaled[g] = (scaled[g] + scaled[s]) - 1
+            (small if scaled[g] < 1 else large).append(g)
+
+        # remaining columns are full, up to rounding errors
+        for i in itertools.chain(small, large):
+            self.prob[i] = 1.
+
+    def next(self) -> str:
+        u = self._random() * len(self.hosts)
+        i = int(u)
+        if u - i < self.prob[i]:
+            return self.hosts[i]
+        return self.hosts[self.alias[i]]
+
+
+class WeightedRandomBalancer(CompilingBalancer):
+    """
+    Picks hosts randomly with a probability proportional to their weight, using an alias table that is built once per
+    routing record (see ``AliasTable`` and ``CompilingBalancer``).
+    """
+
+    def _compile_record(self, record: RoutingRecord) -> CompiledRecord:
+        return AliasTable(record)
 
 
 def gcd(ls):
     return reduce(math.gcd, ls)
 
 
-class WeightedRoundRobinBalancer(Balancer):
+def smooth_weighted_round_robin(hosts: List[str], weights: List[float], max_length: int = 10000) -> List[str]:
+    """
+    Compiles hosts and their weights into a flat schedule using the smooth weighted round-robin algorithm (as used by
+    nginx), which interleaves the hosts as evenly as possible, e.g., weights [5, 1, 1] result in
+    [a, a, b, a, c, a, a] instead of [a, a, a, a, a, b, c]. Each host occurs in the schedule as often as its weight
+    (truncated to an integer), divided by the gcd of all weights. If the schedule would become longer than
+    ``max_length``, the weights are scaled down proportionally.
+
+    :param hosts: the hosts
+    :param weights: the weights of the hosts
+    :param max_length: the maximum length of the schedule
+    :return: a list of hosts
+    """
+    weights = [int(w) for w in weights]
+    if not hosts or max(weights) <= 0:
+        raise ValueError('no hosts with positive weights')
+
+    hosts, weights = zip(*[(h, w) for h, w in zip(hosts, weights) if w > 0])
+    d = gcd(weights)
+    weights = [w // d for w in weights]
+
+    total = sum(weights)
+    if total > max_length:
+        weights = [max(1, round(w * max_length / total)) for w in weights]
+        total = sum(weights)
+
+    schedule = list()
+    current = [0] * len(hosts)
+    for _ in range(total):
+        best = 0
+        for i, w in enumerate(weights):
+            current[i] += w
+            if current[i] > current[best]:
+                best = i
+        current[best] -= total
+        schedule.append(hosts[best])
+
+    return schedule
+
+
+class _Schedule(CompiledRecord):
+    """
+    A compiled schedule of a routing record. The schedule is immutable, and the position is advanced with an
+    ``itertools.count``, which is atomic, so the schedule can be used by multiple threads without locking.
+    """
+
+    def __init__(self, record: RoutingRecord, hosts: List[str]) -> None:
+        super().__init__()
+        self.record = record
+        self.hosts = hosts
+        self._counter = itertools.count()
+
+    def next(self) -> str:
+        return self.hosts[next(self._counter) % len(self.hosts)]
+
+
+class WeightedRoundRobinBalancer(CompilingBalancer):
+    """
+    Weighted round-robin balancing (see http://kb.linuxvirtualserver.org/wiki/Weighted_Round-Robin_Scheduling) that
+    compiles each routing record once into a flat schedule of hosts (see ``smooth_weighted_round_robin`` and
+    ``CompilingBalancer``), so that picking the next host only advances an atomic counter.
     """
-    Implementation of http://kb.linuxvirtualserver.org/wiki/Weighted_Round-Robin_Scheduling
 
-    FIXME: generators are never freed
+    def _compile_record(self, record: RoutingRecord) -> CompiledRecord:
+        return _Schedule(record, smooth_weighted_round_robin(record.hosts, record.weights))
+
+
+class _HostSet(CompiledRecord):
+    """
+    The hosts of a routing record that have a positive weight, and their weights.
     """
 
-    def __init__(self, rtbl: RoutingTable) -> None:
+    def __init__(self, record: RoutingRecord) -> None:
         super().__init__()
-        self._rtbl = rtbl
-        self._generators = dict()  # service name -> generator
-        self._lock = threading.Lock()
+        self.record = record
+        self.hosts = [h for h, w in zip(record.hosts, record.weights) if w > 0]
+        self.weights = [float(w) for w in record.weights if w > 0]
 
-    def generator(self, service):
-        i = -1
-        cw = 0
+        if not self.hosts:
+            raise ValueError('no hosts with positive weights')
 
-        while True:
-            record = self._rtbl.get_routing(service)
 
-            hosts = record.hosts
-            weights = [int(w) for w in record.weights]
+class _Outstanding:
+    """
+    The number of outstanding requests of a host. Updates take the lock of the host only, reads take no lock.
+    """
 
-            n = len(hosts)
-            i = (i + 1) % n
-            if i == 0:
-                cw = cw - gcd(weights)
-                if cw <= 0:
-                    cw = max(weights)
-                    if cw == 0:
-                        raise ValueError
+    def __init__(self) -> None:
+        super().__init__()
+        self.n = 0
+        self.lock = threading.Lock()
 
-            if weights[i] >= cw:
-                yield hosts[i]
+    def acquire(self):
+        with self.lock:
+            self.n += 1
 
-    def _require_generator(self, service):
-        gen = self._generators.get(service)
-        if gen:
-            return gen
+    def release(self):
+        with self.lock:
+            if self.n > 0:
+                self.n -= 1
 
-        with self._lock:
-            if service in self._generators:  # avoid race condition
-                return self._generators[service]
 
-            gen = self.generator(service)
-            self._generators[service] = gen
-            return gen
+class LeastOutstandingRequestsBalancer(CompilingBalancer):
+    """
+    Picks hosts of the routing record by their number of outstanding requests, i.e., requests that were routed to the
+    host but have not yet completed (see ``Balancer.release``). Unlike weighted round-robin, this keeps sending fewer
+    requests to hosts that slow down. Hosts are picked with power-of-two-choices: two distinct hosts are sampled at
+    random, and the one with fewer outstanding requests is picked. If ``weighted`` is set, the one with the lower number
+    of outstanding requests (including the new one) per unit of weight is picked instead.
+
+    Outstanding requests are counted per host across services, since they share the host's capacity. Each host has its
+    own counter, so there is no lock shared by all callers, and picking a host takes constant time regardless of the
+    number of hosts. The counts are read without locking, so concurrent picks may see slightly stale counts.
+    """
+
+    def __init__(self, rtbl: RoutingTable, weighted: bool = False, rnd: random.Random = None) -> None:
+        super().__init__(rtbl)
+        self.weighted = weighted
+        self._random = (rnd or random).random
+        self._outstanding: Dict[str, _Outstanding] = dict()
+
+    def _compile_record(self, record: RoutingRecord) -> CompiledRecord:
+        return _HostSet(record)
+
+    def _counter(self, host) -> _Outstanding:
+        counter = self._outstanding.get(host)
+        if counter is None:
+            # setdefault is atomic, so concurrent callers end up with the same counter
+            counter = self._outstanding.setdefault(host, _Outstanding())
+        return counter
 
     def next_host(self, service=None):
         if not service:
             raise ValueError
 
-        gen = self._require_generator(service)
-        return next(gen)
+        compiled: _HostSet = self._require_compiled(service)
+        hosts = compiled.hosts
+        n = len(hosts)
+
+        if n == 1:
+            best = 0
+        else:
+            i = int(self._random() * n)
+            j = int(self._random() * (n - 1))
+            if j >= i:
+                j += 1
+
+            load_i = self._counter(hosts[i]).n
+            load_j = self._counter(hosts[j]).n
+            if self.weighted:
+                load_i = (load_i + 1) / compiled.weights[i]
+                load_j = (load_j + 1) / compiled.weights[j]
+
+            best = j if load_j < load_i else i
+
+        host = hosts[best]
+        self._counter(host).acquire()
+        return host
+
+    def release(self, host):
+        counter = self._outstanding.get(host)
+        if counter is not None:
+            counter.release()
+
+    def outstanding(self) -> Dict[str, int]:
+        return {host: counter.n for host, counter in list(self._outstanding.items()) if counter.n}
@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import time
+from typing import Dict
 
 import requests
 
@@ -16,8 +18,8 @@ class OffloadRouter(Router):
     execute requests locally.
     """
 
-    def __init__(self, host_router: HostRouter):
-        super().__init__()
+    def __init__(self, host_router: HostRouter, session: requests.Session = None):
+        super().__init__(session or host_router.session)
         self.host_router = host_router
 
     def remote_execution(self, req: OffloadServiceRequest):
@@ -27,7 +29,10 @@ class OffloadRouter(Router):
 
         req.sent = time.time()
         print("external", req.method, url, **req.kwargs)
-        response = requests.request(req.method, url, **req.kwargs)
+        try:
+            response = self.session.request(req.method, url, **req.kwargs)
+        finally:
+            self.host_router._release(req)
         req.done = req.sent
 
         logger.debug('%s %s: %s', req.method, url, response.status_code)
@@ -38,6 +43,9 @@ class OffloadRouter(Router):
             self.last_log_update = time.time()
         return response
 
+    def outstanding(self) -> Dict[str, int]:
+        return self.host_router.outstanding()
+
     def local_execution(self, req: OffloadServiceRequest) -> requests.Response:
         ...
 
@@ -46,3 +54,9 @@ class OffloadRouter(Router):
             return self.remote_execution(req)
         else:
             return self.local_execution(req)
+
+    async def request_async(self, req: OffloadServiceRequest, session, read=None) -> requests.Response:
+        if req.offload:
+            return await self.host_router.request_async(req, session, read)
+        else:
+            return await asyncio.get_running_loop().run_in_executor(None, self.local_execution, req)
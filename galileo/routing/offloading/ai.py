@@ -16,8 +16,8 @@ class AIOffloadRouter(OffloadRouter):
     execute requests locally invoking the loaded model.
     """
 
-    def __init__(self, host_router: HostRouter):
-        super().__init__(host_router)
+    def __init__(self, host_router: HostRouter, session: requests.Session = None):
+        super().__init__(host_router, session)
         self.model = self.load_model()
 
     def load_model(self):
@@ -30,7 +30,7 @@ class AIOffloadRouter(OffloadRouter):
         logger.debug('forwarding request %s %s', req.method, url)
 
         req.sent = time.time()
-        response = requests.request(req.method, 'http://localhost:8080', **req.kwargs)
+        response = self.session.request(req.method, 'http://localhost:8080', **req.kwargs)
         req.done = req.sent
 
         logger.debug('%s %s: %s', req.method, url, response.status_code)
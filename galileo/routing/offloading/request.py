@@ -12,6 +12,7 @@ class OffloadServiceRequest(ServiceRequest):
     offload: bool
 
     created: float
+    scheduled: float
     sent: float
     done: float
 
@@ -24,3 +25,4 @@ class OffloadServiceRequest(ServiceRequest):
         self.kwargs = kwargs
 
         self.created = time.time()
+        self.scheduled = self.created
@@ -15,8 +15,8 @@ class SimulatedOffloadRouter(OffloadRouter):
     execute requests locally by sleeping for a specified duration.
     """
 
-    def __init__(self, host_router: HostRouter):
-        super().__init__(host_router)
+    def __init__(self, host_router: HostRouter, session: requests.Session = None):
+        super().__init__(host_router, session)
 
 
     def local_execution(self, req: OffloadServiceRequest) -> requests.Response:
@@ -1,7 +1,16 @@
 import abc
 import logging
+import ssl
+import threading
 import time
+from typing import Dict
+
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from galileo.routing.balancer import Balancer
 
@@ -15,9 +24,16 @@ class ServiceRequest:
     kwargs: dict
 
     created: float
+    scheduled: float
     sent: float
     done: float
 
+    # durations of the phases of the request in nanoseconds (see Router.request), None if timing is disabled
+    timings: Dict[str, int] = None
+
+    # the host the request was routed to by a DynamicRouter, until the balancer was notified of its completion
+    host: str = None
+
     def __init__(self, service, path='/', method='get', **kwargs) -> None:
         super().__init__()
         self.service = service
@@ -26,23 +42,188 @@ class ServiceRequest:
         self.kwargs = kwargs
 
         self.created = time.time()
+        self.scheduled = self.created
+
+    @property
+    def lag(self) -> float:
+        """
+        The time between the point the request was scheduled to be sent by the request generator, and its creation.
+        """
+        return self.created - self.scheduled
+
+
+# nanoseconds the current thread spent establishing connections since the counter was last reset
+_connect_time = threading.local()
+
+
+class _TimedConnectMixin:
+
+    def connect(self):
+        start = time.perf_counter_ns()
+        try:
+            super().connect()
+        finally:
+            _connect_time.ns = getattr(_connect_time, 'ns', 0) + time.perf_counter_ns() - start
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter whose connections record the time spent establishing them, so the connect phase can be told apart
+    from the rest of a request.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+def create_session(pool_connections=10, pool_maxsize=10, pool_block=False) -> requests.Session:
+    """
+    Creates a requests.Session that keeps connections alive and re-uses them across requests. The session can be
+    shared by multiple threads. Connections of the session record the time spent establishing them, which is reported
+    in the ``connect`` phase of timed requests.
+
+    :param pool_connections: the number of per-host connection pools to cache
+    :param pool_maxsize: the maximum number of connections to keep open per host
+    :param pool_block: whether to block when all connections to a host are in use, instead of opening a new one
+    :return: a requests.Session
+    """
+    adapter = _TimedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# keyword arguments of requests.request that aiohttp.ClientSession.request takes unchanged
+_AIOHTTP_PASSTHROUGH = ('params', 'data', 'json', 'headers', 'cookies', 'allow_redirects')
+
+
+def aiohttp_kwargs(kwargs: dict) -> dict:
+    """
+    Translates the keyword arguments of ``requests.request`` into those of ``aiohttp.ClientSession.request``:
+    ``timeout`` (seconds, or a (connect, read) tuple) becomes an ``aiohttp.ClientTimeout``, ``verify`` becomes ``ssl``,
+    and ``auth`` (a (user, password) tuple or ``requests.auth.HTTPBasicAuth``) becomes an ``aiohttp.BasicAuth``.
+    ``stream`` is ignored, as the body is read by the router. Other arguments (e.g., ``files``, ``cert`` or
+    ``proxies``) raise a ValueError.
+    """
+    import aiohttp
+
+    result = dict()
+
+    for key, value in kwargs.items():
+        if key in _AIOHTTP_PASSTHROUGH:
+            result[key] = value
+        elif key == 'stream':
+            continue
+        elif key == 'timeout':
+            if value is None:
+                result['timeout'] = aiohttp.ClientTimeout()
+            elif isinstance(value, tuple):
+                connect, read = value
+                result['timeout'] = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+            else:
+                result['timeout'] = aiohttp.ClientTimeout(total=value)
+        elif key == 'verify':
+            if value is False:
+                result['ssl'] = False
+            elif isinstance(value, str):
+                result['ssl'] = ssl.create_default_context(cafile=value)
+        elif key == 'auth':
+            if isinstance(value, HTTPBasicAuth):
+                value = (value.username, value.password)
+            if not isinstance(value, (tuple, list)) or len(value) != 2:
+                raise ValueError('auth %r is not supported by the asyncio engine' % (value,))
+            result['auth'] = aiohttp.BasicAuth(*value)
+        elif value is not None:
+            raise ValueError('request argument %s is not supported by the asyncio engine' % key)
+
+    return result
+
+
+async def _read_all(resp) -> bytes:
+    return await resp.read()
 
 
 class Router(abc.ABC):
+    session: requests.Session
 
-    def __init__(self):
+    def __init__(self, session: requests.Session = None):
         self.last_log_update = time.time()
         self.requests_since_last_log_update = 0
+        self.session = session or create_session()
 
     def request(self, req: ServiceRequest) -> requests.Response:
+        """
+        Sends the request and returns the response. If ``req.timings`` is a dict, the durations of the following phases
+        are stored in it (in nanoseconds): ``route`` (determining the URL, including the balancer lookup),
+        ``connect`` (establishing new connections), ``server`` (sending the request and waiting for the response
+        headers), and ``read`` (reading the response body, unless the request is streamed).
+        """
+        if req.timings is not None:
+            return self._timed_request(req, req.timings)
+
         url = self._get_url(req)
 
         logger.debug('forwarding request %s %s', req.method, url)
 
         req.sent = time.time()
-        response = requests.request(req.method, url, **req.kwargs)
+        response = self.session.request(req.method, url, **req.kwargs)
         req.done = req.sent
 
+        self._log_response(req, url, response)
+        return response
+
+    def _timed_request(self, req: ServiceRequest, timings: Dict[str, int]) -> requests.Response:
+        start = time.perf_counter_ns()
+        url = self._get_url(req)
+        routed = time.perf_counter_ns()
+
+        logger.debug('forwarding request %s %s', req.method, url)
+
+        # the body is read separately to tell the server time from the time spent reading the body
+        stream = req.kwargs.get('stream', False)
+        kwargs = dict(req.kwargs, stream=True)
+
+        _connect_time.ns = 0
+        req.sent = time.time()
+        response = self.session.request(req.method, url, **kwargs)
+        responded = time.perf_counter_ns()
+        req.done = req.sent
+
+        connect = _connect_time.ns
+        timings['route'] = routed - start
+        timings['connect'] = connect
+        timings['server'] = responded - routed - connect
+
+        if not stream:
+            _ = response.content
+            timings['read'] = time.perf_counter_ns() - responded
+
+        self._log_response(req, url, response)
+        return response
+
+    def _log_response(self, req: ServiceRequest, url: str, response: requests.Response):
         logger.debug('%s %s: %s', req.method, url, response.status_code)
         self.requests_since_last_log_update += 1
         if time.time() - self.last_log_update >= 1:
@@ -51,9 +232,64 @@ class Router(abc.ABC):
             self.last_log_update = time.time()
         return response
 
+    async def request_async(self, req: ServiceRequest, session, read=None) -> requests.Response:
+        """
+        Performs the request on the given ``aiohttp.ClientSession`` and returns the result as a ``requests.Response``,
+        so callers can treat it the same way as the result of ``request``. The keyword arguments of the request are
+        translated to those of aiohttp (see ``aiohttp_kwargs``). If ``req.timings`` is a dict, the ``route``,
+        ``server`` and ``read`` phases are stored in it, the time spent establishing connections is not measured
+        separately and is part of ``server``.
+
+        :param req: the service request
+        :param session: an aiohttp client session
+        :param read: an async callable that reads the body of the ``aiohttp.ClientResponse`` and returns the content of
+                     the returned response, by default the complete body is read
+        :return: a requests.Response holding the status, headers and body of the response
+        """
+        timings = req.timings
+        if timings is not None:
+            start = time.perf_counter_ns()
+
+        url = self._get_url(req)
+        kwargs = aiohttp_kwargs(req.kwargs)
+
+        if timings is not None:
+            routed = time.perf_counter_ns()
+            timings['route'] = routed - start
+
+        logger.debug('forwarding request %s %s', req.method, url)
+
+        req.sent = time.time()
+        async with session.request(req.method, url, **kwargs) as resp:
+            if timings is not None:
+                responded = time.perf_counter_ns()
+                timings['server'] = responded - routed
+
+            content = await (read or _read_all)(resp)
+
+            if timings is not None:
+                timings['read'] = time.perf_counter_ns() - responded
+
+            response = requests.Response()
+            response.status_code = resp.status
+            response.url = str(resp.url)
+            response.headers = CaseInsensitiveDict(resp.headers)
+            response.encoding = resp.charset or 'utf-8'
+            response._content = content
+
+        logger.debug('%s %s: %s', req.method, url, response.status_code)
+        return response
+
     def _get_url(self, req: ServiceRequest) -> str:
         raise NotImplementedError
 
+    def outstanding(self) -> Dict[str, int]:
+        """
+        Returns the number of requests per host that were routed but have not yet completed, if the router tracks
+        them (see ``Balancer.outstanding``).
+        """
+        return dict()
+
 
 class StaticRouter(Router):
     """
@@ -61,8 +297,8 @@ class StaticRouter(Router):
     everything to a webserver on localhost:8080.
     """
 
-    def __init__(self, path_prefix) -> None:
-        super().__init__()
+    def __init__(self, path_prefix, session: requests.Session = None) -> None:
+        super().__init__(session)
         self.path_prefix = path_prefix
 
     def _get_url(self, req: ServiceRequest) -> str:
@@ -75,14 +311,64 @@ class DynamicRouter(Router, abc.ABC):
     """
     _balancer: Balancer
 
-    def __init__(self, balancer: Balancer) -> None:
-        super().__init__()
+    def __init__(self, balancer: Balancer, session: requests.Session = None) -> None:
+        super().__init__(session)
         self._balancer = balancer
 
+    def request(self, req: ServiceRequest) -> requests.Response:
+        try:
+            response = super().request(req)
+        except BaseException:
+            self._release(req)
+            raise
+
+        if req.kwargs.get('stream') and getattr(response, 'raw', None) is not None:
+            self._release_on_close(req, response)
+        else:
+            self._release(req)
+
+        return response
+
+    async def request_async(self, req: ServiceRequest, session, read=None) -> requests.Response:
+        try:
+            return await super().request_async(req, session, read)
+        finally:
+            self._release(req)
+
     def _get_url(self, req: ServiceRequest) -> str:
         host = self._balancer.next_host(req.service)
+        req.host = host
         return self._create_url(host, req)
 
+    def _release(self, req: ServiceRequest):
+        """
+        Tells the balancer that the request routed with ``_get_url`` has completed. Calling it more than once has no
+        effect.
+        """
+        host = req.host
+        if host is None:
+            return
+        req.host = None
+        self._balancer.release(host)
+
+    def _release_on_close(self, req: ServiceRequest, response: requests.Response):
+        """
+        Streamed responses are still transferring their body when they are returned, so the request completes once the
+        response is closed (e.g., by ``ResponseCapture``), which callers of streamed requests have to do.
+        """
+        close = response.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                self._release(req)
+
+        response.close = close_and_release
+
+    def outstanding(self) -> Dict[str, int]:
+        return self._balancer.outstanding()
+
     def _create_url(self, host, req: ServiceRequest):
         raise NotImplementedError
 
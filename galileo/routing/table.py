@@ -1,7 +1,8 @@
 import abc
 import logging
 import threading
-from typing import NamedTuple, List
+import time
+from typing import NamedTuple, List, Callable, Optional, Tuple, Dict
 
 import redis
 
@@ -33,9 +34,27 @@ class RoutingTable(abc.ABC):
     def get_routes(self):
         return [self.get_routing(service) for service in self.list_services()]
 
+    def add_listener(self, listener: Callable[[str], None]) -> bool:
+        """
+        Registers a callable that is called with the name of a service whenever its routing record may have changed.
+
+        :param listener: the listener
+        :return: True if the table notifies listeners, False if it does not support listeners, in which case callers
+                 need to check records returned by ``get_routing`` for changes themselves
+        """
+        return False
+
 
 class RedisRoutingTable(RoutingTable):
+    """
+    Stores routing records in redis. Every change of a record increments the version of its service and the version of
+    the whole table in the same transaction, so readers can check whether their copy of a record is still current with
+    a single ``GET`` (see ``get_version`` and ``RevalidatingRoutingTable``). Versions of removed services are kept, so
+    they keep increasing if a service is added again.
+    """
     update_channel = 'routing:updates'
+    version_key = 'routing:version'
+    service_version_key = 'routing:version:%s'
 
     def __init__(self, rds) -> None:
         super().__init__()
@@ -50,11 +69,42 @@ class RedisRoutingTable(RoutingTable):
         rds.lrange('routing:weights:%s' % service, 0, -1)
         result = rds.execute()
 
-        if result[0]:
-            return RoutingRecord(service, result[0], [float(i) for i in result[1]])
+        return self._create_record(service, result[0], result[1])
+
+    def get_versioned_routing(self, service) -> Tuple[Optional[int], RoutingRecord]:
+        """
+        Reads the routing record of a service together with its version.
+
+        :param service: the service
+        :return: a tuple of the version (None if the record was not written with a version) and the record
+        """
+        rds = self.rds.pipeline()
+        rds.get(self.service_version_key % service)
+        rds.lrange('routing:hosts:%s' % service, 0, -1)
+        rds.lrange('routing:weights:%s' % service, 0, -1)
+        version, hosts, weights = rds.execute()
+
+        return _version(version), self._create_record(service, hosts, weights)
+
+    def get_version(self, service=None) -> Optional[int]:
+        """
+        Returns the version of the record of the given service, or of the whole table if no service is given. Returns
+        None if the table or record has never been changed.
+        """
+        key = self.version_key if service is None else self.service_version_key % service
+        return _version(self.rds.get(key))
+
+    @staticmethod
+    def _create_record(service, hosts, weights) -> RoutingRecord:
+        if hosts:
+            return RoutingRecord(service, hosts, [float(i) for i in weights])
 
         raise ValueError(f"No routing record found for service '{service}'")
 
+    def _increment_version(self, rds, service):
+        rds.incr(self.service_version_key % service)
+        rds.incr(self.version_key)
+
     def set_routing(self, record: RoutingRecord):
         if len(record.weights) != len(record.hosts):
             raise ValueError('The number of weights does not match the population')
@@ -66,6 +116,7 @@ class RedisRoutingTable(RoutingTable):
         rds.sadd('routing:services', record.service)
         rds.rpush('routing:hosts:%s' % record.service, *record.hosts)
         rds.rpush('routing:weights:%s' % record.service, *record.weights)
+        self._increment_version(rds, record.service)
         rds.publish(self.update_channel, record.service)
 
         rds.execute()
@@ -78,7 +129,9 @@ class RedisRoutingTable(RoutingTable):
         for service in self.list_services():
             rds.delete('routing:hosts:%s' % service)
             rds.delete('routing:weights:%s' % service)
+            self._increment_version(rds, service)
             rds.publish(self.update_channel, service)
+        rds.incr(self.version_key)
         rds.delete('routing:services')
         rds.execute()
 
@@ -87,11 +140,131 @@ class RedisRoutingTable(RoutingTable):
         rds.delete('routing:hosts:%s' % service)
         rds.delete('routing:weights:%s' % service)
         rds.srem('routing:services', service)
+        self._increment_version(rds, service)
         rds.publish(self.update_channel, service)
         rds.execute()
 
 
+def _version(value) -> Optional[int]:
+    if value is None:
+        return None
+    return int(value)
+
+
+class _ValidatedRecord(NamedTuple):
+    version: int
+    value: object
+    validated: float
+
+
+class RevalidatingRoutingTable(RoutingTable):
+    """
+    Keeps local copies of the records of a RedisRoutingTable for routers that do not listen for updates. Before a copy
+    is returned, it is revalidated by comparing its version with the version in redis, which is a single ``GET``
+    instead of reading the record. Within ``ttl`` seconds after a copy was validated, it is returned without
+    revalidation. Unchanged records are returned as the same object, so balancers can detect changes by identity. The
+    list of services is revalidated with the version of the whole table.
+
+    Records that were written without a version (by older versions of the table) are read every time.
+
+    The table is used concurrently by the request threads of a client. Copies are read without locking, and replaced
+    under a lock. Copies read from redis before a local update (``set_routing``, ``remove_service``, ``clear``) are not
+    stored, so they cannot overwrite the invalidation.
+    """
+
+    def __init__(self, rtable: RedisRoutingTable, ttl: float = 0.) -> None:
+        super().__init__()
+        self.rtable = rtable
+        self.ttl = ttl
+        self._records: Dict[str, _ValidatedRecord] = dict()
+        self._services: Optional[_ValidatedRecord] = None
+        self._lock = threading.Lock()
+        self._generation = 0  # incremented by local updates
+
+    def _is_valid(self, cached: Optional[_ValidatedRecord], service=None) -> bool:
+        if cached is None:
+            return False
+
+        now = time.monotonic()
+        if now - cached.validated < self.ttl:
+            return True
+
+        if self.rtable.get_version(service) != cached.version:
+            return False
+
+        with self._lock:
+            # unless the copy was replaced in the meantime
+            if service is None:
+                if self._services is cached:
+                    self._services = cached._replace(validated=now)
+            elif self._records.get(service) is cached:
+                self._records[service] = cached._replace(validated=now)
+        return True
+
+    def get_routing(self, service) -> RoutingRecord:
+        cached = self._records.get(service)
+        if self._is_valid(cached, service):
+            return cached.value
+
+        generation = self._generation
+        try:
+            version, record = self.rtable.get_versioned_routing(service)
+        except ValueError:
+            with self._lock:
+                self._records.pop(service, None)
+            raise
+
+        if version is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._records[service] = _ValidatedRecord(version, record, time.monotonic())
+        return record
+
+    def list_services(self):
+        cached = self._services
+        if self._is_valid(cached):
+            return cached.value
+
+        generation = self._generation
+        rds = self.rtable.rds.pipeline()
+        rds.get(self.rtable.version_key)
+        rds.smembers('routing:services')
+        version, services = rds.execute()
+
+        version = _version(version)
+        if version is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._services = _ValidatedRecord(version, services, time.monotonic())
+        return services
+
+    def _invalidate(self, service=None):
+        with self._lock:
+            self._generation += 1
+            if service is None:
+                self._records = dict()
+            else:
+                self._records.pop(service, None)
+            self._services = None
+
+    def set_routing(self, record: RoutingRecord):
+        self.rtable.set_routing(record)
+        self._invalidate(record.service)
+
+    def remove_service(self, service):
+        self.rtable.remove_service(service)
+        self._invalidate(service)
+
+    def clear(self):
+        self.rtable.clear()
+        self._invalidate()
+
+
 class ReadOnlyListeningRedisRoutingTable(RoutingTable):
+    """
+    Caches the routing records of a RedisRoutingTable, and invalidates them when it receives an update notification.
+    Listeners added via ``add_listener`` are notified after the cached record was invalidated.
+    """
 
     def __init__(self, rds) -> None:
         super().__init__()
@@ -99,6 +272,7 @@ class ReadOnlyListeningRedisRoutingTable(RoutingTable):
         self.rtable = RedisRoutingTable(rds)
         self._cache = dict()
         self._services = list()
+        self._listeners: List[Callable[[str], None]] = list()
 
         self._reload_lock = threading.Lock()
 
@@ -135,6 +309,8 @@ class ReadOnlyListeningRedisRoutingTable(RoutingTable):
                     if service in self._cache:
                         del self._cache[service]
                     self._services = self.rtable.list_services()
+
+                self._notify(service)
         except redis.ConnectionError:
             if logger.isEnabledFor(logging.DEBUG):
                 logger.exception('listener terminated due to connection error')
@@ -143,6 +319,17 @@ class ReadOnlyListeningRedisRoutingTable(RoutingTable):
         finally:
             self._pubsub.close()
 
+    def add_listener(self, listener: Callable[[str], None]) -> bool:
+        self._listeners.append(listener)
+        return True
+
+    def _notify(self, service):
+        for listener in self._listeners:
+            try:
+                listener(service)
+            except Exception:
+                logger.exception('error while notifying routing table listener %s', listener)
+
     def close(self):
         try:
             self._pubsub.unsubscribe()
@@ -1,4 +1,5 @@
 import atexit
+import math
 import multiprocessing
 import os
 import sys
@@ -16,8 +17,12 @@ from telemc import TelemetryController
 from galileo.controller.cluster import ClusterController, RedisClusterController
 from galileo.routing import RoutingRecord, RoutingTable, RedisRoutingTable
 from galileo.shell.printer import sprint_routing_table, print_tabular, Stringer
-from galileo.worker.api import ClientConfig, ClientDescription, CloseClientCommand, ClientInfo, WorkloadDoneEvent
+from galileo.worker.api import ClientConfig, ClientDescription, CloseClientCommand, ClientInfo, WorkloadDoneEvent, \
+    ClientMetrics
 from galileo.worker.client import single_request
+from galileo.worker.metrics import last_metrics_id, read_metrics
+from galileo.worker.random import upload_profile
+from galileo.worker.stats import LatencyHistogram, PHASES
 
 prompt = 'galileo> '
 
@@ -83,7 +88,7 @@ class RequestFuture:
         self.aborted = False
         self.lock = Condition()
 
-    def run(self, n=None, ia=None):
+    def run(self, n=None, ia=None, start_at=None, users=None):
         clients_done = set(self.client_ids)
 
         # lots of problems with this unfortunately, may never terminate if clients disappear, concurrent events from
@@ -100,7 +105,7 @@ class RequestFuture:
             with self.lock:
                 pymq.subscribe(done_subscriber)
                 for c in self.client_ids:
-                    self.ctrl.set_workload(c, ia, n)
+                    self.ctrl.set_workload(c, ia, n, start_at, users)
 
                 self.lock.wait_for(self.stopped)
         finally:
@@ -149,7 +154,7 @@ class ClientGroup:
         else:
             self.request(ia=(1 / n))
 
-    def request(self, n=None, ia=None) -> RequestFuture:
+    def request(self, n=None, ia=None, start_at=None, users=None) -> RequestFuture:
         """
         Tell the clients in the group to start generating requests. You can specify a message rate, or a number of
         requests, or both.
@@ -181,8 +186,22 @@ class ClientGroup:
 
             c.request(n=100).wait()
 
+        To start the workload on all clients at the same time, pass a ``start_at`` timestamp according to the clock of
+        the redis server, which the clients translate to their local clock::
+
+            c.request(ia=0.2, start_at=g.time() + 1)
+
+        With ``users``, the workload is closed-loop: each client runs the given number of virtual users that each send
+        a request, wait for the response, and then sleep for a think time given by ``ia`` before sending the next
+        request. The following example runs 10 users per client with exponentially distributed think times of 0.5
+        seconds on average, until each client has sent 1000 requests::
+
+            c.request(n=1000, ia=('expovariate', 2), users=10)
+
         :param n: the maximum number of requests
-        :param ia: the request interarrival
+        :param ia: the request interarrival, or the think time of closed-loop workloads
+        :param start_at: the unix timestamp (redis server clock) at which the workload starts (optional)
+        :param users: the number of virtual users per client of a closed-loop workload (optional)
         :return a RequestFuture object
         """
 
@@ -192,13 +211,34 @@ class ClientGroup:
             self.running_request.wait(1)
 
         future = RequestFuture(self.ctrl, {c.client_id for c in self.clients})
-        t = Thread(target=future.run, args=(n, ia))
+        t = Thread(target=future.run, args=(n, ia, start_at, users))
         t.start()
 
         self.running_request = future
 
         return future
 
+    def schedule(self, ticks: List[float], interval: float, start: float = None):
+        """
+        Send a schedule of request rates to all clients in the group, which the clients then follow on their own. For
+        example::
+
+            c.schedule([10, 20, 0, 5], interval=60, start=time.time() + 2)
+
+        lets each client send 10 requests per second for the first minute after start, 20 for the second, pause for
+        the third, and send 5 requests per second for the last minute.
+
+        :param ticks: requests per second of each client in each interval
+        :param interval: the length of an interval in seconds
+        :param start: the unix timestamp (redis server clock) at which the first interval starts (defaults to now)
+        """
+        if self.running_request and not self.running_request.stopped():
+            self.running_request.abort()
+            self.running_request.wait(1)
+
+        for c in self.clients:
+            self.ctrl.schedule_workload(c.client_id, ticks, interval, start)
+
     def pause(self):
         """
         Pause the current workload set by ``ClientGroup.request``.
@@ -207,7 +247,16 @@ class ClientGroup:
             self.ctrl.stop_workload(c.client_id)
 
     def info(self) -> List[ClientInfo]:
-        return pymq.stub('Client.get_info', timeout=2, multi=True)()
+        result = list()
+
+        # processes that host multiple clients return a list of infos
+        for info in pymq.stub('Client.get_info', timeout=2, multi=True)():
+            if isinstance(info, list):
+                result.extend(info)
+            else:
+                result.append(info)
+
+        return result
 
     def add(self, n=1):
         """
@@ -303,12 +352,14 @@ class Galileo:
         super().__init__()
         self.ctrl = ctrl
 
-    def start_tracing(self):
+    def start_tracing(self, sampling: str = None):
         """
         Send a StartTracing command to all workers.
+        :param sampling: the sampling policy of clients that have none configured: 'all', 'ratio:N', 'reservoir:K[:W]'
+                         or 'tail:T[:N]' (optional, defaults to the worker's galileo_trace_sampling)
         :return: the number of workers who received the command
         """
-        return self.ctrl.start_tracing()
+        return self.ctrl.start_tracing(sampling)
 
     def stop_tracing(self):
         """
@@ -327,6 +378,24 @@ class Galileo:
     def workers_info(self) -> List[Tuple[str, str]]:
         return self.ctrl.list_workers_info()
 
+    def time(self) -> float:
+        """
+        Returns the time of the redis server, which is the reference clock for workload start times.
+        :return: a unix timestamp
+        """
+        return self.ctrl.time()
+
+    def upload_profile(self, client_id: str, values, dtype: str = 'float64') -> int:
+        """
+        Upload the interarrivals for a client whose workload uses the 'prerecorded' distribution as packed profile. The
+        client consumes the values in the given order, and deletes the profile afterwards.
+        :param client_id: the client id
+        :param values: a numpy array or a list of floats
+        :param dtype: 'float64' or 'float32'
+        :return: the number of uploaded values
+        """
+        return upload_profile(self.ctrl.rds, client_id, values, dtype)
+
     def ping(self):
         """
         Send a synchronous ping to all workers and return the response. May contain error tuples.
@@ -366,7 +435,9 @@ class Galileo:
         return resp
 
     def spawn(self, service, num: int = 1, client: str = None, parameters: dict = None,
-              worker_labels: dict = None) -> ClientGroup:
+              worker_labels: dict = None, engine: str = None, max_pending: int = None,
+              overload_policy: str = None, capture: str = None, capture_headers: List[str] = None,
+              sampling: str = None, max_lag: float = None) -> ClientGroup:
         """
         Spawn clients for the given service and distribute them across workers. If no client app is specified, a default
         http client will be created that creates http requests from the (optional) parameters::
@@ -389,9 +460,23 @@ class Galileo:
         :param client: the client app name (optional, if not given will use service name)
         :param parameters: parameters for the app (optional, e.g.: '{ "size": "small" }'
         :param worker_labels: labels that workers must match to be part of the group
+        :param engine: the client engine, 'threads' or 'asyncio' (optional, defaults to the worker's
+                       galileo_client_engine)
+        :param max_pending: the maximum number of queued and in-flight requests per client (optional)
+        :param overload_policy: what to do with requests while max_pending is reached: 'block', 'drop' or 'fail'
+                                (optional)
+        :param capture: which part of the response body to store in traces: 'full', 'none', 'head:N', 'hash' or
+                        'length' (optional)
+        :param capture_headers: the response headers to store in traces (optional, defaults to all)
+        :param sampling: which traces to store: 'all', 'ratio:N', 'reservoir:K[:W]' or 'tail:T[:N]' (optional,
+                         overrides the policy set with start_tracing)
+        :param max_lag: the number of seconds a client may fall behind its schedule before it skips the missed
+                        requests instead of sending them at once (optional, 0 to always catch up)
         :return a new ClientGroup for the created clients
         """
-        cfg = ClientConfig(service, client=client, parameters=parameters, worker_labels=worker_labels)
+        cfg = ClientConfig(service, client=client, parameters=parameters, worker_labels=worker_labels, engine=engine,
+                           max_pending=max_pending, overload_policy=overload_policy, capture=capture,
+                           capture_headers=capture_headers, sampling=sampling, max_lag=max_lag)
         clients = self.ctrl.create_clients(cfg, num)
         return ClientGroup(self.ctrl, clients, cfg)
 
@@ -476,7 +561,9 @@ class Show:
 
     def info(self, **exclude):
         """
-        Print tabular info about the currently running clients.
+        Print tabular info about the currently running clients. The corrected latency is measured from the time a
+        request was scheduled to be sent, rather than the time it was actually sent, and therefore includes the time
+        requests were delayed when the client or the service was overloaded.
         :param exclude: kwargs that exclude fields, e.g., parameters=False to hide the parameter column
         """
         data = []
@@ -494,8 +581,18 @@ class Show:
                 'parameters': param_str,
                 'requests': info.requests,
                 'failed': info.failed,
+                'queued': '-' if info.queued is None else info.queued,
+                'in-flight': info.inflight,
+                'rejected': info.rejected,
+                'dropped traces': info.dropped_traces,
             }
 
+            latency = LatencyHistogram.merged([info.latency])
+            record['p50 (ms)'] = _format_ms(latency, 50)
+            record['p99 (ms)'] = _format_ms(latency, 99)
+            record['p999 (ms)'] = _format_ms(latency, 99.9)
+            record['corrected p99 (ms)'] = _format_ms(LatencyHistogram.merged([info.corrected_latency]), 99)
+
             for k, v in exclude.items():
                 if k in record and v is False:
                     del record[k]
@@ -504,6 +601,152 @@ class Show:
 
         print_tabular(data)
 
+    def latency(self):
+        """
+        Print the latency percentiles per service and status class, merged across all running clients.
+        """
+        histograms: Dict[str, List[dict]] = dict()
+        for info in self.g.clients().info():
+            for key, doc in (info.histograms or {}).items():
+                histograms.setdefault(key, list()).append(doc)
+
+        data = []
+        for key in sorted(histograms.keys()):
+            service, status = key.rsplit(' ', 1)
+            histogram = LatencyHistogram.merged(histograms[key])
+            data.append({
+                'service': service,
+                'status': status,
+                'requests': histogram.count,
+                'p50 (ms)': _format_ms(histogram, 50),
+                'p99 (ms)': _format_ms(histogram, 99),
+                'p999 (ms)': _format_ms(histogram, 99.9),
+                'max (ms)': _format_ms(histogram, 100),
+            })
+
+        print_tabular(data)
+
+
+    def phases(self):
+        """
+        Print the durations of the phases of the request hot path, merged across all running clients. Phases are only
+        measured by clients of workers with galileo_client_timing enabled.
+        """
+        histograms: Dict[str, List[dict]] = dict()
+        for info in self.g.clients().info():
+            for phase, doc in (info.phases or {}).items():
+                histograms.setdefault(phase, list()).append(doc)
+
+        order = [p for p in PHASES if p in histograms] + sorted(p for p in histograms if p not in PHASES)
+
+        data = []
+        for phase in order:
+            histogram = LatencyHistogram.merged(histograms[phase])
+            data.append({
+                'phase': phase,
+                'requests': histogram.count,
+                'mean (ms)': '%.3f' % (histogram.sum / histogram.count * 1000) if histogram.count else '-',
+                'p50 (ms)': _format_ms(histogram, 50, 3),
+                'p99 (ms)': _format_ms(histogram, 99, 3),
+                'max (ms)': _format_ms(histogram, 100, 3),
+            })
+
+        print_tabular(data)
+
+    def live(self, service: str = None, interval: float = 1., duration: float = None, expire: float = 5.):
+        """
+        Print a live view of the per-second metrics the clients publish to the metrics stream, refreshed every
+        ``interval`` seconds until interrupted (or for ``duration`` seconds). Clients that have not published metrics
+        for ``expire`` seconds are removed from the view.
+        :param service: only show clients of the given service
+        :param interval: the refresh interval in seconds
+        :param duration: stop after the given number of seconds
+        :param expire: seconds after which clients that stopped publishing are removed from the view
+        """
+        rds = self.g.ctrl.rds
+        last_id = last_metrics_id(rds)
+        latest: Dict[str, Tuple[float, ClientMetrics]] = dict()
+
+        start = time.monotonic()
+        refresh = start
+        try:
+            while duration is None or refresh - start < duration:
+                refresh += interval
+                time.sleep(max(0., refresh - time.monotonic()))
+
+                last_id, records = read_metrics(rds, last_id)
+                now = time.monotonic()
+                for record in records:
+                    if service is None or record.service == service:
+                        latest[record.client_id] = (now, record)
+
+                for client_id, (seen, _) in list(latest.items()):
+                    if now - seen > expire:
+                        del latest[client_id]
+
+                if sys.stdout.isatty():
+                    print('\033[2J\033[H', end='')
+                print(time.strftime('%H:%M:%S'), '(%d clients)' % len(latest))
+                print_tabular(_live_table([record for _, record in latest.values()]))
+        except KeyboardInterrupt:
+            pass
+
+
+def _live_table(records: List[ClientMetrics]) -> List[dict]:
+    data = []
+    total = {'rate': 0., 'target': 0., 'errors': 0, 'queued': 0, 'inflight': 0}
+
+    for record in sorted(records, key=lambda r: r.client_id):
+        errors = record.errors / record.interval
+        data.append({
+            'client id': record.client_id,
+            'service': record.service,
+            'rps': '%.1f' % record.rate,
+            'target rps': '-' if record.target_rate is None else '%.1f' % record.target_rate,
+            'errors/s': '%.1f' % errors,
+            'p50 (ms)': _format_seconds(record.p50),
+            'p99 (ms)': _format_seconds(record.p99),
+            'p999 (ms)': _format_seconds(record.p999),
+            'queued': '-' if record.queued is None else record.queued,
+            'in-flight': record.inflight,
+        })
+
+        total['rate'] += record.rate
+        total['target'] += record.target_rate or 0.
+        total['errors'] += errors
+        total['queued'] += record.queued or 0
+        total['inflight'] += record.inflight
+
+    if len(data) > 1:
+        data.append({
+            'client id': 'total',
+            'service': '',
+            'rps': '%.1f' % total['rate'],
+            'target rps': '%.1f' % total['target'],
+            'errors/s': '%.1f' % total['errors'],
+            'p50 (ms)': '',
+            'p99 (ms)': '',
+            'p999 (ms)': '',
+            'queued': total['queued'],
+            'in-flight': total['inflight'],
+        })
+
+    return data
+
+
+def _format_seconds(value: float) -> str:
+    if value is None or math.isnan(value):
+        return '-'
+
+    return '%.2f' % (value * 1000)
+
+
+def _format_ms(histogram: LatencyHistogram, p: float, precision: int = 2) -> str:
+    if not histogram.count:
+        return '-'
+
+    return '%.*f' % (precision, histogram.percentile(p) * 1000)
+
 
 class RoutingTableHelper:
     """
@@ -88,3 +88,38 @@ def poll(condition, timeout=None, interval=0.5):
                 raise TimeoutError('gave up waiting after %s seconds' % timeout)
 
         time.sleep(interval)
+
+
+def redis_time(rds) -> float:
+    """
+    Returns the current time of the redis server as unix timestamp.
+
+    :param rds: the redis client
+    :return: the server time in seconds
+    """
+    seconds, microseconds = rds.time()
+    return seconds + microseconds / 1e6
+
+
+def estimate_clock_offset(rds, samples=5) -> float:
+    """
+    Estimates the offset of the redis server clock relative to the local clock, such that ``time.time() + offset`` is
+    the server time. Of the given number of samples, the one with the shortest round trip is used, and the server time
+    is assumed to have been taken half-way through the round trip.
+
+    :param rds: the redis client
+    :param samples: the number of samples
+    :return: the clock offset in seconds
+    """
+    best_rtt, best_offset = None, 0.
+
+    for _ in range(samples):
+        t0 = time.time()
+        server = redis_time(rds)
+        t1 = time.time()
+
+        rtt = t1 - t0
+        if best_rtt is None or rtt < best_rtt:
+            best_rtt, best_offset = rtt, server - (t0 + t1) / 2
+
+    return best_offset
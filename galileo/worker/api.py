@@ -1,4 +1,4 @@
-from typing import NamedTuple
+from typing import NamedTuple, List, Optional
 
 
 class RegisterWorkerEvent(NamedTuple):
@@ -14,7 +14,11 @@ class RegisterWorkerCommand(NamedTuple):
 
 
 class StartTracingCommand(NamedTuple):
-    pass
+    """
+    Starts tracing. If ``sampling`` is given, clients sample their traces with that policy (see
+    ``sampling.create_trace_sampler``), unless a policy is set in their ClientConfig.
+    """
+    sampling: str = None
 
 
 class PauseTracingCommand(NamedTuple):
@@ -26,14 +30,21 @@ class ClientConfig(NamedTuple):
     client: str = None
     parameters: dict = None
     worker_labels: dict = None
+    engine: str = None
+    max_pending: int = None
+    overload_policy: str = None
+    capture: str = None
+    capture_headers: List[str] = None
+    sampling: str = None
+    max_lag: float = None
 
     def __repr__(self):
         return self.__str__()
 
     def __str__(self) -> str:
-        return 'ClientConfig(service={}, client={}, parameters={}, worker_labels:{})'.format(
+        return 'ClientConfig(service={}, client={}, parameters={}, worker_labels:{}, engine={})'.format(
             self.service, self.client, self._abbrv_parameters(self.parameters),
-            self.worker_labels)
+            self.worker_labels, self.engine)
 
     def _abbrv_parameters(self, d):
         if d is None:
@@ -51,9 +62,51 @@ class ClientDescription(NamedTuple):
 
 
 class ClientInfo(NamedTuple):
+    """
+    Runtime information of a client. ``latency`` and ``corrected_latency`` are latency histograms (see
+    ``stats.LatencyHistogram.to_dict``), ``histograms`` holds the latency histograms per '<service> <status class>', and ``phases`` the
+    histograms of the durations of each phase of the request hot path if timing is enabled. ``outstanding`` holds the
+    number of outstanding requests per host if the router's balancer tracks them (see ``Router.outstanding``).
+    ``queued`` is None for clients that do not queue requests (see ``client.AsyncClient``).
+    """
     description: ClientDescription
     requests: int
     failed: int
+    latency: dict = None
+    corrected_latency: dict = None
+    histograms: dict = None
+    queued: Optional[int] = 0
+    inflight: int = 0
+    rejected: int = 0
+    dropped_traces: int = 0
+    spilled_traces: int = 0
+    phases: dict = None
+    outstanding: dict = None
+
+
+class ClientMetrics(NamedTuple):
+    """
+    Aggregated metrics of a client over one ``interval`` (in seconds) ending at ``time``, published by the worker to
+    the metrics stream (see ``metrics.MetricsPublisher``). ``rate`` is the achieved rate of completed requests,
+    ``target_rate`` the rate configured by the active workload at the end of the interval (see
+    ``client.workload_rate``, None for closed-loop workloads). ``dropped_traces`` is the number of traces the client
+    dropped in the interval. Latencies are in seconds, and NaN if no request completed in the interval. ``queued`` is
+    None for clients that do not queue requests.
+    """
+    client_id: str
+    worker: str
+    service: str
+    time: float
+    interval: float
+    rate: float
+    target_rate: Optional[float]
+    errors: int
+    p50: float
+    p99: float
+    p999: float
+    queued: Optional[int]
+    inflight: int
+    dropped_traces: int = 0
 
 
 class CloseClientCommand(NamedTuple):
@@ -81,10 +134,32 @@ class ClientStoppedEvent(NamedTuple):
 
 
 class SetWorkloadCommand(NamedTuple):
+    """
+    Sets the workload of a client. If ``start_at`` (a unix timestamp according to the redis server clock) is given, the
+    schedule of the workload starts at that time rather than when the client receives the command.
+
+    If ``users`` is given, the workload is closed-loop: each of the virtual users sends a request, waits for the
+    response, and sleeps for a think time drawn from the distribution before sending the next one. Otherwise, the
+    distribution determines the interarrivals of an open-loop workload.
+    """
     client_id: str
     num: int = None
     distribution: str = 'constant'
     parameters: tuple = None
+    start_at: float = None
+    users: int = None
+
+
+class ScheduleWorkloadCommand(NamedTuple):
+    """
+    Tells a client to follow a schedule of request rates: ``ticks[i]`` is the number of requests per second during the
+    i-th ``interval`` (in seconds) after ``start`` (a unix timestamp according to the redis server clock, defaults to
+    the time the client receives the command). The client switches the rates locally, and publishes a WorkloadDoneEvent after the last tick.
+    """
+    client_id: str
+    ticks: List[float]
+    interval: float
+    start: float = None
 
 
 class StopWorkloadCommand(NamedTuple):
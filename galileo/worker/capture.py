@@ -0,0 +1,157 @@
+import hashlib
+import logging
+from typing import List, Optional, Iterable
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_POLICIES = ('full', 'none', 'head', 'hash', 'length')
+
+
+class ResponseCapture:
+    """
+    Determines which parts of a response are stored in a RequestTrace. The ``policy`` is one of
+
+    - ``full``: the complete decoded response body (the default)
+    - ``none``: no body, the body is never read
+    - ``head:N``: the first N bytes of the body
+    - ``hash``: the SHA-1 hex digest of the body
+    - ``length``: the length of the body in bytes, taken from the Content-Length header if the server sends one
+
+    If ``headers`` is given, only the listed response headers (case-insensitive) are stored. For all policies except
+    ``full``, the response should be requested with ``stream=True``, so the body is only read as far as the policy needs
+    it. If the body was not read completely, the connection is closed rather than drained, so the rest of the body is
+    never transferred, at the cost of a new connection for the next request. ``body_async`` applies the policy to
+    aiohttp responses in the same way.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, policy: str = None, headers: List[str] = None) -> None:
+        super().__init__()
+        policy = policy or 'full'
+        self.head = None
+
+        if policy.startswith('head:'):
+            policy, n = policy.split(':', 1)
+            try:
+                self.head = int(n)
+            except ValueError:
+                raise ValueError('Invalid capture policy head:%s' % n)
+
+        if policy not in CAPTURE_POLICIES or (policy == 'head' and self.head is None):
+            raise ValueError('Unknown capture policy %s' % policy)
+
+        self.policy = policy
+        self.header_whitelist = list(headers) if headers is not None else None
+
+    @property
+    def stream(self) -> bool:
+        return self.policy != 'full'
+
+    def headers(self, response: requests.Response) -> dict:
+        if self.header_whitelist is None:
+            return dict(response.headers)
+
+        return {h: response.headers[h] for h in self.header_whitelist if h in response.headers}
+
+    def body(self, response: requests.Response) -> Optional[str]:
+        if self.policy == 'full':
+            return response.text.strip()
+
+        try:
+            if self.policy == 'none':
+                return None
+
+            if self.policy == 'head':
+                data = self._read_head(response, self.head)
+                return data.decode(response.encoding or 'utf-8', errors='replace').strip()
+
+            if self.policy == 'hash':
+                h = hashlib.sha1()
+                for chunk in self._iter_body(response):
+                    h.update(chunk)
+                return h.hexdigest()
+
+            if self.policy == 'length':
+                length = response.headers.get('Content-Length')
+                if length is not None:
+                    return length
+                return str(sum(len(chunk) for chunk in self._iter_body(response)))
+        finally:
+            self._release(response)
+
+    async def body_async(self, resp) -> Optional[str]:
+        """
+        Returns the body of an ``aiohttp.ClientResponse`` according to the policy, reading it only as far as the policy
+        needs.
+        """
+        if self.policy == 'full':
+            return (await resp.text(errors='replace')).strip()
+
+        try:
+            if self.policy == 'none':
+                return None
+
+            if self.policy == 'head':
+                data = b''
+                while len(data) < self.head:
+                    chunk = await resp.content.read(self.head - len(data))
+                    if not chunk:
+                        break
+                    data += chunk
+                return data.decode(resp.charset or 'utf-8', errors='replace').strip()
+
+            if self.policy == 'hash':
+                h = hashlib.sha1()
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    h.update(chunk)
+                return h.hexdigest()
+
+            if self.policy == 'length':
+                length = resp.headers.get('Content-Length')
+                if length is not None:
+                    return length
+
+                n = 0
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    n += len(chunk)
+                return str(n)
+        finally:
+            self._release_async(resp)
+
+    def release(self, response: requests.Response):
+        """
+        Releases a streamed response, which ``body`` does unless the request failed before it was called.
+        """
+        self._release(response)
+
+    def _read_head(self, response: requests.Response, n: int) -> bytes:
+        if response.raw is None:
+            return (response.content or b'')[:n]
+
+        return response.raw.read(n, decode_content=True)
+
+    def _iter_body(self, response: requests.Response) -> Iterable[bytes]:
+        if response.raw is None:
+            # responses that were not created by a requests.Session (e.g., asyncio or debug routers)
+            content = response.content
+            if content:
+                yield content
+            return
+
+        yield from response.iter_content(self.chunk_size)
+
+    @staticmethod
+    def _release_async(resp):
+        if not resp.content.at_eof():
+            # closes the connection instead of reading the rest of the body
+            resp.close()
+
+    @staticmethod
+    def _release(response: requests.Response):
+        if response.raw is None:
+            return
+
+        # returns the connection to the pool if the body was consumed, and closes it otherwise
+        response.close()
@@ -1,29 +1,38 @@
+import asyncio
+import itertools
 import json
 import logging
+import math
 import signal
 import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Queue
 from queue import Full
+from typing import Dict, List, Optional
 import pymq
 import requests
-from galileodb.model import RequestTrace
 from pymq.provider.redis import RedisEventBus
 
 from galileo import util
 from galileo.apps.app import AppClient, DefaultAppClient, OffloadAppClient
 from galileo.apps.offloading.ping import PingAppClient
 from galileo.apps.offloading.wifi import WifiAppClient
+from galileo.controller.cluster import RedisClusterController
 from galileo.routing import ServiceRequest
 from galileo.routing.offloading import OffloadServiceRequest
 from galileo.worker.api import ClientDescription, ClientConfig, ClientInfo, SetWorkloadCommand, StopWorkloadCommand, \
-    WorkloadDoneEvent
+    WorkloadDoneEvent, CloseClientCommand, ScheduleWorkloadCommand, ClientMetrics, StartTracingCommand
 from galileo.worker.context import Context
-from galileo.worker.random import create_sampler
+from galileo.worker.random import create_sampler, distribution_mean
+from galileo.worker.stats import ClientStats
+from galileo.worker.trace import TraceBatcher, ClientTrace
 
 logger = logging.getLogger(__name__)
 
+# policies for requests generated while the maximum number of pending requests is reached
+OVERLOAD_POLICIES = ('block', 'drop', 'fail')
+
 
 def constant(mean):
     while True:
@@ -31,11 +40,43 @@ def constant(mean):
 
 
 def limiter(limit, gen):
-    for _ in range(limit):
-        yield next(gen)
+    return itertools.islice(gen, limit)
+
+
+def scheduled(ticks: List[float], interval: float, start: float = None):
+    """
+    Generates constant interarrivals that follow a schedule of request rates, where ``ticks[i]`` is the rate (requests
+    per second) during the i-th interval after ``start`` (a unix timestamp, defaults to now). Sends that lie in the
+    past when the generator starts are skipped, and the generator ends after the last tick.
+    """
+    last = time.time()
+    if start is None:
+        start = last
+
+    for i, rate in enumerate(ticks):
+        if not rate or rate <= 0:
+            continue
+
+        tick_start = start + i * interval
+        tick_end = tick_start + interval
+        ia = 1 / rate
+
+        j = 0
+        if tick_start <= last:
+            j = int((last - tick_start) / ia) + 1
+
+        t = tick_start + j * ia
+        while t < tick_end:
+            yield t - last
+            last = t
+            j += 1
+            t = tick_start + j * ia
+
 
+def create_interarrival_generator(cmd: SetWorkloadCommand, ctx: Context, stream: int = None):
+    if isinstance(cmd, ScheduleWorkloadCommand):
+        return scheduled(cmd.ticks, cmd.interval, cmd.start)
 
-def create_interarrival_generator(cmd: SetWorkloadCommand, ctx: Context):
     if not cmd.distribution or cmd.distribution == 'constant':
         if cmd.parameters:
             gen = constant(*cmd.parameters)
@@ -43,7 +84,7 @@ def create_interarrival_generator(cmd: SetWorkloadCommand, ctx: Context):
             gen = constant(0)
     else:
         logger.debug(f'generating sampler {cmd.distribution} with client_id {cmd.client_id}')
-        gen = create_sampler(cmd.distribution, cmd.parameters, ctx, client_id=cmd.client_id)
+        gen = create_sampler(cmd.distribution, cmd.parameters, ctx, client_id=cmd.client_id, stream=stream)
 
     if cmd.num:
         return limiter(cmd.num, gen)
@@ -51,18 +92,74 @@ def create_interarrival_generator(cmd: SetWorkloadCommand, ctx: Context):
         return gen
 
 
+def workload_rate(cmd, now: float, received: float = None) -> Optional[float]:
+    """
+    Returns the request rate (requests per second) that the given workload command configures at the given time, i.e.,
+    the inverse of the mean interarrival of a SetWorkloadCommand, or the rate of the current tick of a
+    ScheduleWorkloadCommand. Returns None for closed-loop workloads and distributions whose mean is unknown.
+
+    :param cmd: a SetWorkloadCommand or ScheduleWorkloadCommand, or None if no workload is set
+    :param now: the current unix time
+    :param received: the time the command was received, where schedules without a start time start
+    """
+    if cmd is None:
+        return 0.
+
+    if isinstance(cmd, ScheduleWorkloadCommand):
+        start = cmd.start if cmd.start is not None else received
+        i = int(math.floor((now - start) / cmd.interval))
+        if i < 0 or i >= len(cmd.ticks):
+            return 0.
+        return max(0., cmd.ticks[i] or 0.)
+
+    if cmd.users:
+        return None
+    if cmd.start_at is not None and now < cmd.start_at:
+        return 0.
+
+    if not cmd.distribution or cmd.distribution == 'constant':
+        mean = cmd.parameters[0] if cmd.parameters else 0
+    else:
+        mean = distribution_mean(cmd.distribution, cmd.parameters)
+
+    if mean is None:
+        return None
+    if mean <= 0:
+        return math.inf
+    return 1 / mean
+
+
 class RequestGenerator:
+    """
+    Generates requests according to the interarrival stream of the current workload. Send times are computed as
+    absolute deadlines from the interarrivals, so the time spent creating and dispatching requests does not add up
+    over time. If the generator falls behind its schedule, it sends requests without waiting until it has caught up.
+    ``max_lag`` limits how far (in seconds) the generator tries to catch up, if it falls further behind, the schedule
+    is reset to the current time.
+
+    Each generated ServiceRequest is stamped with the time it was scheduled to be sent (``ServiceRequest.scheduled``),
+    the lag of the last request is available via ``lag``, and the number of generated requests via ``generated``. If
+    ``timing`` is True, the time spent creating the request is stored in ``ServiceRequest.timings``.
+
+    Start times of workloads (``SetWorkloadCommand.start_at``, ``ScheduleWorkloadCommand.start``) refer to the redis
+    server clock, and are translated using the clock offset estimated by the context.
+    """
     DONE = object()
 
-    def __init__(self, factory, ctx=None) -> None:
+    def __init__(self, factory, ctx=None, max_lag: float = None) -> None:
         super().__init__()
         self.factory = factory
         self.ctx = ctx
+        self.max_lag = max_lag
+        self.lag = 0.
+        self.generated = 0
+        self.timing = False
 
         self._closed = False
 
         self._gen = None
         self._gen_lock = threading.Condition()
+        self._deadline = None
 
     def close(self):
         with self._gen_lock:
@@ -71,20 +168,37 @@ class RequestGenerator:
             self._gen_lock.notify_all()
 
     def set_workload(self, cmd: SetWorkloadCommand):
+        deadline = None
+
+        if isinstance(cmd, ScheduleWorkloadCommand):
+            if cmd.start is not None:
+                cmd = cmd._replace(start=cmd.start - self.clock_offset())
+        elif cmd.start_at is not None:
+            # the schedule starts at start_at, translated from the redis server clock to the local monotonic clock
+            deadline = time.monotonic() + (cmd.start_at - self.clock_offset() - time.time())
+
         with self._gen_lock:
             gen = create_interarrival_generator(cmd, self.ctx)
             self._gen = gen
+            self._deadline = deadline
             self._gen_lock.notify_all()
 
+    def clock_offset(self) -> float:
+        if self.ctx is None:
+            return 0.
+
+        try:
+            return self.ctx.clock_offset()
+        except Exception as e:
+            logger.warning('could not estimate clock offset, assuming synchronized clocks: %s', e)
+            return 0.
+
     def pause(self):
         with self._gen_lock:
             self._gen = None
+            self._deadline = None
 
-    def _next_interarrival(self):
-        gen = self._gen
-        if gen is not None:
-            return next(gen)
-
+    def _wait_for_generator(self):
         with self._gen_lock:
             if self._gen is None:  # set_rps may already have been called and notified has_gen
                 logger.debug('generator paused %s', self)
@@ -94,23 +208,72 @@ class RequestGenerator:
 
             logger.debug('generator resumed %s', self)
 
-            return next(self._gen)
+            return self._gen
+
+    def _next_interarrival(self):
+        gen = self._gen
+        if gen is not None:
+            return next(gen)
+
+        return next(self._wait_for_generator())
+
+    def _next_deadline(self, a: float) -> float:
+        """
+        Advances the schedule by the interarrival ``a`` and returns the time (``time.monotonic()``) at which the next
+        request should be sent.
+        """
+        if a <= 0:
+            raise ValueError(f'ia time was {a}, which is invalid and leads to massive crashes!')
+
+        now = time.monotonic()
+        deadline = self._deadline
+
+        if deadline is None or (self.max_lag is not None and now - deadline > self.max_lag):
+            deadline = now
+
+        deadline += a
+        self._deadline = deadline
+        return deadline
+
+    def _create_request(self, deadline: float):
+        self.lag = time.monotonic() - deadline
+        scheduled = time.time() - self.lag
+        self.generated += 1
+
+        request = self.create_request()
+        if isinstance(request, ServiceRequest):
+            request.scheduled = scheduled
+
+        return request
+
+    def create_request(self):
+        if not self.timing:
+            return self.factory()
+
+        start = time.perf_counter_ns()
+        request = self.factory()
+        if isinstance(request, ServiceRequest):
+            request.timings = {'generate': time.perf_counter_ns() - start}
+
+        return request
+
+    def _log_rate(self, a: float):
+        logger.debug(f'Last ia time indicated target request rate of {str(1 / a)}rps (lag {self.lag:.6f}s)')
 
     def run(self):
         logger.debug('running request generator %s', self)
 
-        factory = self.factory
         last_log_time = time.time()
 
         while not self._closed:
             try:
                 a = self._next_interarrival()  # may block until a generator is available
-                if a > 0:
-                    time.sleep(a)
-                else:
-                    raise ValueError(f'ia time was {a}, which is invalid and leads to massive crashes!')
-                if time.time() - last_log_time >= 5 and a != 0:
-                    logger.debug(f'Last ia time indicated target request rate of {str(1/a)}rps')
+                deadline = self._next_deadline(a)
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if time.time() - last_log_time >= 5:
+                    self._log_rate(a)
                     last_log_time = time.time()
             except StopIteration:
                 with self._gen_lock:
@@ -120,7 +283,133 @@ class RequestGenerator:
             except InterruptedError:
                 break
 
-            yield factory()
+            yield self._create_request(deadline)
+
+    async def run_async(self):
+        """
+        Asynchronous variant of ``run`` that waits for send deadlines with ``asyncio.sleep`` instead of blocking the
+        calling thread. While the generator is paused, waiting for a new workload is delegated to the default executor
+        of the running loop.
+        """
+        logger.debug('running async request generator %s', self)
+
+        loop = asyncio.get_running_loop()
+
+        while not self._closed:
+            try:
+                gen = self._gen
+                if gen is None:
+                    gen = await loop.run_in_executor(None, self._wait_for_generator)
+
+                deadline = self._next_deadline(next(gen))
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            except StopIteration:
+                with self._gen_lock:
+                    self._gen = None
+                yield RequestGenerator.DONE
+                continue
+            except InterruptedError:
+                break
+
+            yield self._create_request(deadline)
+
+
+class ClosedLoop:
+    """
+    Runs a closed-loop workload for a client: each of the ``users`` virtual users sends a request, waits for the
+    response, sleeps for a think time sampled from the distribution of the workload, and repeats. The number of
+    concurrent requests is therefore bounded by the number of users. If the workload has a limit (``num``), the users
+    stop after that many requests in total, and the client publishes a WorkloadDoneEvent.
+
+    Each user draws its think times from its own sampler (seeded with the index of the user, see
+    ``random.sampler_seed``), so users do not fire in lockstep. Prerecorded profiles are consumed by reading them, so
+    the users share one stream of think times instead.
+    """
+
+    def __init__(self, client: 'Client', cmd: SetWorkloadCommand) -> None:
+        super().__init__()
+        self.client = client
+        self.cmd = cmd
+
+        self.remaining = cmd.num
+        self._active = cmd.users
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run_user, args=(i,), name='user-%s-%d' % (client.client_id, i), daemon=True)
+            for i in range(cmd.users)
+        ]
+
+        self._shared_think_times = None
+        self._shared_lock = threading.Lock()
+        if cmd.distribution == 'prerecorded':
+            self._shared_think_times = create_interarrival_generator(cmd._replace(num=None), client.ctx)
+
+    def start(self) -> 'ClosedLoop':
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    def _take(self) -> bool:
+        with self._lock:
+            if self.remaining is None:
+                return True
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def _think_times(self, user: int):
+        if self._shared_think_times is None:
+            return create_interarrival_generator(self.cmd._replace(num=None), self.client.ctx, stream=user)
+        return self._next_shared_think_time()
+
+    def _next_shared_think_time(self):
+        while True:
+            with self._shared_lock:
+                try:
+                    think_time = next(self._shared_think_times)
+                except StopIteration:
+                    return
+            yield think_time
+
+    def _run_user(self, user: int):
+        client = self.client
+        think_times = self._think_times(user)
+
+        try:
+            if self.cmd.start_at is not None:
+                delay = self.cmd.start_at - client.request_generator.clock_offset() - time.time()
+                if delay > 0 and self._stopped.wait(delay):
+                    return
+
+            while not self._stopped.is_set() and self._take():
+                client.perform_blocking_request(client.request_generator.create_request())
+
+                think_time = next(think_times)
+                if think_time > 0 and self._stopped.wait(think_time):
+                    return
+        except StopIteration:
+            pass
+        except Exception:
+            logger.exception('error in virtual user of client %s', client.client_id)
+        finally:
+            with self._lock:
+                self._active -= 1
+                last = self._active == 0
+
+            if last and not self._stopped.is_set():
+                client.perform_request(RequestGenerator.DONE)
+
 
 class OffloadAppClientRequestFactory:
 
@@ -162,8 +451,37 @@ class AppClientRequestFactory:
 
 
 class Client:
+    """
+    A client generates requests for a service according to the workload it receives via the event bus, and sends them
+    through its router using the request executor. The router and the executor can be passed to share them between
+    clients (see ``ClientHost``), in which case ``expose_info`` should be False and the owner exposes the client info.
 
-    def __init__(self, ctx: Context, trace_queue: Queue, description: ClientDescription, eventbus=None) -> None:
+    The number of pending (queued in the executor or in-flight) requests can be bounded with ``max_pending``. The
+    ``overload_policy`` determines what happens to requests generated while the limit is reached: ``block`` waits until
+    a pending request completes, ``drop`` discards the request, and ``fail`` records it as a failed request. Dropped and
+    failed requests are counted as rejected.
+
+    If the request generator falls behind its schedule (e.g., because the process stalled), it catches up by sending
+    the missed requests without waiting, but by at most ``ClientConfig.max_lag`` seconds (see ``RequestGenerator``).
+
+    Workloads with ``users`` are run as ``ClosedLoop``, in which virtual users send requests from their own threads
+    instead of the request generator.
+
+    Which parts of a response are stored in its trace is determined by the ``ResponseCapture`` created from
+    ``ClientConfig.capture`` and ``ClientConfig.capture_headers``.
+
+    Traces are sampled with the policy of ``ClientConfig.sampling``, or else the policy of the last
+    ``StartTracingCommand``, before they are sent to the trace queue. Traces that do not fit into the trace queue are
+    appended to a spill file if ``galileo_trace_spill_dir`` is set, otherwise they are dropped. Both are counted in the
+    client info. Dropped traces are also reported with the client metrics, and added to the counter of the worker (see
+    ``take_dropped_traces``).
+
+    If ``galileo_client_timing`` is enabled, the durations of the phases of each request (see ``stats.PHASES``) are
+    aggregated in ``stats.phases``. Otherwise, requests carry no timings and the phases are not measured.
+    """
+
+    def __init__(self, ctx: Context, trace_queue: Queue, description: ClientDescription, eventbus=None, router=None,
+                 request_executor: ThreadPoolExecutor = None, expose_info=True) -> None:
         super().__init__()
         self.ctx = ctx
         self.description = description
@@ -172,8 +490,22 @@ class Client:
         self.traces = trace_queue
         self.eventbus = eventbus or pymq
 
-        self.router = ctx.create_router()
-        self.request_generator = RequestGenerator(self._create_request_factory(), self.ctx)
+        self.router = router or ctx.create_router()
+        max_lag = self.cfg.max_lag if self.cfg.max_lag is not None else float(ctx.getenv('galileo_client_max_lag', '1'))
+        self.request_generator = RequestGenerator(self._create_request_factory(), self.ctx, max_lag=max_lag or None)
+        self.request_generator.timing = ctx.getenv('galileo_client_timing', 'false').lower() in ('true', '1', 'yes')
+
+        self.capture = ctx.create_response_capture(self.cfg.capture, self.cfg.capture_headers)
+        self.sampler = ctx.create_trace_sampler(self.cfg.sampling)
+
+        # used for handling traces that do not fit into the trace queue
+        self.trace_spill = ctx.create_trace_spill(self.client_id)
+        self.dropped_traces = 0
+        self.spilled_traces = 0
+        self._reported_dropped_traces = 0
+        self._report_lock = threading.Lock()
+        if isinstance(self.traces, TraceBatcher) and self.traces.overflow is None:
+            self.traces.overflow = self._on_trace_overflow
 
         # used for generating request ids
         self.client_uuid = util.uuid()[-10:]
@@ -181,72 +513,281 @@ class Client:
 
         # used for statistics
         self.failed_counter = 0
+        self.stats = ClientStats()
+        self._last_sample = (time.time(), 0, 0)  # time, completed, failed
+        self._workload = None  # the active workload command and the time it was received
+
+        # used for bounding the number of pending requests
+        self.max_pending = self.cfg.max_pending or int(ctx.getenv('galileo_client_max_pending', '0'))
+        self.overload_policy = self.cfg.overload_policy or ctx.getenv('galileo_client_overload_policy', 'block')
+        if self.overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError('Unknown overload policy %s' % self.overload_policy)
+        self.queued = 0
+        self.inflight = 0
+        self.rejected = 0
+        self._pending = threading.Condition()
+        self._closed = False
+
+        # set while a closed-loop workload is running
+        self._closed_loop: ClosedLoop = None
 
         # expose methods
         self.eventbus.subscribe(self._on_set_workload_command)
         self.eventbus.subscribe(self._on_stop_workload_command)
-        self.eventbus.expose(self.get_info, 'Client.get_info')
-        self.request_executor = ThreadPoolExecutor(max_workers=50)
+        self.eventbus.subscribe(self._on_schedule_workload_command)
+        self.eventbus.subscribe(self._on_start_tracing_command)
+        self._expose_info = expose_info
+        if expose_info:
+            self.eventbus.expose(self.get_info, 'Client.get_info')
+
+        self._owns_executor = request_executor is None
+        self.request_executor = request_executor or self._create_request_executor()
+
+    def _create_request_executor(self) -> Optional[ThreadPoolExecutor]:
+        return ThreadPoolExecutor(max_workers=50)
 
     def _create_request_id(self, _: ServiceRequest) -> str:
         self.request_counter += 1
         return self.client_uuid + ":" + str(self.request_counter)
 
     def get_info(self) -> ClientInfo:
-        return ClientInfo(self.description, self.request_counter, self.failed_counter)
+        return ClientInfo(self.description, self.request_counter, self.failed_counter,
+                          latency=self.stats.latency.to_dict(),
+                          corrected_latency=self.stats.corrected_latency.to_dict(),
+                          histograms={k: h.to_dict() for k, h in list(self.stats.histograms.items())},
+                          queued=self.queued,
+                          inflight=self.inflight,
+                          rejected=self.rejected,
+                          dropped_traces=self.dropped_traces,
+                          spilled_traces=self.spilled_traces,
+                          phases={k: h.to_dict() for k, h in list(self.stats.phases.items())},
+                          outstanding=self.router.outstanding())
+
+    def sample_metrics(self) -> ClientMetrics:
+        """
+        Returns the metrics of the interval since the last call (or since the client was created), and starts a new
+        interval.
+        """
+        now = time.time()
+        # requests rejected with the 'fail' policy are failed, but were never sent
+        completed = self.stats.latency.count
+        failed = self.failed_counter
+        window = self.stats.swap_window()
+
+        last_time, last_completed, last_failed = self._last_sample
+        self._last_sample = (now, completed, failed)
+        interval = max(now - last_time, 1e-6)
+
+        workload = self._workload
+        if workload is None:
+            target_rate = 0.
+        else:
+            target_rate = workload_rate(workload[0], now, workload[1])
+
+        return ClientMetrics(
+            client_id=self.client_id,
+            worker=self.description.worker,
+            service=self.cfg.service,
+            time=now,
+            interval=interval,
+            rate=(completed - last_completed) / interval,
+            target_rate=target_rate,
+            errors=failed - last_failed,
+            p50=window.percentile(50),
+            p99=window.percentile(99),
+            p999=window.percentile(99.9),
+            queued=self.queued,
+            inflight=self.inflight,
+            dropped_traces=self.take_dropped_traces()
+        )
+
+    def take_dropped_traces(self) -> int:
+        """
+        Returns the number of traces that were dropped since the last call. Both ``sample_metrics`` and
+        ``report_dropped_traces`` use it, so each dropped trace is reported to the worker counter only once.
+        """
+        with self._report_lock:
+            n = self.dropped_traces - self._reported_dropped_traces
+            self._reported_dropped_traces += n
+            return n
 
     def perform_request(self, request):
-        client_id = self.client_id
-        traces = self.traces
-        router = self.router
         if request is RequestGenerator.DONE:
             self.eventbus.publish(WorkloadDoneEvent(self.client_id))
             return
 
-        logger.debug('client %s processing request %s', client_id, request)
-        request.client_id = client_id
-        request.request_id = self._create_request_id(request)
+        self._prepare_request(request)
+        if self.capture.stream:
+            request.kwargs['stream'] = True
 
         try:
             request.sent = -1  # will be updated by router
-            response: requests.Response = router.request(request)
-            host = response.url.split("//")[-1].split("/")[0].split('?')[0]
-
-            t = RequestTrace(
-                request_id=request.request_id,
-                client=client_id,
-                service=request.service,
-                created=request.created,
-                sent=request.sent,
-                done=time.time(),
-                status=response.status_code,
-                server=host,
-                response=response.text.strip(),
-                headers=json.dumps(dict(response.headers))
-            )
+            response: requests.Response = self.router.request(request)
+            try:
+                t = self._create_trace(request, response)
+            finally:
+                if self.capture.stream:
+                    # in case the trace could not be created before the body was read
+                    self.capture.release(response)
         except Exception as e:
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.exception('error while handling request %s', request)
-            else:
-                logger.error('error while handling request %s: %s', request, e)
-
-            t = RequestTrace(
-                request_id=request.request_id,
-                client=client_id,
-                service=request.service,
-                created=request.created,
-                sent=request.sent,
-                done=time.time(),
-                status=-1
-            )
+            t = self._create_error_trace(request, e)
 
+        self._record_trace(request, t)
+
+    def _prepare_request(self, request):
+        logger.debug('client %s processing request %s', self.client_id, request)
+        request.client_id = self.client_id
+        request.request_id = self._create_request_id(request)
+
+    def _create_trace(self, request, response: requests.Response) -> ClientTrace:
+        return self._create_trace_with_body(request, response, self._capture_body(request, response))
+
+    def _create_trace_with_body(self, request, response: requests.Response, body) -> ClientTrace:
+        host = response.url.split("//")[-1].split("/")[0].split('?')[0]
+
+        return ClientTrace(
+            request_id=request.request_id,
+            client=self.client_id,
+            service=request.service,
+            created=request.created,
+            sent=request.sent,
+            done=time.time(),
+            status=response.status_code,
+            server=host,
+            response=body,
+            headers=json.dumps(self.capture.headers(response)),
+            scheduled=request.scheduled
+        )
+
+    def _capture_body(self, request, response: requests.Response):
+        timings = request.timings
+        if timings is None:
+            return self.capture.body(response)
+
+        start = time.perf_counter_ns()
+        try:
+            return self.capture.body(response)
+        finally:
+            timings['read'] = timings.get('read', 0) + time.perf_counter_ns() - start
+
+    def _create_error_trace(self, request, e: Exception) -> ClientTrace:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.exception('error while handling request %s', request)
+        else:
+            logger.error('error while handling request %s: %s', request, e)
+
+        return self._create_failed_trace(request)
+
+    def _create_failed_trace(self, request) -> ClientTrace:
+        return ClientTrace(
+            request_id=request.request_id,
+            client=self.client_id,
+            service=request.service,
+            created=request.created,
+            sent=request.sent,
+            done=time.time(),
+            status=-1,
+            scheduled=request.scheduled
+        )
+
+    def _record_trace(self, request, t: ClientTrace):
         if t.status < 0 or t.status >= 300:
             self.failed_counter += 1
 
+        self.stats.record(request.scheduled, t.sent, t.done, t.service, t.status)
+
+        timings = request.timings
+        if timings is None:
+            for trace in self.sampler.sample(t):
+                self._put_trace(trace)
+            return
+
+        start = time.perf_counter_ns()
+        for trace in self.sampler.sample(t):
+            self._put_trace(trace)
+        timings['trace'] = time.perf_counter_ns() - start
+
+        self.stats.record_phases(timings)
+
+    def _put_trace(self, t: ClientTrace):
         try:
-            traces.put_nowait(t)
+            self.traces.put_nowait(t)
         except Full:
-            pass
+            self._on_trace_overflow([t])
+
+    def _flush_sampler(self, sampler=None):
+        for trace in (sampler or self.sampler).flush():
+            self._put_trace(trace)
+
+    def _on_trace_overflow(self, traces: List[ClientTrace]):
+        if self.trace_spill is not None:
+            try:
+                self.trace_spill.write(traces)
+                self.spilled_traces += len(traces)
+                return
+            except OSError as e:
+                logger.warning('client %s could not spill traces: %s', self.client_id, e)
+
+        self.dropped_traces += len(traces)
+
+    def _admit(self, request) -> bool:
+        """
+        Reserves a slot for the given request among the pending requests, applying the overload policy if the maximum
+        number of pending requests is reached.
+
+        :param request: the request
+        :return: True if the request should be submitted, False if it was rejected
+        """
+        with self._pending:
+            admitted = True
+            if self.max_pending and self.queued + self.inflight >= self.max_pending:
+                if self.overload_policy == 'block':
+                    while not self._closed and self.queued + self.inflight >= self.max_pending:
+                        self._pending.wait()
+                else:
+                    self.rejected += 1
+                    admitted = False
+
+            if admitted:
+                self.queued += 1
+
+        if not admitted:
+            # the trace is recorded without holding the lock that all request threads contend on
+            self._reject(request)
+
+        return admitted
+
+    def _reject(self, request):
+        if self.overload_policy == 'fail':
+            self._prepare_request(request)
+            request.sent = -1
+            self._record_trace(request, self._create_failed_trace(request))
+
+    def _perform_pending_request(self, request):
+        with self._pending:
+            self.queued -= 1
+            self.inflight += 1
+
+        try:
+            self.perform_request(request)
+        finally:
+            with self._pending:
+                self.inflight -= 1
+                self._pending.notify()
+
+    def perform_blocking_request(self, request):
+        """
+        Performs the request in the calling thread (used by virtual users of closed-loop workloads).
+        """
+        with self._pending:
+            self.inflight += 1
+
+        try:
+            self.perform_request(request)
+        finally:
+            with self._pending:
+                self.inflight -= 1
+                self._pending.notify()
 
     def run(self):
         client_id = self.client_id
@@ -259,7 +800,12 @@ class Client:
                 logger.debug("client %s waiting for next request", client_id)
                 try:
                     request = next(rgen)
-                    self.request_executor.submit(self.perform_request, request)
+                    if request is RequestGenerator.DONE:
+                        self.request_executor.submit(self.perform_request, request)
+                        continue
+                    if not self._admit(request):
+                        continue
+                    self.request_executor.submit(self._perform_pending_request, request)
                     dispatches_since_last_log_update += 1
                     if time.time() - last_log_update >= 1:
                         logger.debug(f'queued {dispatches_since_last_log_update} requests last second')
@@ -273,26 +819,72 @@ class Client:
         except:
             logger.exception("error during read loop in client %s", client_id)
         finally:
-            self.request_executor.shutdown(wait=False)
+            if self._owns_executor:
+                self.request_executor.shutdown(wait=False)
 
     def close(self):
         self.request_generator.close()
+        self._stop_closed_loop()
+        with self._pending:
+            self._closed = True
+            self._pending.notify_all()
         self.eventbus.unsubscribe(self._on_set_workload_command)
         self.eventbus.unsubscribe(self._on_stop_workload_command)
-        self.eventbus.unexpose('Client.get_info')
+        self.eventbus.unsubscribe(self._on_schedule_workload_command)
+        self.eventbus.unsubscribe(self._on_start_tracing_command)
+        self._flush_sampler()
+        if self._expose_info:
+            self.eventbus.unexpose('Client.get_info')
 
     def _on_set_workload_command(self, cmd: SetWorkloadCommand):
         if cmd.client_id != self.client_id:
             return
 
-        self.request_generator.set_workload(cmd)
+        self._stop_closed_loop()
+        self._workload = (cmd, time.time())
+
+        if cmd.users:
+            self.request_generator.pause()
+            self._closed_loop = ClosedLoop(self, cmd).start()
+        else:
+            self.request_generator.set_workload(cmd)
 
     def _on_stop_workload_command(self, cmd: StopWorkloadCommand):
         if cmd.client_id != self.client_id:
             return
 
+        self._stop_closed_loop()
+        self._workload = None
         self.request_generator.pause()
 
+    def _on_schedule_workload_command(self, cmd: ScheduleWorkloadCommand):
+        if cmd.client_id != self.client_id:
+            return
+
+        self._stop_closed_loop()
+        self._workload = (cmd, time.time())
+        self.request_generator.set_workload(cmd)
+
+    def _on_start_tracing_command(self, cmd: StartTracingCommand):
+        if self.cfg.sampling:
+            return
+
+        try:
+            sampler = self.ctx.create_trace_sampler(cmd.sampling)
+        except ValueError as e:
+            logger.error('client %s keeps its trace sampler: %s', self.client_id, e)
+            return
+
+        previous = self.sampler
+        self.sampler = sampler
+        self._flush_sampler(previous)
+
+    def _stop_closed_loop(self):
+        closed_loop = self._closed_loop
+        if closed_loop is not None:
+            closed_loop.stop()
+            self._closed_loop = None
+
     def _create_request_factory(self):
         load_wifi_client = False
         load_ping_client = True
@@ -317,6 +909,235 @@ class Client:
         return 'Client{client_id=%s}' % self.client_id
 
 
+class AsyncClient(Client):
+    """
+    A client that runs the request generation and the request I/O on a single asyncio event loop instead of handing
+    each request to a thread pool. The number of concurrently open requests is bounded by ``max_inflight`` (or
+    ``max_pending`` if it is set, as requests are never queued). When the limit is reached, the overload policy is
+    applied. As requests are never queued, ``queued`` is None and the open requests are reported as ``inflight``. The
+    client does not use a request executor, a given ``request_executor`` is ignored. Requires aiohttp (install the
+    ``async`` extra).
+    """
+
+    def __init__(self, ctx: Context, trace_queue: Queue, description: ClientDescription, eventbus=None, router=None,
+                 request_executor: ThreadPoolExecutor = None, expose_info=True, max_inflight: int = None) -> None:
+        super().__init__(ctx, trace_queue, description, eventbus, router, None, expose_info)
+        self.max_inflight = max_inflight or self.max_pending or int(ctx.getenv('galileo_client_max_inflight', '1000'))
+        self.queued = None
+
+    def _create_request_executor(self) -> Optional[ThreadPoolExecutor]:
+        return None
+
+    async def perform_request_async(self, request, session):
+        self._prepare_request(request)
+
+        # the capture policy is applied while the router reads the response
+        captured = []
+
+        async def read(resp) -> bytes:
+            captured.append(await self.capture.body_async(resp))
+            return b''
+
+        try:
+            request.sent = -1  # will be updated by router
+            response: requests.Response = await self.router.request_async(request, session, read)
+            if captured:
+                t = self._create_trace_with_body(request, response, captured[0])
+            else:
+                t = self._create_trace(request, response)
+        except Exception as e:
+            t = self._create_error_trace(request, e)
+
+        self._record_trace(request, t)
+
+    async def _run(self):
+        import aiohttp
+
+        client_id = self.client_id
+        inflight = asyncio.Semaphore(self.max_inflight)
+        tasks = set()
+
+        def on_done(task):
+            tasks.discard(task)
+            self.inflight -= 1
+            inflight.release()
+
+        connector = aiohttp.TCPConnector(limit=self.max_inflight)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            try:
+                async for request in self.request_generator.run_async():
+                    if request is RequestGenerator.DONE:
+                        self.eventbus.publish(WorkloadDoneEvent(client_id))
+                        continue
+
+                    if inflight.locked() and self.overload_policy != 'block':
+                        self.rejected += 1
+                        self._reject(request)
+                        continue
+
+                    await inflight.acquire()
+                    self.inflight += 1
+                    task = asyncio.ensure_future(self.perform_request_async(request, session))
+                    tasks.add(task)
+                    task.add_done_callback(on_done)
+            finally:
+                if tasks:
+                    await asyncio.wait(tasks, timeout=2)
+
+    def run(self):
+        try:
+            asyncio.run(self._run())
+        except KeyboardInterrupt:
+            return
+        except:
+            logger.exception("error during read loop in client %s", self.client_id)
+
+    def __str__(self):
+        return 'AsyncClient{client_id=%s}' % self.client_id
+
+
+def create_client(ctx: Context, trace_queue: Queue, description: ClientDescription, eventbus=None,
+                  **kwargs) -> Client:
+    """
+    Creates a client for the given description. The client engine is taken from ``ClientConfig.engine``, or from the
+    ``galileo_client_engine`` environment variable if the config doesn't specify one. Additional keyword arguments are
+    passed to the client constructor.
+    """
+    engine = description.config.engine or ctx.getenv('galileo_client_engine', 'threads')
+
+    if engine == 'threads':
+        return Client(ctx, trace_queue, description, eventbus=eventbus, **kwargs)
+    elif engine == 'asyncio':
+        return AsyncClient(ctx, trace_queue, description, eventbus=eventbus, **kwargs)
+
+    raise ValueError('Unknown client engine %s' % engine)
+
+
+class ClientHost:
+    """
+    Hosts multiple clients in one process. The clients share the event bus, the router (and with it the connection
+    pool) and the request executor, but each client keeps its own client_id, workload and traces. Each client runs its
+    request generator in its own thread. The host exposes ``Client.get_info``, which returns the infos of all hosted
+    clients, and closes hosted clients when it receives a ``CloseClientCommand``.
+    """
+    clients: Dict[str, Client]
+
+    def __init__(self, ctx: Context, trace_queue: Queue, eventbus=None) -> None:
+        super().__init__()
+        self.ctx = ctx
+        self.traces = trace_queue
+        self.eventbus = eventbus or pymq
+
+        self.router = ctx.create_router()
+        self.request_executor = ThreadPoolExecutor(max_workers=int(ctx.getenv('galileo_client_host_threads', '50')))
+
+        self.clients = dict()
+        self._threads: Dict[str, threading.Thread] = dict()
+        self._lock = threading.Lock()
+
+        if isinstance(self.traces, TraceBatcher):
+            # batches are shared between clients, so overflowing traces are accounted to each client separately
+            self.traces.overflow = self._on_trace_overflow
+
+        self.eventbus.subscribe(self._on_close_client_command)
+        self.eventbus.expose(self.get_info, 'Client.get_info')
+
+    def add(self, description: ClientDescription) -> Client:
+        client = create_client(self.ctx, self.traces, description, eventbus=self.eventbus, router=self.router,
+                               request_executor=self.request_executor, expose_info=False)
+
+        thread = threading.Thread(target=client.run, name='client-%s' % client.client_id)
+
+        with self._lock:
+            if client.client_id in self.clients:
+                client.close()
+                raise ValueError('client %s already hosted' % client.client_id)
+
+            self.clients[client.client_id] = client
+            self._threads[client.client_id] = thread
+
+        logger.info("%s starting", client)
+        thread.start()
+        return client
+
+    def remove(self, client_id: str, timeout=2):
+        with self._lock:
+            client = self.clients.pop(client_id, None)
+            thread = self._threads.pop(client_id, None)
+
+        if client is None:
+            return
+
+        client.close()
+        thread.join(timeout)
+        report_dropped_traces(self.ctx, [client])
+        logger.info("%s exitting", client)
+
+    def get_clients(self) -> List[Client]:
+        with self._lock:
+            return list(self.clients.values())
+
+    def get_info(self) -> List[ClientInfo]:
+        return [c.get_info() for c in self.get_clients()]
+
+    def join(self):
+        while True:
+            with self._lock:
+                threads = list(self._threads.values())
+
+            if not threads:
+                return
+
+            for thread in threads:
+                thread.join()
+
+    def close(self):
+        for client_id in list(self.clients.keys()):
+            self.remove(client_id)
+
+        self.eventbus.unsubscribe(self._on_close_client_command)
+        self.eventbus.unexpose('Client.get_info')
+        self.request_executor.shutdown(wait=False)
+
+    def _on_close_client_command(self, cmd: CloseClientCommand):
+        if cmd.client_id not in self.clients:
+            return
+
+        self.remove(cmd.client_id)
+
+    def _on_trace_overflow(self, traces: List[ClientTrace]):
+        by_client: Dict[str, List[ClientTrace]] = dict()
+        for t in traces:
+            by_client.setdefault(t.client, list()).append(t)
+
+        for client_id, client_traces in by_client.items():
+            client = self.clients.get(client_id)
+            if client is None:
+                logger.warning('dropped %d traces of removed client %s', len(client_traces), client_id)
+                continue
+            client._on_trace_overflow(client_traces)
+
+
+def report_dropped_traces(ctx: Context, clients: List[Client]):
+    """
+    Reports the number of traces the given clients have dropped, and that were not yet reported with their metrics, to
+    the cluster controller, which adds them to the dropped traces counter of the worker.
+    """
+    dropped = dict()
+    for c in clients:
+        n = c.take_dropped_traces()
+        if n:
+            dropped[c.description.worker] = dropped.get(c.description.worker, 0) + n
+
+    if not dropped:
+        return
+
+    ctrl = RedisClusterController(ctx.create_redis())
+    for worker, n in dropped.items():
+        logger.warning('clients of worker %s dropped %d traces', worker, n)
+        ctrl.report_dropped_traces(worker, n)
+
+
 def single_request(cfg: ClientConfig, ctx=None, router_type=None) -> requests.Response:
     ctx = ctx or Context()
 
@@ -339,7 +1160,9 @@ def run(ctx: Context, trace_queue: Queue, description: ClientDescription):
     bus_thread = threading.Thread(target=bus.run)
     bus_thread.start()
 
-    client = Client(ctx, trace_queue, description, eventbus=bus)
+    traces = ctx.create_trace_batcher(trace_queue)
+    client = create_client(ctx, traces, description, eventbus=bus)
+    publisher = ctx.create_metrics_publisher(lambda: [client])
 
     def handler(signum, frame):
         logger.debug('client %s received signal %s', client.client_id, signum)
@@ -351,12 +1174,58 @@ def run(ctx: Context, trace_queue: Queue, description: ClientDescription):
 
     try:
         logger.info("%s starting", client)
+        if publisher:
+            publisher.start()
         client.run()
     except KeyboardInterrupt:
         pass
+    finally:
+        if publisher:
+            publisher.close()
+        if traces is not trace_queue:
+            traces.close()
+        report_dropped_traces(ctx, [client])
 
     logger.debug('shutting down eventbus')
     bus.close()
     bus_thread.join(2)
 
     logger.info("%s exitting", client)
+
+
+def run_host(ctx: Context, trace_queue: Queue, descriptions: List[ClientDescription]):
+    logger.info('starting new client host process for %d clients', len(descriptions))
+
+    bus = RedisEventBus(rds=ctx.create_redis())
+    bus_thread = threading.Thread(target=bus.run)
+    bus_thread.start()
+
+    traces = ctx.create_trace_batcher(trace_queue)
+    host = ClientHost(ctx, traces, eventbus=bus)
+    publisher = ctx.create_metrics_publisher(host.get_clients)
+
+    def handler(signum, frame):
+        logger.debug('client host received signal %s', signum)
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+
+    try:
+        for description in descriptions:
+            host.add(description)
+        if publisher:
+            publisher.start()
+        host.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if publisher:
+            publisher.close()
+        host.close()
+        if traces is not trace_queue:
+            traces.close()
+
+    logger.debug('shutting down eventbus')
+    bus.close()
+    bus_thread.join(2)
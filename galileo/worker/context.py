@@ -4,7 +4,7 @@ import os
 import random
 import time
 from socket import gethostname
-from typing import MutableMapping, List, Dict
+from typing import MutableMapping, List, Dict, Optional
 
 import redis
 import requests
@@ -12,7 +12,7 @@ from examples.basic.podfactory import BasicExamplePodFactory
 from faas.system import Clock, LoggingLogger
 from galileodb import ExperimentDatabase
 from galileodb.factory import create_experiment_database_from_env
-from galileodb.trace import TraceLogger, TraceWriter, FileTraceWriter, RedisTopicTraceWriter, DatabaseTraceWriter
+from galileodb.trace import TraceLogger, TraceWriter, RedisTopicTraceWriter, DatabaseTraceWriter
 from galileofaas.connections import RedisClient
 from galileofaas.context.daemon import GalileoFaasContextDaemon
 from galileofaas.context.model import GalileoFaasContext
@@ -28,14 +28,21 @@ from galileofaas.system.metrics import GalileoLogger
 from kubernetes import config, client
 from telemc import TelemetryController
 
+from galileo import util
 from galileo.apps.loader import AppClientLoader, AppClientDirectoryLoader, AppRepositoryFallbackLoader
 from galileo.apps.repository import RepositoryClient
 from galileo.controller.ping import PingController
 from galileo.controller.wifi import WifiController
 from galileo.routing import Router, ServiceRequest, ServiceRouter, HostRouter, StaticRouter, RedisRoutingTable, \
-    ReadOnlyListeningRedisRoutingTable, WeightedRoundRobinBalancer
+    ReadOnlyListeningRedisRoutingTable, RevalidatingRoutingTable, WeightedRoundRobinBalancer, WeightedRandomBalancer, \
+    LeastOutstandingRequestsBalancer, Balancer, RoutingTable, create_session
 from galileo.routing.offloading.ai import AIOffloadRouter
 from galileo.routing.offloading.simulated import SimulatedOffloadRouter
+from galileo.worker.capture import ResponseCapture
+from galileo.worker.metrics import MetricsPublisher
+from galileo.worker.sampling import TraceSampler, create_trace_sampler
+from galileo.worker.trace import TraceBatcher, TraceQueueReader, TraceRing, TraceSpillFile, ClientTraceFileWriter, \
+    RequestTraceWriter
 
 logger = logging.getLogger(__name__)
 
@@ -64,11 +71,76 @@ class Context:
                 - galileo_expdb_mysql_user
                 - galileo_expdb_mysql_password
                 - galileo_expdb_mysql_db
+        - galileo_trace_batch_size (100): number of traces a client process sends to the trace logger at once (1
+          disables batching)
+        - galileo_trace_batch_interval (100): maximum time in milliseconds a trace is held back for batching
+        - galileo_trace_channel: queue|shm (queue): how client processes send traces to the trace logger. 'shm' uses
+          one shared-memory ring buffer per client process instead of the pickling multiprocessing queue
+        - galileo_trace_ring_capacity (4096): number of 512 byte slots of a shared-memory ring buffer, a trace occupies
+          as many slots as its fields need
+        - galileo_trace_sampling: all|ratio:N|reservoir:K[:W]|tail:T[:N] (all), which traces clients store (see
+          ``sampling.create_trace_sampler``), can be overwritten via start_tracing or per client via
+          ClientConfig.sampling
+        - galileo_trace_spill_dir: if set, clients append the traces that do not fit into the trace queue to files in
+          this directory, which the trace logger ingests when the queue is idle. Otherwise, these traces are dropped
+          (and counted)
 
     - Request router
         - galileo_router_type: SymmetryServiceRouter|SymmetryHostRouter|StaticRouter|DebugRouter
             - StaticRouter:
                 - galileo_router_static_host (http://localhost)
+        - galileo_router_table_ttl (0): seconds for which SymmetryServiceRouter and SymmetryHostRouter use their copy
+          of a routing record without checking its version in redis
+        - galileo_router_balancer: wrr|random|lor|wlor (wrr), how routers that use the routing table pick hosts: smooth
+          weighted round-robin, weighted random, or the host with fewer outstanding requests (absolute, or relative to
+          its weight) of two randomly sampled hosts
+        - HTTP connection pool (shared by all threads of a client):
+            - galileo_router_pool_connections (10): number of per-host connection pools to keep
+            - galileo_router_pool_maxsize (50): maximum number of keep-alive connections per host
+            - galileo_router_pool_block (false): block when all connections to a host are in use
+
+    - Worker:
+        - galileo_worker_clients_per_process (1): number of clients that share one process, event bus, router and
+          request executor
+        - galileo_client_host_threads (50): size of the request executor shared by the clients of a process
+
+    - Client engine:
+        - galileo_client_engine: threads|asyncio (threads), can be overwritten per client via ClientConfig.engine,
+          asyncio requires aiohttp (pip install edgerun-galileo[async])
+        - galileo_client_max_pending (0 = unbounded): maximum number of queued and in-flight requests per client, can be
+          overwritten per client via ClientConfig.max_pending
+        - galileo_client_overload_policy: block|drop|fail (block), what to do with requests generated while the
+          maximum number of pending requests is reached, can be overwritten via ClientConfig.overload_policy
+        - galileo_client_max_lag (1): seconds the request generator may fall behind its schedule before the schedule
+          is reset to the current time instead of catching up with the missed requests (0 = unbounded), can be
+          overwritten per client via ClientConfig.max_lag
+        - asyncio (requires aiohttp):
+            - galileo_client_max_inflight (1000)
+        - galileo_client_timing (false): measure the durations of the phases of each request (request generation,
+          routing, connect, server, body read, and trace handling) with ``time.perf_counter_ns``, see show.phases(). The
+          asyncio engine measures connect as part of server
+        - galileo_client_capture: full|none|head:N|hash|length (full), which part of the response body is stored in
+          the trace, can be overwritten per client via ClientConfig.capture
+        - galileo_client_capture_headers: comma-separated list of response headers stored in the trace (default all),
+          can be overwritten per client via ClientConfig.capture_headers
+
+    - Live metrics:
+        - galileo_metrics_interval (1): seconds between the metrics records each client process publishes to the
+          'galileo:metrics' redis stream (0 disables publishing)
+        - galileo_metrics_stream_maxlen (10000): approximate maximum number of records kept in the stream
+
+    - Interarrival sampling:
+        - galileo_sampler: random|numpy (random), numpy draws samples in blocks, which is faster at high request rates,
+          and requires numpy (pip install edgerun-galileo[numpy])
+        - galileo_sampler_seed: if set, the numpy sampler of each client is seeded with this value and the client id
+        - galileo_prerecorded_page_size (10000): number of values fetched at once from a prerecorded profile
+        - galileo_profile_dir: directory of prerecorded profiles stored as <client_id>.npy files, which are preferred
+          over profiles stored in redis
+
+    - Clock synchronization:
+        - galileo_clock_sync (true): estimate the offset of the local clock to the redis server clock, which is used
+          to translate start times of workloads
+        - galileo_clock_sync_interval (60): seconds after which the clock offset is estimated again
 
     - Client app loader:
         - galileo_apps_dir ('./apps')
@@ -79,6 +151,24 @@ class Context:
         super().__init__()
         self.env = env
         self.daemon: GalileoFaasContextDaemon = None
+        self._clock_offset = None
+        self._clock_offset_time = 0.
+
+    def clock_offset(self) -> float:
+        """
+        Returns the estimated offset of the redis server clock to the local clock (see ``util.estimate_clock_offset``),
+        or 0 if clock synchronization is disabled. The estimate is cached for galileo_clock_sync_interval seconds.
+        """
+        if self.env.get('galileo_clock_sync', 'true').lower() not in ('true', '1', 'yes'):
+            return 0.
+
+        interval = float(self.env.get('galileo_clock_sync_interval', '60'))
+        if self._clock_offset is None or time.time() - self._clock_offset_time > interval:
+            self._clock_offset = util.estimate_clock_offset(self.create_redis())
+            self._clock_offset_time = time.time()
+            logger.debug('estimated clock offset to redis server: %.6fs', self._clock_offset)
+
+        return self._clock_offset
 
     def getenv(self, *args, **kwargs):
         return self.env.get(*args, **kwargs)
@@ -111,83 +201,156 @@ class Context:
         if not trace_logging:
             return None
         elif trace_logging == 'file':
-            return FileTraceWriter(self.worker_name)
+            return ClientTraceFileWriter(self.worker_name)
         elif trace_logging == 'redis':
-            return RedisTopicTraceWriter(self.create_redis())
+            return RequestTraceWriter(RedisTopicTraceWriter(self.create_redis()))
         elif trace_logging == 'sql':
-            return DatabaseTraceWriter(self.create_exp_db())
+            return RequestTraceWriter(DatabaseTraceWriter(self.create_exp_db()))
         else:
             raise ValueError('Unknown trace logging type %s' % trace_logging)
 
     def create_trace_logger(self, trace_queue, start=True) -> TraceLogger:
         writer = self.create_trace_writer()
-        return TraceLogger(trace_queue, writer, start)
+        spill_dir = self.env.get('galileo_trace_spill_dir')
+        return TraceLogger(TraceQueueReader(trace_queue, spill_dir), writer, start)
+
+    def create_trace_ring(self) -> TraceRing:
+        capacity = int(self.env.get('galileo_trace_ring_capacity', '4096'))
+        return TraceRing.create(capacity)
+
+    def create_response_capture(self, policy: str = None, headers: List[str] = None) -> ResponseCapture:
+        policy = policy or self.env.get('galileo_client_capture', 'full')
+
+        if headers is None:
+            whitelist = self.env.get('galileo_client_capture_headers')
+            if whitelist:
+                headers = [h.strip() for h in whitelist.split(',') if h.strip()]
+
+        return ResponseCapture(policy, headers)
+
+    def create_trace_sampler(self, policy: str = None) -> TraceSampler:
+        return create_trace_sampler(policy or self.env.get('galileo_trace_sampling'))
+
+    def create_trace_spill(self, name: str) -> Optional[TraceSpillFile]:
+        spill_dir = self.env.get('galileo_trace_spill_dir')
+        if not spill_dir:
+            return None
+
+        os.makedirs(spill_dir, exist_ok=True)
+        return TraceSpillFile(spill_dir, name)
+
+    def create_trace_batcher(self, trace_queue):
+        """
+        Wraps the given trace queue into a started TraceBatcher, or returns the queue itself if batching is disabled
+        (galileo_trace_batch_size <= 1) or the queue is a TraceRing.
+        """
+        if isinstance(trace_queue, TraceRing):
+            return trace_queue
+
+        size = int(self.env.get('galileo_trace_batch_size', '100'))
+        if size <= 1:
+            return trace_queue
+
+        interval = int(self.env.get('galileo_trace_batch_interval', '100')) / 1000
+        return TraceBatcher(trace_queue, size, interval).start()
+
+    def create_metrics_publisher(self, clients) -> Optional[MetricsPublisher]:
+        interval = float(self.getenv('galileo_metrics_interval', '1'))
+        if interval <= 0:
+            return None
+
+        maxlen = int(self.getenv('galileo_metrics_stream_maxlen', '10000'))
+        return MetricsPublisher(self.create_redis(), clients, interval=interval, maxlen=maxlen)
+
+    def create_revalidating_routing_table(self) -> RevalidatingRoutingTable:
+        ttl = float(self.env.get('galileo_router_table_ttl', '0'))
+        return RevalidatingRoutingTable(RedisRoutingTable(self.create_redis()), ttl)
+
+    def create_balancer(self, rtable: RoutingTable) -> Balancer:
+        balancer_type = self.env.get('galileo_router_balancer', 'wrr')
+
+        if balancer_type == 'wrr':
+            return WeightedRoundRobinBalancer(rtable)
+        elif balancer_type == 'random':
+            return WeightedRandomBalancer(rtable)
+        elif balancer_type == 'lor':
+            return LeastOutstandingRequestsBalancer(rtable)
+        elif balancer_type == 'wlor':
+            return LeastOutstandingRequestsBalancer(rtable, weighted=True)
+
+        raise ValueError('Unknown balancer type %s' % balancer_type)
 
     def create_router(self, router_type=None):
         if router_type is None:
             router_type = self.env.get('galileo_router_type', 'CachingSymmetryHostRouter')
-        router_type = 'CachingSymmetryHostRouter'
-        print("Router_type:", router_type)
+        logger.debug('creating router %s', router_type)
         if router_type == 'SymmetryServiceRouter':
-            rtable = RedisRoutingTable(self.create_redis())
-            balancer = WeightedRoundRobinBalancer(rtable)
-            return ServiceRouter(balancer)
+            rtable = self.create_revalidating_routing_table()
+            balancer = self.create_balancer(rtable)
+            return ServiceRouter(balancer, session=self.create_http_session())
         elif router_type == 'CachingSymmetryServiceRouter':
             rtable = ReadOnlyListeningRedisRoutingTable(self.create_redis())
             rtable.start()
             atexit.register(rtable.stop, timeout=2)
-            balancer = WeightedRoundRobinBalancer(rtable)
-            return ServiceRouter(balancer)
+            balancer = self.create_balancer(rtable)
+            return ServiceRouter(balancer, session=self.create_http_session())
         elif router_type == 'SymmetryHostRouter':
-            rtable = RedisRoutingTable(self.create_redis())
-            balancer = WeightedRoundRobinBalancer(rtable)
-            return HostRouter(balancer)
+            rtable = self.create_revalidating_routing_table()
+            balancer = self.create_balancer(rtable)
+            return HostRouter(balancer, session=self.create_http_session())
         elif router_type == 'CachingSymmetryHostRouter':
             rtable = ReadOnlyListeningRedisRoutingTable(self.create_redis())
             rtable.start()
             atexit.register(rtable.stop, timeout=2)
-            balancer = WeightedRoundRobinBalancer(rtable)
-            return HostRouter(balancer)
+            balancer = self.create_balancer(rtable)
+            return HostRouter(balancer, session=self.create_http_session())
         elif router_type == 'StaticRouter':
             host = self.env.get('galileo_router_static_host', 'http://localhost')
-            return StaticRouter(host)
+            return StaticRouter(host, session=self.create_http_session())
         elif router_type == 'DebugRouter':
             return DebugRouter()
         elif router_type == 'AIOffloadRouter':
             rtable = ReadOnlyListeningRedisRoutingTable(self.create_redis())
             rtable.start()
             atexit.register(rtable.stop, timeout=2)
-            balancer = WeightedRoundRobinBalancer(rtable)
-            host_router = HostRouter(balancer)
+            balancer = self.create_balancer(rtable)
+            host_router = HostRouter(balancer, session=self.create_http_session())
             return AIOffloadRouter(host_router)
         elif router_type == 'SimulatedOffloadRouter':
             rtable = ReadOnlyListeningRedisRoutingTable(self.create_redis())
             rtable.start()
             atexit.register(rtable.stop, timeout=2)
-            balancer = WeightedRoundRobinBalancer(rtable)
-            host_router = HostRouter(balancer)
+            balancer = self.create_balancer(rtable)
+            host_router = HostRouter(balancer, session=self.create_http_session())
             return SimulatedOffloadRouter(host_router)
 
         raise ValueError('Unknown router type %s' % router_type)
 
+    def create_http_session(self) -> requests.Session:
+        return create_session(
+            pool_connections=int(self.env.get('galileo_router_pool_connections', '10')),
+            pool_maxsize=int(self.env.get('galileo_router_pool_maxsize', '50')),
+            pool_block=self.env.get('galileo_router_pool_block', 'false').lower() == 'true'
+        )
+
     def create_app_loader(self) -> AppClientLoader:
         loader = AppClientDirectoryLoader(self.env.get('galileo_apps_dir', os.path.abspath('./apps')))
         repo = RepositoryClient(self.env.get('galileo_apps_repository', 'http://localhost:5001'))
 
         return AppRepositoryFallbackLoader(loader, repo)
 
-    def create_redis(self) -> redis.Redis:
+    def create_redis(self, decode_responses=True) -> redis.Redis:
         host = self.env.get('galileo_redis_host', 'localhost')
 
         if host.startswith('file://'):
             import redislite
             f_path = host.replace('file://', '')
-            return redislite.Redis(dbfilename=f_path, decode_responses=True)
+            return redislite.Redis(dbfilename=f_path, decode_responses=decode_responses)
 
         params = {
             'host': host,
             'port': int(self.env.get('galileo_redis_port', '6379')),
-            'decode_responses': True,
+            'decode_responses': decode_responses,
         }
 
         if self.env.get('galileo_redis_password', None) is not None:
@@ -301,5 +464,8 @@ class DebugRouter(Router):
 
         return response
 
+    async def request_async(self, req: ServiceRequest, session, read=None) -> requests.Response:
+        return self.request(req)
+
     def _get_url(self, req: ServiceRequest) -> str:
         return 'http://debughost' + req.path
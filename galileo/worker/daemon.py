@@ -11,6 +11,7 @@ from galileo.controller.cluster import RedisClusterController
 from galileo.worker.api import RegisterWorkerEvent, UnregisterWorkerEvent, RegisterWorkerCommand, \
     StartTracingCommand, PauseTracingCommand, CreateClientCommand, CloseClientCommand, ClientDescription, ClientConfig
 from galileo.worker.context import Context
+from galileo.worker.trace import TraceRing, AttachTraceRing, DetachTraceRing
 
 logger = logging.getLogger(__name__)
 
@@ -25,10 +26,27 @@ class ClientProcess(multiprocessing.Process):
         self.daemon = True
 
 
+class ClientHostProcess(multiprocessing.Process):
+    """
+    A process that hosts multiple clients, which share the event bus, router and request executor (see
+    ``client.ClientHost``).
+    """
+    client_descriptions: List[ClientDescription]
+
+    def __init__(self, ctx, trace_queue, client_descriptions: List[ClientDescription]) -> None:
+        super().__init__(name='process-%s' % client_descriptions[0].client_id,
+                         target=client.run_host, args=(ctx, trace_queue, client_descriptions))
+        self.client_descriptions = client_descriptions
+        self.daemon = True
+
+
 class WorkerDaemon:
     """
     The worker daemon manages multiple ClientGroup processes on a host machine and exposes several interaction points
-    via pymq.
+    via pymq. By default, each client runs in its own process. If ``galileo_worker_clients_per_process`` is greater than
+    one, clients that are created together are packed into ``ClientHostProcess`` instances that host up to that many
+    clients each. If ``galileo_trace_channel`` is 'shm', each client process writes its traces into its own
+    ``TraceRing`` that is drained by the trace logger.
     """
     name: str
 
@@ -40,18 +58,41 @@ class WorkerDaemon:
         self.name = self.ctx.worker_name
         self.ctrl = ctrl or RedisClusterController(self.rds, self.eventbus)
 
+        self.trace_channel = self.ctx.getenv('galileo_trace_channel', 'queue')
+        if self.trace_channel not in ('queue', 'shm'):
+            raise ValueError('Unknown trace channel %s' % self.trace_channel)
+
         self.trace_queue = self._create_trace_queue()
         self._trace_logger = self.ctx.create_trace_logger(self.trace_queue)
 
         self._lock = threading.RLock()
-        self._clients: Dict[str, ClientProcess] = dict()
+        self._clients: Dict[str, multiprocessing.Process] = dict()
+        self._trace_rings: Dict[multiprocessing.Process, TraceRing] = dict()
         self._closed = threading.Event()
 
         self._client_id_counter = 0
+        self.clients_per_process = int(self.ctx.getenv('galileo_worker_clients_per_process', '1'))
 
     def _create_trace_queue(self):
         return multiprocessing.Queue()
 
+    def _create_trace_channel(self):
+        if self.trace_channel != 'shm':
+            return self.trace_queue
+
+        ring = self.ctx.create_trace_ring()
+        self.trace_queue.put(AttachTraceRing(ring.name))
+        return ring
+
+    def _release_trace_channel(self, process):
+        ring = self._trace_rings.pop(process, None)
+        if ring is None:
+            return
+
+        # the trace logger drains the remaining traces and unlinks the ring
+        self.trace_queue.put(DetachTraceRing(ring.name))
+        ring.close()
+
     def run(self):
         self.eventbus.subscribe(self._on_create_client_command)
         self.eventbus.subscribe(self._on_close_client_command)
@@ -94,8 +135,16 @@ class WorkerDaemon:
             logger.info('creating client %s', description)
             result.append(description)
 
-        for d in result:
-            self._clients[d.client_id] = self._start_client_process(d)
+        if self.clients_per_process > 1:
+            n = self.clients_per_process
+            for i in range(0, len(result), n):
+                batch = result[i:i + n]
+                process = self._start_client_host_process(batch)
+                for d in batch:
+                    self._clients[d.client_id] = process
+        else:
+            for d in result:
+                self._clients[d.client_id] = self._start_client_process(d)
 
         for d in result:
             self.ctrl.register_client(d)
@@ -108,11 +157,29 @@ class WorkerDaemon:
         if cid in self._clients:
             raise ValueError('process for client %s already registered' % cid)
 
-        process = ClientProcess(self.ctx, self.trace_queue, description)
+        channel = self._create_trace_channel()
+        process = ClientProcess(self.ctx, channel, description)
+        if channel is not self.trace_queue:
+            self._trace_rings[process] = channel
+
         logger.info('starting client process %s', process)
         process.start()
         return process
 
+    def _start_client_host_process(self, descriptions: List[ClientDescription]) -> ClientHostProcess:
+        for description in descriptions:
+            if description.client_id in self._clients:
+                raise ValueError('process for client %s already registered' % description.client_id)
+
+        channel = self._create_trace_channel()
+        process = ClientHostProcess(self.ctx, channel, descriptions)
+        if channel is not self.trace_queue:
+            self._trace_rings[process] = channel
+
+        logger.info('starting client host process %s for %d clients', process, len(descriptions))
+        process.start()
+        return process
+
     def close(self):
         with self._lock:
             logger.debug('closing clients')
@@ -142,15 +209,25 @@ class WorkerDaemon:
 
         self.ctrl.unregister_client(client_id)
 
+        if process in self._clients.values():
+            # the process still hosts other clients, it closes the client itself on the CloseClientCommand
+            logger.debug('process %s still hosts other clients', process.name)
+            return
+
         process.terminate()
         logger.debug('waiting on client process %s', process.name)
         process.join(3)
         logger.debug('terminated %s', process.name)
+        self._release_trace_channel(process)
 
     def _register_worker(self):
         logger.info('registering name %s', self.name)
-        items = self.ctx.items()
-        self.ctrl.register_worker(self.name, items)
+        self.ctrl.register_worker(self.name, self.ctx.items())
+        try:
+            # clients inherit the estimate of the worker when they are started
+            self.ctrl.set_clock_offset(self.name, self.ctx.clock_offset())
+        except Exception as e:
+            logger.warning('could not estimate clock offset: %s', e)
         self.eventbus.publish(RegisterWorkerEvent(self.name))
 
     def _unregister_worker(self):
@@ -0,0 +1,137 @@
+import logging
+import threading
+from typing import Callable, Iterable, List, Tuple
+
+from galileo.controller.cluster import RedisClusterController
+from galileo.worker.api import ClientMetrics
+
+logger = logging.getLogger(__name__)
+
+METRICS_STREAM = 'galileo:metrics'
+
+
+def to_fields(metrics: ClientMetrics) -> dict:
+    return {k: '' if v is None else v for k, v in metrics._asdict().items()}
+
+
+def from_fields(fields: dict) -> ClientMetrics:
+    fields = {_str(k): _str(v) for k, v in fields.items()}
+
+    def number(key, cast=float):
+        value = fields.get(key)
+        if value is None or value == '':
+            return None
+        return cast(float(value))
+
+    return ClientMetrics(
+        client_id=fields['client_id'],
+        worker=fields['worker'],
+        service=fields['service'],
+        time=number('time'),
+        interval=number('interval'),
+        rate=number('rate'),
+        target_rate=number('target_rate'),
+        errors=number('errors', int),
+        p50=number('p50'),
+        p99=number('p99'),
+        p999=number('p999'),
+        queued=number('queued', int),
+        inflight=number('inflight', int),
+        dropped_traces=number('dropped_traces', int) or 0,
+    )
+
+
+def _str(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def last_metrics_id(rds, stream: str = METRICS_STREAM) -> str:
+    """
+    Returns the id of the last record in the metrics stream, or '0-0' if the stream is empty.
+    """
+    entries = rds.xrevrange(stream, count=1)
+    if not entries:
+        return '0-0'
+    return _str(entries[0][0])
+
+
+def read_metrics(rds, last_id: str, block: int = None,
+                 stream: str = METRICS_STREAM) -> Tuple[str, List[ClientMetrics]]:
+    """
+    Reads the records of the metrics stream that were added after ``last_id``.
+
+    :param rds: the redis client
+    :param last_id: the id of the last record that was read (see ``last_metrics_id``)
+    :param block: milliseconds to wait for new records, by default the call returns immediately
+    :param stream: the stream key
+    :return: a tuple of the id of the last record read (to pass to the next call), and the records
+    """
+    response = rds.xread({stream: last_id}, block=block)
+
+    result = list()
+    for _, entries in response or []:
+        for entry_id, fields in entries:
+            last_id = _str(entry_id)
+            result.append(from_fields(fields))
+
+    return last_id, result
+
+
+class MetricsPublisher:
+    """
+    Publishes one ``ClientMetrics`` record per client every ``interval`` seconds to a redis stream, which is capped at
+    approximately ``maxlen`` records. ``clients`` is a callable that returns the clients to publish the metrics of,
+    which are sampled with ``Client.sample_metrics``. The traces the clients dropped in the interval are also added to
+    the dropped traces counter of their worker (see ``RedisClusterController.report_dropped_traces``).
+    """
+
+    def __init__(self, rds, clients: Callable[[], Iterable], interval: float = 1., stream: str = METRICS_STREAM,
+                 maxlen: int = 10000) -> None:
+        super().__init__()
+        self.rds = rds
+        self.clients = clients
+        self.interval = interval
+        self.stream = stream
+        self.maxlen = maxlen
+        self.ctrl = RedisClusterController(rds)
+
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-publisher', daemon=True)
+
+    def start(self) -> 'MetricsPublisher':
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._closed.set()
+        if self._thread.is_alive():
+            self._thread.join(2)
+
+    def publish(self) -> List[ClientMetrics]:
+        records = [client.sample_metrics() for client in self.clients()]
+        if not records:
+            return records
+
+        pipe = self.rds.pipeline(transaction=False)
+        for record in records:
+            pipe.xadd(self.stream, to_fields(record), maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+        dropped = dict()
+        for record in records:
+            if record.dropped_traces:
+                dropped[record.worker] = dropped.get(record.worker, 0) + record.dropped_traces
+        for worker, n in dropped.items():
+            self.ctrl.report_dropped_traces(worker, n)
+
+        return records
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.warning('could not publish client metrics: %s', e)
+
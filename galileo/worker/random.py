@@ -1,6 +1,10 @@
+import math
+import os
 import random
-import time
 import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
 from galileo.worker.context import Context
 
 logger = logging.getLogger(__name__)
@@ -29,31 +33,297 @@ distributions = {
 }
 
 
-def pre_recorded_profile(ctx: Context, list_key: str):
+# maps the distributions (and their parameter conventions) of the python random module to numpy generator methods,
+# each function takes a numpy.random.Generator, the distribution parameters, and the number of samples to draw
+numpy_distributions = {
+    'constant': lambda rng, size, x: [x] * size,
+    'uniform': lambda rng, size, a, b: rng.uniform(a, b, size),
+    'triangular': lambda rng, size, low=0.0, high=1.0, mode=None: rng.triangular(
+        low, (low + high) / 2 if mode is None else mode, high, size),
+    'normalvariate': lambda rng, size, mu=0.0, sigma=1.0: rng.normal(mu, sigma, size),
+    'lognormvariate': lambda rng, size, mu, sigma: rng.lognormal(mu, sigma, size),
+    'expovariate': lambda rng, size, lambd=1.0: rng.exponential(1 / lambd, size),
+    'vonmisesvariate': lambda rng, size, mu, kappa: rng.vonmises(mu, kappa, size) % (2 * math.pi),
+    'gammavariate': lambda rng, size, alpha, beta: rng.gamma(alpha, beta, size),
+    'gauss': lambda rng, size, mu=0.0, sigma=1.0: rng.normal(mu, sigma, size),
+    'betavariate': lambda rng, size, alpha, beta: rng.beta(alpha, beta, size),
+    'paretovariate': lambda rng, size, alpha: rng.pareto(alpha, size) + 1,
+    'weibullvariate': lambda rng, size, alpha, beta: alpha * rng.weibull(beta, size),
+}
+
+
+# the means of the distributions as functions of their parameters (same conventions as ``distributions``)
+distribution_means = {
+    'constant': lambda x: x,
+    'uniform': lambda a, b: (a + b) / 2,
+    'triangular': lambda low=0.0, high=1.0, mode=None: (low + high + ((low + high) / 2 if mode is None else mode)) / 3,
+    'normalvariate': lambda mu=0.0, sigma=1.0: mu,
+    'lognormvariate': lambda mu, sigma: math.exp(mu + sigma ** 2 / 2),
+    'expovariate': lambda lambd=1.0: 1 / lambd,
+    'gammavariate': lambda alpha, beta: alpha * beta,
+    'gauss': lambda mu=0.0, sigma=1.0: mu,
+    'betavariate': lambda alpha, beta: alpha / (alpha + beta),
+    'paretovariate': lambda alpha: alpha / (alpha - 1) if alpha > 1 else math.inf,
+    'weibullvariate': lambda alpha, beta: alpha * math.gamma(1 + 1 / beta),
+}
+
+
+def distribution_mean(distribution: str, args: tuple):
+    """
+    Returns the mean of the given distribution, or None if it is not known (e.g., for 'prerecorded' profiles or
+    invalid parameters).
+    """
+    fn = distribution_means.get(distribution or 'constant')
+    if fn is None:
+        return None
+
+    try:
+        return fn(*(args or []))
+    except (TypeError, ValueError, ZeroDivisionError, OverflowError):
+        return None
+
+
+def numpy_sampler(distribution: str, args: tuple, seed=None, block_size=4096):
+    """
+    Creates a generator for the given distribution that draws samples with numpy in blocks of ``block_size``, and hands
+    them out one by one. Distribution names and parameters are the same as for ``create_sampler``.
+
+    :param distribution: the distribution, e.g., 'lognormvariate'
+    :param args: the arguments, e.g., (0.5, 1)
+    :param seed: the seed of the numpy random generator (an int or a sequence of ints)
+    :param block_size: the number of samples drawn at once
+    :return: a generator
+    """
+    import numpy as np
+
+    if distribution not in numpy_distributions:
+        raise InvalidDistributionException('unknown distribution ' + distribution)
+
+    fn = numpy_distributions[distribution]
+    rng = np.random.default_rng(seed)
+    args = args or []
+
+    try:
+        fn(rng, 1, *args)
+    except (TypeError, ValueError) as e:
+        raise InvalidDistributionException('invalid distribution parameters: ' + str(e))
+
+    while True:
+        block = fn(rng, block_size, *args)
+        yield from (block.tolist() if hasattr(block, 'tolist') else block)
+
+
+def sampler_seed(ctx: Context, client_id: str = None, stream: int = None):
+    """
+    Returns the seed for the sampler of the given client, which combines galileo_sampler_seed with a checksum of the
+    client id, so clients draw different but reproducible samples. If a client draws from several independent samplers
+    (e.g., one per virtual user), ``stream`` is the index of the sampler and added to the seed. Returns None if
+    galileo_sampler_seed is not set.
+    """
+    if ctx is None:
+        return None
+
+    seed = ctx.getenv('galileo_sampler_seed')
+    if seed is None:
+        return None
+
+    seed = [int(seed), zlib.crc32((client_id or '').encode())]
+    if stream is not None:
+        seed.append(stream)
+    return seed
+
+
+def pre_recorded_profile(ctx: Context, list_key: str, page_size: int = None):
+    """
+    Streams the interarrivals stored in the given redis list, starting from the tail of the list (the list was
+    originally treated like a stack). The list is read in pages of ``page_size`` values (galileo_prerecorded_page_size),
+    and the next page is fetched in the background while the current one is consumed. The list is deleted once the
+    generator is exhausted or closed.
+
+    :param ctx: context object
+    :param list_key: the key of the redis list
+    :param page_size: the number of values to fetch at once
+    :return: a generator
+    """
     rds = ctx.create_redis()
-    start = time.time()
-    values = rds.lrange(list_key, 0, rds.llen(list_key))
-    rds.delete(list_key)
-    # Values need to be reversed since we originally treated this like a stack
-    values.reverse()
-    end = time.time()
-    logger.debug(f'loaded {len(values)} ia values in {end - start}s from redis')
-    for value in values:
-        yield float(value)
+    page_size = page_size or int(ctx.getenv('galileo_prerecorded_page_size', '10000'))
+    prefetcher = ThreadPoolExecutor(max_workers=1)
+
+    def fetch(end):
+        values = rds.lrange(list_key, max(0, end - page_size + 1), end)
+        values.reverse()
+        return values
+
+    try:
+        end = rds.llen(list_key) - 1
+        logger.debug(f'streaming {end + 1} ia values from redis in pages of {page_size}')
+
+        page = prefetcher.submit(fetch, end) if end >= 0 else None
+        while page is not None:
+            values = page.result()
+            end -= page_size
+            page = prefetcher.submit(fetch, end) if end >= 0 else None
+
+            for value in values:
+                yield float(value)
+    finally:
+        prefetcher.shutdown(wait=True)
+        rds.delete(list_key)
+
     logger.info('done')
 
-def create_sampler(distribution: str, args: tuple, ctx: Context, client_id=None):
+
+PACKED_DTYPES = ('float64', 'float32')
+
+
+def packed_profile_keys(key: str):
+    """
+    Returns the redis keys of a packed profile: a hash holding the metadata (dtype, count, chunks), and a list of
+    chunks, each holding packed values in machine byte order.
+    """
+    return key + ':meta', key + ':chunks'
+
+
+def upload_profile(rds, key: str, values, dtype='float64', chunk_size=65536):
+    """
+    Stores the given interarrivals as a packed profile under the given key (usually a client id), replacing any
+    existing profile, in a single pipelined call. The values are consumed in the given order.
+
+    :param rds: the redis client
+    :param key: the profile key
+    :param values: a numpy array or a sequence of floats
+    :param dtype: float64 or float32
+    :param chunk_size: the number of values per chunk
+    :return: the number of uploaded values
+    """
+    import numpy as np
+
+    if dtype not in PACKED_DTYPES:
+        raise ValueError('Unsupported profile dtype %s' % dtype)
+
+    values = np.ascontiguousarray(values, dtype=dtype)
+    chunks = [values[i:i + chunk_size].tobytes() for i in range(0, len(values), chunk_size)]
+    meta_key, chunks_key = packed_profile_keys(key)
+
+    pipe = rds.pipeline()
+    pipe.delete(meta_key, chunks_key, key)
+    if chunks:
+        pipe.rpush(chunks_key, *chunks)
+    pipe.hset(meta_key, mapping={'dtype': dtype, 'count': len(values), 'chunks': len(chunks)})
+    pipe.execute()
+
+    return len(values)
+
+
+def packed_profile(rds, key: str):
+    """
+    Streams the interarrivals of a packed profile stored by ``upload_profile``. Chunks are read as zero-copy numpy
+    views, and the next chunk is fetched in the background while the current one is consumed. The profile is deleted
+    once the generator is exhausted or closed.
+
+    :param rds: a redis client that does not decode responses
+    :param key: the profile key
+    :return: a generator
+    """
+    import numpy as np
+
+    meta_key, chunks_key = packed_profile_keys(key)
+    prefetcher = ThreadPoolExecutor(max_workers=1)
+
+    try:
+        meta = {k.decode(): v.decode() for k, v in rds.hgetall(meta_key).items()}
+        dtype = np.dtype(meta['dtype'])
+        n = int(meta['chunks'])
+        logger.debug(f'streaming {meta["count"]} ia values from redis in {n} packed chunks')
+
+        chunk = prefetcher.submit(rds.lindex, chunks_key, 0) if n else None
+        for i in range(n):
+            data = chunk.result()
+            chunk = prefetcher.submit(rds.lindex, chunks_key, i + 1) if i + 1 < n else None
+
+            yield from np.frombuffer(data, dtype=dtype).tolist()
+    finally:
+        prefetcher.shutdown(wait=True)
+        rds.delete(meta_key, chunks_key)
+
+    logger.info('done')
+
+
+def save_profile_file(profile_dir: str, key: str, values, dtype='float64') -> str:
+    """
+    Stores the given interarrivals as ``<profile_dir>/<key>.npy`` file, which ``mapped_profile`` reads.
+
+    :return: the path of the file
+    """
+    import numpy as np
+
+    if dtype not in PACKED_DTYPES:
+        raise ValueError('Unsupported profile dtype %s' % dtype)
+
+    path = profile_file(profile_dir, key)
+    np.save(path, np.ascontiguousarray(values, dtype=dtype))
+    return path
+
+
+def profile_file(profile_dir: str, key: str) -> str:
+    return os.path.join(profile_dir, key.replace('/', '_') + '.npy')
+
+
+def mapped_profile(path: str, block_size=4096):
+    """
+    Streams the interarrivals of a .npy file, which is memory-mapped rather than read into memory.
+
+    :param path: the path of the .npy file
+    :param block_size: the number of values converted at once
+    :return: a generator
+    """
+    import numpy as np
+
+    values = np.load(path, mmap_mode='r')
+    logger.debug(f'streaming {len(values)} ia values from {path}')
+
+    for i in range(0, len(values), block_size):
+        yield from values[i:i + block_size].tolist()
+
+    logger.info('done')
+
+
+def prerecorded_profile(ctx: Context, key: str):
+    """
+    Streams the prerecorded interarrivals of the given key (the client id). A .npy file in galileo_profile_dir takes
+    precedence over a packed profile in redis (see ``upload_profile``), which takes precedence over a redis list of
+    decimal strings.
+    """
+    profile_dir = ctx.getenv('galileo_profile_dir')
+    if profile_dir:
+        path = profile_file(profile_dir, key)
+        if os.path.exists(path):
+            yield from mapped_profile(path)
+            return
+
+    rds = ctx.create_redis(decode_responses=False)
+    if rds.exists(packed_profile_keys(key)[0]):
+        yield from packed_profile(rds, key)
+    else:
+        yield from pre_recorded_profile(ctx, key)
+
+
+def create_sampler(distribution: str, args: tuple, ctx: Context, client_id=None, stream: int = None):
     """
     Creates a generator for the given distribution with the given arguments.
 
     :param distribution: the distribution, e.g., 'lognormvariate'
     :param args: the arguments, e.g., (0.5, 1)
     :param ctx: context object
+    :param client_id: the client, which seeds the sampler and is the key of prerecorded profiles
+    :param stream: the index of the sampler if a client uses several independent ones (see ``sampler_seed``)
     :return: a generator
     """
     print("create sampler")
     if distribution == 'prerecorded':
-        yield from pre_recorded_profile(ctx, client_id)
+        yield from prerecorded_profile(ctx, client_id)
+    elif ctx is not None and ctx.getenv('galileo_sampler', 'random') == 'numpy':
+        yield from numpy_sampler(distribution, args, sampler_seed(ctx, client_id, stream))
     else:
         if distribution not in distributions:
             raise InvalidDistributionException('unknown distribution ' + distribution)
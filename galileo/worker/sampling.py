@@ -0,0 +1,192 @@
+import itertools
+import json
+import random
+import threading
+from typing import List, Sequence
+
+from galileo.worker.trace import ClientTrace, SAMPLE_WEIGHT_HEADER
+
+
+def with_weight(trace: ClientTrace, weight: float) -> ClientTrace:
+    """
+    Returns a copy of the trace with the given sampling weight. Traces with weight 1 are returned unchanged.
+    """
+    if weight == 1:
+        return trace
+
+    return trace._replace(weight=weight)
+
+
+def sample_weight(trace) -> float:
+    """
+    Returns the sampling weight of a ``ClientTrace``, i.e., the number of requests it represents. For a galileodb
+    ``RequestTrace``, the weight is read from its headers (see ``ClientTrace.request_trace``).
+    """
+    if isinstance(trace, ClientTrace):
+        return 1. if trace.weight is None else float(trace.weight)
+
+    if not trace.headers:
+        return 1.
+
+    return float(json.loads(trace.headers).get(SAMPLE_WEIGHT_HEADER, 1))
+
+
+def is_failed(trace: ClientTrace) -> bool:
+    return trace.status < 0 or trace.status >= 300
+
+
+class TraceSampler:
+    """
+    Decides which traces of a client are stored. ``sample`` is called with every trace and returns the traces to
+    store, which may include traces held back from earlier calls. Stored traces carry their sampling weight in the
+    ``weight`` field, so request counts can be reconstructed by summing the weights. Samplers are called concurrently
+    from the request threads of a client.
+    """
+
+    def sample(self, trace: ClientTrace) -> Sequence[ClientTrace]:
+        raise NotImplementedError
+
+    def flush(self) -> List[ClientTrace]:
+        """
+        Returns the traces that are held back by the sampler.
+        """
+        return []
+
+
+class KeepAllSampler(TraceSampler):
+
+    def sample(self, trace: ClientTrace) -> Sequence[ClientTrace]:
+        return trace,
+
+
+class RatioSampler(TraceSampler):
+    """
+    Keeps every n-th trace.
+    """
+
+    def __init__(self, n: int) -> None:
+        super().__init__()
+        if n < 1:
+            raise ValueError('sampling ratio must be at least 1, was %s' % n)
+        self.n = n
+        self._counter = itertools.count()
+
+    def sample(self, trace: ClientTrace) -> Sequence[ClientTrace]:
+        if next(self._counter) % self.n:
+            return ()
+        return with_weight(trace, self.n),
+
+
+class ReservoirSampler(TraceSampler):
+    """
+    Keeps a uniform random sample of at most ``size`` traces per time window of ``window`` seconds (by the time the
+    requests completed). The traces of a window are released with the first trace of the next window (or by
+    ``flush``), each weighted with the number of traces seen in the window divided by the number of traces kept.
+    """
+
+    def __init__(self, size: int, window: float = 1., rnd: random.Random = None) -> None:
+        super().__init__()
+        if size < 1:
+            raise ValueError('reservoir size must be at least 1, was %s' % size)
+        if window <= 0:
+            raise ValueError('reservoir window must be positive, was %s' % window)
+
+        self.size = size
+        self.window = window
+        self.rnd = rnd or random.Random()
+
+        self._lock = threading.Lock()
+        self._window_end = None
+        self._seen = 0
+        self._reservoir: List[ClientTrace] = list()
+
+    def sample(self, trace: ClientTrace) -> Sequence[ClientTrace]:
+        with self._lock:
+            result = ()
+
+            if self._window_end is None:
+                self._window_end = trace.done + self.window
+            elif trace.done >= self._window_end:
+                result = self._release()
+                self._window_end += self.window * (int((trace.done - self._window_end) / self.window) + 1)
+
+            self._seen += 1
+            if len(self._reservoir) < self.size:
+                self._reservoir.append(trace)
+            else:
+                i = self.rnd.randrange(self._seen)
+                if i < self.size:
+                    self._reservoir[i] = trace
+
+            return result
+
+    def flush(self) -> List[ClientTrace]:
+        with self._lock:
+            return self._release()
+
+    def _release(self) -> List[ClientTrace]:
+        if not self._reservoir:
+            return []
+
+        weight = self._seen / len(self._reservoir)
+        result = [with_weight(t, weight) for t in self._reservoir]
+
+        self._seen = 0
+        self._reservoir = list()
+        return result
+
+
+class TailSampler(TraceSampler):
+    """
+    Always keeps failed traces and traces of requests that took longer than ``threshold`` seconds. Of the remaining
+    traces, every n-th is kept (none if ``n`` is 0).
+    """
+
+    def __init__(self, threshold: float, n: int = 0) -> None:
+        super().__init__()
+        if n < 0:
+            raise ValueError('sampling ratio must not be negative, was %s' % n)
+
+        self.threshold = threshold
+        self.n = n
+        self._counter = itertools.count()
+
+    def sample(self, trace: ClientTrace) -> Sequence[ClientTrace]:
+        if is_failed(trace) or trace.sent <= 0 or trace.done - trace.sent > self.threshold:
+            return trace,
+
+        if self.n and next(self._counter) % self.n == 0:
+            return with_weight(trace, self.n),
+
+        return ()
+
+
+def create_trace_sampler(policy: str = None) -> TraceSampler:
+    """
+    Creates a TraceSampler from a sampling policy, which is one of
+
+    - ``all``: keep all traces (the default)
+    - ``ratio:N``: keep every N-th trace
+    - ``reservoir:K[:W]``: keep a random sample of K traces per window of W seconds (default 1)
+    - ``tail:T[:N]``: keep failed traces and traces of requests that took longer than T seconds, and every N-th of the
+      remaining traces (default none)
+
+    :param policy: the policy
+    :return: a new sampler
+    """
+    policy = policy or 'all'
+    name, *args = policy.split(':')
+
+    try:
+        if name == 'all' and not args:
+            return KeepAllSampler()
+        if name == 'ratio' and len(args) == 1:
+            return RatioSampler(int(args[0]))
+        if name == 'reservoir' and 1 <= len(args) <= 2:
+            return ReservoirSampler(int(args[0]), *[float(a) for a in args[1:]])
+        if name == 'tail' and 1 <= len(args) <= 2:
+            return TailSampler(float(args[0]), *[int(a) for a in args[1:]])
+    except ValueError as e:
+        raise ValueError('Invalid sampling policy %s: %s' % (policy, e))
+
+    raise ValueError('Unknown sampling policy %s' % policy)
@@ -0,0 +1,221 @@
+import math
+import threading
+from typing import Dict, Iterable
+
+
+def percentile(values, p: float) -> float:
+    """
+    Returns the p-th percentile (0 < p <= 100) of the given sorted values using the nearest-rank method.
+
+    :param values: a sorted sequence of values
+    :param p: the percentile
+    :return: the value at the given percentile, or NaN if there are no values
+    """
+    if not values:
+        return math.nan
+
+    rank = int(math.ceil(p / 100 * len(values)))
+    return values[max(0, rank - 1)]
+
+
+class LatencyHistogram:
+    """
+    A log-bucketed latency histogram in the spirit of HdrHistogram. Bucket boundaries grow geometrically by ``growth``
+    starting from ``lowest`` (in seconds), so any recorded value is reported with a relative error of at most
+    ``growth - 1``. Recording is O(1) and thread-safe, and memory is bounded by the number of buckets between
+    ``lowest`` and ``highest`` (values outside are clamped). Histograms with the same parameters can be merged, and are
+    transported as dicts (see ``to_dict`` and ``from_dict``).
+    """
+
+    def __init__(self, growth=1.01, lowest=1e-6, highest=3600.) -> None:
+        super().__init__()
+        self.growth = growth
+        self.lowest = lowest
+        self.highest = highest
+
+        self._inv_log_growth = 1 / math.log(growth)
+        self._max_index = self._index(highest)
+
+        self.counts: Dict[int, int] = dict()
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+        self._lock = threading.Lock()
+
+    def _index(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) * self._inv_log_growth) + 1
+
+    def _value(self, index: int) -> float:
+        """
+        Returns the value that represents the bucket with the given index (the geometric center of the bucket).
+        """
+        if index == 0:
+            return self.lowest
+        return self.lowest * self.growth ** (index - 0.5)
+
+    def record(self, value: float):
+        index = min(self._index(value), self._max_index)
+
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """
+        Adds the counts of the other histogram to this one.
+
+        :param other: a histogram with the same parameters
+        :return: this histogram
+        """
+        if (other.growth, other.lowest, other.highest) != (self.growth, self.lowest, self.highest):
+            raise ValueError('cannot merge histograms with different parameters')
+
+        with self._lock:
+            for index, n in other.counts.items():
+                self.counts[index] = self.counts.get(index, 0) + n
+            self.count += other.count
+            self.sum += other.sum
+            self.max = max(self.max, other.max)
+
+        return self
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the p-th percentile (0 < p <= 100) using the nearest-rank method, or NaN if the histogram is empty.
+        """
+        with self._lock:
+            if not self.count:
+                return math.nan
+
+            rank = max(1, int(math.ceil(p / 100 * self.count)))
+            seen = 0
+            for index in sorted(self.counts.keys()):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(self._value(index), self.max)
+
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        if not self.count:
+            return {'count': 0}
+
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max,
+        }
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'growth': self.growth,
+                'lowest': self.lowest,
+                'highest': self.highest,
+                'count': self.count,
+                'sum': self.sum,
+                'max': self.max,
+                # keys are strings so the dict survives JSON serialization
+                'counts': {str(k): v for k, v in self.counts.items()},
+            }
+
+    @staticmethod
+    def from_dict(doc: dict) -> 'LatencyHistogram':
+        histogram = LatencyHistogram(doc['growth'], doc['lowest'], doc['highest'])
+        histogram.counts = {int(k): v for k, v in doc['counts'].items()}
+        histogram.count = doc['count']
+        histogram.sum = doc['sum']
+        histogram.max = doc['max']
+        return histogram
+
+    @staticmethod
+    def merged(docs: Iterable[dict]) -> 'LatencyHistogram':
+        """
+        Merges the given histogram dicts into a new histogram.
+        """
+        result = None
+        for doc in docs:
+            if not doc:
+                continue
+            histogram = LatencyHistogram.from_dict(doc)
+            result = histogram if result is None else result.merge(histogram)
+
+        return result or LatencyHistogram()
+
+
+# phases of the request hot path, in the order they occur (see ``ClientStats.phases``)
+PHASES = ('generate', 'route', 'connect', 'server', 'read', 'trace')
+
+
+def status_class(status: int) -> str:
+    """
+    Returns the class of the given HTTP status code, e.g., '2xx', or 'error' for requests that failed without a
+    response.
+    """
+    if status is None or status < 100:
+        return 'error'
+    return '%dxx' % (status // 100)
+
+
+class ClientStats:
+    """
+    Latency statistics of a client. ``latency`` is measured from the time a request was actually sent, whereas
+    ``corrected_latency`` is measured from the time the request was scheduled to be sent by the request generator. The
+    latter includes the time requests spend waiting behind a backlog, and therefore does not hide the effects of
+    coordinated omission when the client or the target is overloaded.
+
+    ``histograms`` additionally keeps the latency per service and status class, keyed by '<service> <status class>'.
+    ``window`` holds the latency of the requests completed since the last call of ``swap_window``, and ``phases`` the
+    durations of the phases of timed requests (see ``PHASES``).
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.latency = LatencyHistogram()
+        self.corrected_latency = LatencyHistogram()
+        self.histograms: Dict[str, LatencyHistogram] = dict()
+        self.window = LatencyHistogram()
+        self.phases: Dict[str, LatencyHistogram] = dict()
+
+    def record(self, scheduled: float, sent: float, done: float, service: str = None, status: int = None):
+        self.corrected_latency.record(done - scheduled)
+
+        if sent <= 0:
+            return
+
+        self.latency.record(done - sent)
+        self.window.record(done - sent)
+
+        if service is not None:
+            key = '%s %s' % (service, status_class(status))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms.setdefault(key, LatencyHistogram())
+            histogram.record(done - sent)
+
+    def record_phases(self, timings: Dict[str, int]):
+        """
+        Records the durations (in nanoseconds) of the phases of a request.
+        """
+        for phase, ns in timings.items():
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases.setdefault(phase, LatencyHistogram())
+            histogram.record(ns / 1e9)
+
+    def swap_window(self) -> LatencyHistogram:
+        """
+        Starts a new window and returns the histogram of the previous one.
+        """
+        window = self.window
+        self.window = LatencyHistogram()
+        return window
@@ -0,0 +1,559 @@
+import csv
+import fcntl
+import glob
+import json
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from queue import Full, Empty
+from typing import NamedTuple, Dict, List, Optional
+
+from galileodb.model import RequestTrace
+from galileodb.trace import TraceWriter, FileTraceWriter, POISON
+
+logger = logging.getLogger(__name__)
+
+
+# header added to the headers of weighted traces when they are stored as galileodb RequestTrace, which has no column
+# for the weight
+SAMPLE_WEIGHT_HEADER = 'X-Galileo-Sample-Weight'
+
+
+class ClientTrace(NamedTuple):
+    """
+    The trace of a request as sent by clients through the trace channels: the fields of a galileodb ``RequestTrace``,
+    followed by the time the request was scheduled to be sent by the request generator (see ``ServiceRequest``), from
+    which the latency corrected for coordinated omission can be calculated, and the sampling weight, i.e., the number
+    of requests the trace represents (see ``sampling.TraceSampler``).
+    """
+    request_id: str
+    client: str
+    service: str
+    created: float
+    sent: float
+    done: float
+    status: int = -1
+    server: str = None
+    exp_id: str = None
+    headers: str = None
+    response: str = None
+    scheduled: float = None
+    weight: float = 1.
+
+    def request_trace(self) -> RequestTrace:
+        """
+        Returns the trace as galileodb ``RequestTrace``, without the scheduled time. The weight of weighted traces is
+        added to the headers as ``SAMPLE_WEIGHT_HEADER``.
+        """
+        trace = RequestTrace(*self[:len(RequestTrace._fields)])
+        if self.weight is None or self.weight == 1:
+            return trace
+
+        headers = json.loads(self.headers) if self.headers else dict()
+        headers[SAMPLE_WEIGHT_HEADER] = self.weight
+        return trace._replace(headers=json.dumps(headers))
+
+
+def to_request_trace(trace) -> RequestTrace:
+    if isinstance(trace, ClientTrace):
+        return trace.request_trace()
+    return trace
+
+
+class RequestTraceWriter(TraceWriter):
+    """
+    Wraps a galileodb TraceWriter, which stores ``RequestTrace`` tuples, and passes it the traces converted with
+    ``ClientTrace.request_trace``. The galileodb trace schema has no columns for the scheduled time and the weight.
+    """
+
+    def __init__(self, writer: TraceWriter) -> None:
+        super().__init__()
+        self.writer = writer
+
+    def write(self, traces: List[ClientTrace]):
+        self.writer.write([to_request_trace(t) for t in traces])
+
+
+class ClientTraceFileWriter(FileTraceWriter):
+    """
+    A FileTraceWriter that writes all fields of ``ClientTrace``, i.e., the csv file has additional ``scheduled`` and
+    ``weight`` columns.
+    """
+
+    def init_file(self):
+        if os.path.exists(self.file_path):
+            return
+
+        with open(self.file_path, 'w') as fd:
+            csv.writer(fd).writerow(ClientTrace._fields)
+
+    def write(self, buffer: List[ClientTrace]):
+        with open(self.file_path, 'a') as fd:
+            writer = csv.writer(fd)
+            for row in buffer:
+                if not isinstance(row, ClientTrace):
+                    row = ClientTrace(*row)
+                writer.writerow(row)
+
+
+class AttachTraceRing(NamedTuple):
+    """
+    Sent through the trace queue to make the reader attach to a TraceRing.
+    """
+    name: str
+
+
+class DetachTraceRing(NamedTuple):
+    """
+    Sent through the trace queue to make the reader drain, detach from, and unlink a TraceRing.
+    """
+    name: str
+
+
+class TraceBatcher:
+    """
+    Collects traces on the client side and sends them to the trace queue in batches (lists of traces), either when
+    ``size`` traces have been collected, or every ``interval`` seconds. It provides the ``put_nowait`` method of the
+    trace queue, so it can be used in place of the queue. Use ``TraceQueueReader`` on the receiving side to unpack the
+    batches.
+
+    Batches that do not fit into the queue are passed to the ``overflow`` callable if it is set, otherwise
+    ``put_nowait`` raises ``queue.Full`` and the batch is lost.
+    """
+
+    def __init__(self, queue, size=100, interval=0.1, overflow=None) -> None:
+        super().__init__()
+        self.queue = queue
+        self.size = size
+        self.interval = interval
+        self.overflow = overflow
+
+        self._buffer = list()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='trace-batcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put_nowait(self, trace):
+        with self._lock:
+            self._buffer.append(trace)
+
+            if len(self._buffer) < self.size:
+                return
+
+            batch = self._buffer
+            self._buffer = list()
+
+        self._send(batch)
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return
+
+            batch = self._buffer
+            self._buffer = list()
+
+        self._send(batch)
+
+    def _send(self, batch):
+        try:
+            self.queue.put_nowait(batch)
+        except Full:
+            if self.overflow is None:
+                raise
+            self.overflow(batch)
+
+    def close(self):
+        self._closed.set()
+        if self._thread.is_alive():
+            self._thread.join(2)
+        self._flush_silently()
+
+    def _flush_silently(self):
+        try:
+            self.flush()
+        except Full:
+            logger.warning('trace queue full, dropped a batch of traces')
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            self._flush_silently()
+
+
+class TraceRing:
+    """
+    A ring buffer of binary trace records in shared memory, written by the client process and read by the trace logger
+    without pickling. Writing a record and publishing it by advancing ``head``, and reading records and advancing
+    ``tail``, are done while holding an exclusive ``flock`` on a lock file that belongs to the ring. Shared memory
+    gives no guarantees of atomicity or ordering of the stores (e.g., on ARM), the lock makes them visible as a whole.
+    Writer threads of one process are additionally serialized with a process-local lock, as ``flock`` does not exclude
+    threads that share the file descriptor.
+
+    The ring consists of ``capacity`` slots of ``slot_size`` bytes. A record is a fixed header (see ``record``)
+    followed by the length-prefixed string fields, and occupies as many consecutive slots as it needs, so fields are
+    never truncated. Records that do not fit into the free slots (or into the whole ring) raise ``queue.Full``, like a
+    full queue, so the client spills or drops (and counts) them.
+
+    The ring is created by the worker daemon, and announced to the reader with an ``AttachTraceRing`` message on the
+    trace queue. The reader unlinks the shared memory and the lock file once it receives the ``DetachTraceRing``
+    message, or when it is closed. A TraceRing can be passed to other processes, which attach to the same shared memory
+    and lock file.
+    """
+    # created, sent, done, scheduled (NaN for None), weight, status, and the byte lengths of request_id, client,
+    # service, server, headers, response (-1 for None), followed by the bytes of the strings
+    record = struct.Struct('<dddddiiiiiii')
+    slot_size = 512
+
+    _counter = struct.Struct('<Q')
+    _head_offset = 0
+    _tail_offset = 64  # head and tail on different cache lines
+    _capacity_offset = 128
+    _data_offset = 192
+
+    def __init__(self, shm: SharedMemory) -> None:
+        super().__init__()
+        self.shm = shm
+        self.capacity = self._read(self._capacity_offset)
+        self._size = self.capacity * self.slot_size
+        self._lock = threading.Lock()
+        self._lock_fd = os.open(self.lock_path(shm.name), os.O_RDWR | os.O_CREAT, 0o600)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @staticmethod
+    def lock_path(name: str) -> str:
+        return os.path.join(tempfile.gettempdir(), name.lstrip('/') + '.lock')
+
+    @classmethod
+    def create(cls, capacity=4096) -> 'TraceRing':
+        shm = SharedMemory(create=True, size=cls._data_offset + capacity * cls.slot_size)
+        shm.buf[:cls._data_offset] = bytes(cls._data_offset)
+        cls._counter.pack_into(shm.buf, cls._capacity_offset, capacity)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name: str) -> 'TraceRing':
+        return cls(SharedMemory(name=name))
+
+    def __len__(self):
+        """
+        Returns the number of slots in use.
+        """
+        with self._locked():
+            return self._read(self._head_offset) - self._read(self._tail_offset)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def put_nowait(self, trace: ClientTrace):
+        scheduled = getattr(trace, 'scheduled', None)
+        weight = getattr(trace, 'weight', None)
+        fields = [_encode(trace.request_id), _encode(trace.client), _encode(trace.service), _encode(trace.server),
+                  _encode(trace.headers), _encode(trace.response)]
+
+        data = b''.join([
+            self.record.pack(trace.created, trace.sent, trace.done, math.nan if scheduled is None else scheduled,
+                             1. if weight is None else weight, trace.status,
+                             *[-1 if f is None else len(f) for f in fields]),
+            *[f for f in fields if f]
+        ])
+        slots = -(-len(data) // self.slot_size)
+
+        with self._locked():
+            head = self._read(self._head_offset)
+            if head + slots - self._read(self._tail_offset) > self.capacity:
+                raise Full
+
+            self._write(head, data)
+            self._counter.pack_into(self.shm.buf, self._head_offset, head + slots)
+
+    def drain(self, limit: int = None) -> List[ClientTrace]:
+        """
+        Reads and removes the available trace records from the ring.
+
+        :param limit: the maximum number of traces to read
+        :return: a list of traces
+        """
+        # copy the records while holding the lock, and decode them afterwards
+        records = list()
+        with self._locked():
+            i = self._read(self._tail_offset)
+            head = self._read(self._head_offset)
+
+            while i < head and (limit is None or len(records) < limit):
+                lengths = self.record.unpack(self._read_bytes(i, self.record.size))[-6:]
+                data = self._read_bytes(i, self.record.size + sum(n for n in lengths if n > 0))
+                records.append(data)
+                i += -(-len(data) // self.slot_size)
+
+            self._counter.pack_into(self.shm.buf, self._tail_offset, i)
+
+        traces = list()
+        for data in records:
+            created, sent, done, scheduled, weight, status, *lengths = self.record.unpack_from(data)
+
+            pos = self.record.size
+            fields = list()
+            for n in lengths:
+                if n < 0:
+                    fields.append(None)
+                    continue
+                fields.append(data[pos:pos + n].decode('utf-8'))
+                pos += n
+
+            request_id, client, service, server, headers, response = fields
+            traces.append(ClientTrace(
+                request_id=request_id,
+                client=client,
+                service=service,
+                created=created,
+                sent=sent,
+                done=done,
+                status=status,
+                server=server,
+                headers=headers,
+                response=response,
+                scheduled=None if math.isnan(scheduled) else scheduled,
+                weight=weight
+            ))
+
+        return traces
+
+    def close(self):
+        self.shm.close()
+        os.close(self._lock_fd)
+
+    def unlink(self):
+        self.shm.unlink()
+        try:
+            os.unlink(self.lock_path(self.name))
+        except FileNotFoundError:
+            pass
+
+    def _read(self, offset) -> int:
+        return self._counter.unpack_from(self.shm.buf, offset)[0]
+
+    def _write(self, slot: int, data: bytes):
+        start = (slot % self.capacity) * self.slot_size
+        n = min(len(data), self._size - start)
+
+        buf = self.shm.buf
+        buf[self._data_offset + start:self._data_offset + start + n] = data[:n]
+        if n < len(data):
+            # the record wraps around the end of the ring
+            buf[self._data_offset:self._data_offset + len(data) - n] = data[n:]
+
+    def _read_bytes(self, slot: int, length: int) -> bytes:
+        start = (slot % self.capacity) * self.slot_size
+        n = min(length, self._size - start)
+
+        buf = self.shm.buf
+        data = bytes(buf[self._data_offset + start:self._data_offset + start + n])
+        if n < length:
+            data += bytes(buf[self._data_offset:self._data_offset + length - n])
+        return data
+
+    def __getstate__(self):
+        return self.name
+
+    def __setstate__(self, name):
+        self.__init__(SharedMemory(name=name))
+
+
+def _encode(value) -> Optional[bytes]:
+    if value is None:
+        return None
+    return str(value).encode('utf-8')
+
+
+class TraceSpillFile:
+    """
+    An append-only file of traces (one JSON array per line) that clients write the traces to that do not fit into the
+    trace queue. Spill files are ingested and removed by ``ingest_spill_files``. Writers and the reader synchronize via
+    ``flock``, and writers re-open the file if it was removed in the meantime.
+    """
+    suffix = '.spill'
+
+    def __init__(self, spill_dir: str, name: str) -> None:
+        super().__init__()
+        self.path = os.path.join(spill_dir, name.replace('/', '_') + self.suffix)
+        self._lock = threading.Lock()
+
+    def write(self, traces: List[ClientTrace]):
+        data = ''.join(json.dumps(list(t)) + '\n' for t in traces)
+
+        with self._lock:
+            while True:
+                with open(self.path, 'a') as fd:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    try:
+                        if not _is_same_file(fd, self.path):
+                            continue  # removed by the reader after we opened it
+
+                        fd.write(data)
+                        fd.flush()
+                        return
+                    finally:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _is_same_file(fd, path) -> bool:
+    try:
+        return os.fstat(fd.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def ingest_spill_files(spill_dir: str) -> List[ClientTrace]:
+    """
+    Reads and removes all ``TraceSpillFile`` files in the given directory.
+
+    :param spill_dir: the spill directory
+    :return: the traces read from the files
+    """
+    traces = list()
+
+    for path in glob.glob(os.path.join(spill_dir, '*' + TraceSpillFile.suffix)):
+        try:
+            fd = open(path, 'r')
+        except FileNotFoundError:
+            continue
+
+        with fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                for line in fd:
+                    if line.strip():
+                        traces.append(ClientTrace(*json.loads(line)))
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    if traces:
+        logger.info('ingested %d spilled traces from %s', len(traces), spill_dir)
+
+    return traces
+
+
+class TraceQueueReader:
+    """
+    Wraps the trace queue read by the TraceLogger. It transparently unpacks batches sent by a ``TraceBatcher``, and
+    reads the traces of the ``TraceRing`` buffers announced via ``AttachTraceRing``, so the TraceLogger receives single
+    traces. While rings are attached, the queue is polled every ``poll_interval`` seconds.
+
+    If a ``spill_dir`` is given, the traces in ``TraceSpillFile`` files in that directory are ingested whenever the
+    queue is idle, but at least every ``spill_interval`` seconds.
+
+    When the reader receives the ``POISON`` that stops the TraceLogger, it closes all rings that are still attached
+    (see ``close``) and returns their traces before the ``POISON``.
+    """
+    poll_interval = 0.01
+    spill_interval = 1.
+
+    def __init__(self, queue, spill_dir: str = None) -> None:
+        super().__init__()
+        self.queue = queue
+        self.spill_dir = spill_dir
+        self._pending = deque()
+        self._rings: Dict[str, TraceRing] = dict()
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            if self._pending:
+                return self._pending.popleft()
+
+            for ring in self._rings.values():
+                self._pending.extend(ring.drain())
+            if self._pending:
+                continue
+
+            if self._rings:
+                wait = self.poll_interval
+            elif self.spill_dir:
+                wait = self.spill_interval
+            else:
+                wait = None
+
+            if deadline is not None:
+                remaining = max(0., deadline - time.monotonic())
+                wait = remaining if wait is None else min(wait, remaining)
+
+            try:
+                item = self.queue.get(block, wait)
+            except Empty:
+                if self.spill_dir:
+                    self._pending.extend(ingest_spill_files(self.spill_dir))
+                    if self._pending:
+                        continue
+
+                polling = self._rings or self.spill_dir
+                if block and polling and (deadline is None or time.monotonic() < deadline):
+                    continue
+                raise
+
+            if isinstance(item, list):
+                self._pending.extend(item)
+            elif isinstance(item, AttachTraceRing):
+                self._attach(item.name)
+            elif isinstance(item, DetachTraceRing):
+                self._detach(item.name)
+            elif item == POISON:
+                # the trace logger stops, deliver the traces that are left in the rings first
+                self.close()
+                self._pending.append(item)
+            else:
+                return item
+
+    def _attach(self, name):
+        logger.debug('attaching to trace ring %s', name)
+        try:
+            self._rings[name] = TraceRing.attach(name)
+        except FileNotFoundError:
+            logger.warning('trace ring %s does not exist', name)
+
+    def _detach(self, name):
+        ring = self._rings.pop(name, None)
+        if ring is None:
+            return
+
+        logger.debug('detaching from trace ring %s', name)
+        self._pending.extend(ring.drain())
+        ring.close()
+        ring.unlink()
+
+    def close(self):
+        """
+        Drains, detaches from, and unlinks all rings that are still attached, e.g., because their client process died
+        without its ring being detached. The drained traces are returned by the next calls of ``get``.
+        """
+        for name in list(self._rings.keys()):
+            self._detach(name)
+
+    def put(self, *args, **kwargs):
+        return self.queue.put(*args, **kwargs)
+
+    def put_nowait(self, item):
+        return self.queue.put_nowait(item)
@@ -20,6 +20,10 @@ install_requires = [
     'pyyaml>=5.4.1',
     'click>=7.0',
 ]
+extras_require = {
+    'async': ['aiohttp>=3.8.0'],
+    'numpy': ['numpy>=1.17.0'],
+}
 
 setuptools.setup(
     name="edgerun-galileo",
@@ -34,6 +38,7 @@ setuptools.setup(
     test_suite="tests",
     tests_require=tests_require,
     install_requires=install_requires,
+    extras_require=extras_require,
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
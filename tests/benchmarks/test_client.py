@@ -50,7 +50,7 @@ class TestSingleRequest(unittest.TestCase):
 
         print('DebugRouter: %.2f req/sec (%.4fs total)' % (self.n / total, total))
 
-    @patch('galileo.routing.router.requests.request')
+    @patch('galileo.routing.router.requests.Session.request')
     def test_symmetry_router(self, mock_request):
         # mock http server
         Response = NamedTuple('Response', status_code=int, text=str, url=str, method=str)
@@ -1,6 +1,9 @@
 import unittest
 
-from galileo.controller.cluster import pack
+from pymq.provider.simple import SimpleEventBus
+
+from galileo.controller.cluster import pack, RedisClusterController
+from tests.testutils import RedisResource
 
 
 class PackTest(unittest.TestCase):
@@ -40,3 +43,35 @@ class PackTest(unittest.TestCase):
         }
 
         self.assertEqual(expected, result)
+
+
+class RedisClusterControllerTest(unittest.TestCase):
+    redis_resource: RedisResource = RedisResource()
+
+    def setUp(self) -> None:
+        self.redis_resource.setUp()
+        self.rds = self.redis_resource.rds
+        self.ctrl = RedisClusterController(self.rds, SimpleEventBus())
+
+    def tearDown(self) -> None:
+        self.redis_resource.tearDown()
+
+    def test_dropped_traces_are_not_labels(self):
+        self.ctrl.register_worker('worker1', {'arch': 'arm'})
+        self.ctrl.report_dropped_traces('worker1', 2)
+        self.ctrl.report_dropped_traces('worker1', 3)
+
+        self.assertEqual(5, self.ctrl.get_dropped_traces('worker1'))
+        self.assertEqual(0, self.ctrl.get_dropped_traces('worker2'))
+        self.assertEqual([('worker1', {'arch': 'arm'})], self.ctrl.list_workers_info())
+        self.assertEqual({'worker1': 0}, self.ctrl.count_worker_clients({'arch': 'arm'}))
+
+    def test_clock_offset_is_not_a_label(self):
+        self.ctrl.register_worker('worker1', {'arch': 'arm'})
+        self.ctrl.set_clock_offset('worker1', -0.25)
+
+        self.assertEqual(-0.25, self.ctrl.get_clock_offset('worker1'))
+        self.assertEqual([('worker1', {'arch': 'arm'})], self.ctrl.list_workers_info())
+
+        self.ctrl.unregister_worker('worker1')
+        self.assertIsNone(self.ctrl.get_clock_offset('worker1'))
@@ -1,8 +1,12 @@
+import itertools
+import random
+import threading
 import unittest
 import unittest.mock
 from collections import Counter, defaultdict
 
-from galileo.routing.balancer import WeightedRandomBalancer, WeightedRoundRobinBalancer
+from galileo.routing.balancer import WeightedRandomBalancer, WeightedRoundRobinBalancer, smooth_weighted_round_robin, \
+    AliasTable, LeastOutstandingRequestsBalancer
 from galileo.routing.table import RoutingTable, RoutingRecord
 
 
@@ -129,3 +133,253 @@ class BalancerTest(unittest.TestCase):
         self.assertAlmostEqual(10, cnt['a'], delta=1)
         self.assertAlmostEqual(40, cnt['b'], delta=1)
         self.assertAlmostEqual(50, cnt['c'], delta=1)
+
+    def test_weighted_round_robin_compiles_record_once(self):
+        route = RoutingRecord('aservice', hosts=['a', 'b', 'c'], weights=[5, 1, 1])
+
+        rtbl = RoutingTable()
+        rtbl.get_routing = unittest.mock.MagicMock(return_value=route)
+
+        balancer = WeightedRoundRobinBalancer(rtbl)
+
+        with unittest.mock.patch('galileo.routing.balancer.smooth_weighted_round_robin',
+                                 wraps=smooth_weighted_round_robin) as compile_schedule:
+            hosts = [balancer.next_host('aservice') for _ in range(14)]
+
+        self.assertEqual(['a', 'a', 'b', 'a', 'c', 'a', 'a'] * 2, hosts)
+        self.assertEqual(1, compile_schedule.call_count)
+
+    def test_weighted_round_robin_with_listening_table(self):
+        rtbl = ListeningRoutingTable()
+        rtbl.get_routing = unittest.mock.MagicMock(
+            return_value=RoutingRecord('aservice', hosts=['a', 'b'], weights=[1, 1]))
+
+        balancer = WeightedRoundRobinBalancer(rtbl)
+
+        self.assertEqual(['a', 'b', 'a'], [balancer.next_host('aservice') for _ in range(3)])
+        self.assertEqual(1, rtbl.get_routing.call_count)
+
+        rtbl.get_routing.return_value = RoutingRecord('aservice', hosts=['c'], weights=[1])
+        self.assertEqual('b', balancer.next_host('aservice'))  # not notified yet
+
+        rtbl.notify('aservice')
+        self.assertEqual(['c', 'c'], [balancer.next_host('aservice') for _ in range(2)])
+        self.assertEqual(2, rtbl.get_routing.call_count)
+
+    def test_weighted_round_robin_concurrent_callers(self):
+        rtbl = ListeningRoutingTable()
+        rtbl.get_routing = unittest.mock.MagicMock(
+            return_value=RoutingRecord('aservice', hosts=['a', 'b', 'c'], weights=[1, 4, 5]))
+
+        balancer = WeightedRoundRobinBalancer(rtbl)
+        hosts = defaultdict(list)
+
+        def run(i):
+            for _ in range(5000):
+                hosts[i].append(balancer.next_host('aservice'))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        cnt = Counter(itertools.chain(*hosts.values()))
+        self.assertEqual({'a': 4000, 'b': 16000, 'c': 20000}, dict(cnt))
+
+    def test_weighted_round_robin_evicts_removed_services(self):
+        rtbl = ListeningRoutingTable()
+        rtbl.get_routing = unittest.mock.MagicMock(
+            return_value=RoutingRecord('aservice', hosts=['a'], weights=[1]))
+
+        balancer = WeightedRoundRobinBalancer(rtbl)
+        balancer.next_host('aservice')
+        self.assertIn('aservice', balancer._compiled)
+
+        rtbl.get_routing.side_effect = ValueError
+        rtbl.notify('aservice')
+
+        self.assertNotIn('aservice', balancer._compiled)
+        self.assertRaises(ValueError, balancer.next_host, 'aservice')
+
+    def test_weighted_round_robin_evicts_removed_services_without_listener(self):
+        rtbl = RoutingTable()
+        rtbl.get_routing = unittest.mock.MagicMock(
+            return_value=RoutingRecord('aservice', hosts=['a'], weights=[1]))
+
+        balancer = WeightedRoundRobinBalancer(rtbl)
+        balancer.next_host('aservice')
+
+        rtbl.get_routing.side_effect = ValueError
+        self.assertRaises(ValueError, balancer.next_host, 'aservice')
+        self.assertNotIn('aservice', balancer._compiled)
+
+    def test_weighted_random_builds_alias_table_once(self):
+        rtbl = ListeningRoutingTable()
+        rtbl.get_routing = unittest.mock.MagicMock(
+            return_value=RoutingRecord('aservice', hosts=['a', 'b'], weights=[1, 3]))
+
+        balancer = WeightedRandomBalancer(rtbl)
+        for _ in range(10):
+            balancer.next_host('aservice')
+        self.assertEqual(1, rtbl.get_routing.call_count)
+
+        rtbl.get_routing.return_value = RoutingRecord('aservice', hosts=['c'], weights=[1])
+        rtbl.notify('aservice')
+        self.assertEqual('c', balancer.next_host('aservice'))
+
+
+class ListeningRoutingTable(RoutingTable):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.listeners = list()
+
+    def add_listener(self, listener) -> bool:
+        self.listeners.append(listener)
+        return True
+
+    def notify(self, service):
+        for listener in self.listeners:
+            listener(service)
+
+
+class AliasTableTest(unittest.TestCase):
+
+    def test_distribution(self):
+        hosts = ['h%d' % i for i in range(200)]
+        weights = [i % 7 for i in range(200)]  # includes hosts with weight 0
+        table = AliasTable(RoutingRecord('aservice', hosts, weights), random.Random(42))
+
+        n = 200000
+        cnt = Counter(table.next() for _ in range(n))
+
+        total = sum(weights)
+        for host, weight in zip(hosts, weights):
+            if weight == 0:
+                self.assertEqual(0, cnt[host])
+            else:
+                self.assertAlmostEqual(weight / total, cnt[host] / n, delta=0.0025)
+
+    def test_columns(self):
+        table = AliasTable(RoutingRecord('aservice', ['a', 'b', 'c'], [1, 1, 2]))
+
+        # each column holds 1/n of the probability mass
+        mass = Counter()
+        for i, p in enumerate(table.prob):
+            mass[table.hosts[i]] += p
+            mass[table.hosts[table.alias[i]]] += 1 - p
+
+        self.assertAlmostEqual(0.75, mass['a'])
+        self.assertAlmostEqual(0.75, mass['b'])
+        self.assertAlmostEqual(1.5, mass['c'])
+
+    def test_invalid_weights(self):
+        self.assertRaises(ValueError, AliasTable, RoutingRecord('aservice', ['a'], [0]))
+        self.assertRaises(ValueError, AliasTable, RoutingRecord('aservice', ['a', 'b'], [-1, 2]))
+        self.assertRaises(ValueError, AliasTable, RoutingRecord('aservice', [], []))
+
+
+class LeastOutstandingRequestsBalancerTest(unittest.TestCase):
+
+    @staticmethod
+    def create_balancer(hosts, weights, weighted=False):
+        rtbl = RoutingTable()
+        rtbl.get_routing = unittest.mock.MagicMock(return_value=RoutingRecord('aservice', hosts, weights))
+        return LeastOutstandingRequestsBalancer(rtbl, weighted=weighted, rnd=random.Random(42))
+
+    def test_picks_host_with_fewest_outstanding_requests(self):
+        balancer = self.create_balancer(['a', 'b'], [1, 1])
+
+        hosts = [balancer.next_host('aservice') for _ in range(2)]
+        self.assertEqual({'a', 'b'}, set(hosts))
+        self.assertEqual({'a': 1, 'b': 1}, balancer.outstanding())
+
+        # b completes, a is slow
+        balancer.release('b')
+        self.assertEqual('b', balancer.next_host('aservice'))
+        self.assertEqual({'a': 1, 'b': 1}, balancer.outstanding())
+
+    def test_never_picks_the_most_loaded_host(self):
+        balancer = self.create_balancer(['a', 'b', 'c'], [1, 1, 1])
+        for _ in range(5):
+            balancer._counter('a').acquire()
+
+        hosts = list()
+        for _ in range(30):
+            host = balancer.next_host('aservice')
+            balancer.release(host)
+            hosts.append(host)
+
+        self.assertEqual({'b', 'c'}, set(hosts))
+        self.assertEqual({'a': 5}, balancer.outstanding())
+
+    def test_spreads_ties(self):
+        balancer = self.create_balancer(['a', 'b', 'c'], [1, 1, 1])
+
+        hosts = list()
+        for _ in range(300):
+            host = balancer.next_host('aservice')
+            balancer.release(host)
+            hosts.append(host)
+
+        for count in Counter(hosts).values():
+            self.assertAlmostEqual(100, count, delta=30)
+        self.assertEqual({}, balancer.outstanding())
+
+    def test_weighted(self):
+        balancer = self.create_balancer(['a', 'b', 'c'], [1, 3, 0], weighted=True)
+
+        hosts = [balancer.next_host('aservice') for _ in range(8)]
+
+        self.assertEqual({'a': 2, 'b': 6}, Counter(hosts))
+
+    def test_unweighted_ignores_weights_but_skips_hosts_without_weight(self):
+        balancer = self.create_balancer(['a', 'b', 'c'], [1, 3, 0])
+
+        hosts = [balancer.next_host('aservice') for _ in range(8)]
+
+        self.assertEqual({'a': 4, 'b': 4}, Counter(hosts))
+
+    def test_release_unknown_host(self):
+        balancer = self.create_balancer(['a'], [1])
+        balancer.release('a')
+        self.assertEqual({}, balancer.outstanding())
+
+    def test_concurrent_callers(self):
+        balancer = self.create_balancer(['a', 'b', 'c', 'd'], [1, 2, 3, 4], weighted=True)
+
+        def run():
+            for _ in range(2000):
+                balancer.release(balancer.next_host('aservice'))
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual({}, balancer.outstanding())
+
+
+class SmoothWeightedRoundRobinTest(unittest.TestCase):
+
+    def test_interleaves_hosts(self):
+        self.assertEqual(['a', 'a', 'b', 'a', 'c', 'a', 'a'],
+                         smooth_weighted_round_robin(['a', 'b', 'c'], [5, 1, 1]))
+
+    def test_divides_by_gcd(self):
+        self.assertEqual(['b', 'a', 'b', 'b'], smooth_weighted_round_robin(['a', 'b'], [1000, 3000]))
+
+    def test_skips_hosts_without_weight(self):
+        self.assertEqual(['b'], smooth_weighted_round_robin(['a', 'b'], [0, 2.0]))
+
+    def test_bounds_length(self):
+        schedule = smooth_weighted_round_robin(['a', 'b'], [1000003, 999983], max_length=100)
+
+        self.assertEqual(100, len(schedule))
+        self.assertEqual(50, schedule.count('a'))
+
+    def test_no_positive_weights_raises(self):
+        self.assertRaises(ValueError, smooth_weighted_round_robin, ['a', 'b'], [0, 0])
+        self.assertRaises(ValueError, smooth_weighted_round_robin, [], [])
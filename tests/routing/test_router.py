@@ -1,8 +1,16 @@
+import asyncio
+import io
+import threading
 import unittest
-from unittest.mock import patch
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from unittest.mock import patch, MagicMock
 
-from galileo.routing.balancer import StaticLocalhostBalancer
-from galileo.routing.router import StaticRouter, ServiceRequest, HostRouter, ServiceRouter
+import requests
+
+from galileo.routing.balancer import StaticLocalhostBalancer, LeastOutstandingRequestsBalancer
+from galileo.routing.router import StaticRouter, ServiceRequest, HostRouter, ServiceRouter, create_session, \
+    aiohttp_kwargs
+from galileo.routing.table import RoutingTable, RoutingRecord
 
 
 class TestRouterUrlCreation(unittest.TestCase):
@@ -25,7 +33,7 @@ class TestRouterUrlCreation(unittest.TestCase):
         url = router._get_url(ServiceRequest('foobar', '/some/service'))
         self.assertEqual('http://localhost/foobar/some/service', url)
 
-    @patch('galileo.routing.router.requests.request')
+    @patch('galileo.routing.router.requests.Session.request')
     def test_request_basic(self, mock_request):
         """
         Whitebox test to check whether requests is called correctly by the router
@@ -52,6 +60,166 @@ class TestRouterUrlCreation(unittest.TestCase):
         self.assertEqual('get', response.args[0])
         self.assertEqual('http://localhost/some/service', response.args[1])
 
+    def test_create_session(self):
+        session = create_session(pool_connections=2, pool_maxsize=5)
+
+        adapter = session.get_adapter('http://localhost')
+        self.assertEqual(2, adapter._pool_connections)
+        self.assertEqual(5, adapter._pool_maxsize)
+        self.assertIs(adapter, session.get_adapter('https://localhost'))
+
+    def test_router_uses_given_session(self):
+        session = create_session()
+        router = HostRouter(StaticLocalhostBalancer(), session=session)
+
+        self.assertIs(session, router.session)
+
+
+class TestAiohttpKwargs(unittest.TestCase):
+
+    def test_passes_common_arguments(self):
+        kwargs = {'params': {'a': 1}, 'data': 'x', 'json': None, 'headers': {'h': 'v'}, 'allow_redirects': False}
+        self.assertEqual(kwargs, aiohttp_kwargs(kwargs))
+
+    def test_translates_arguments(self):
+        import aiohttp
+        from requests.auth import HTTPBasicAuth
+
+        self.assertEqual(aiohttp.ClientTimeout(total=1.5), aiohttp_kwargs({'timeout': 1.5})['timeout'])
+        self.assertEqual(aiohttp.ClientTimeout(sock_connect=1, sock_read=2),
+                         aiohttp_kwargs({'timeout': (1, 2)})['timeout'])
+        self.assertEqual({'ssl': False}, aiohttp_kwargs({'verify': False}))
+        self.assertEqual({}, aiohttp_kwargs({'verify': True, 'stream': True}))
+        self.assertEqual(aiohttp.BasicAuth('user', 'pw'), aiohttp_kwargs({'auth': ('user', 'pw')})['auth'])
+        self.assertEqual(aiohttp.BasicAuth('user', 'pw'), aiohttp_kwargs({'auth': HTTPBasicAuth('user', 'pw')})['auth'])
+
+    def test_rejects_unsupported_arguments(self):
+        self.assertRaises(ValueError, aiohttp_kwargs, {'files': {'f': b'data'}})
+        self.assertRaises(ValueError, aiohttp_kwargs, {'cert': '/path/to/cert'})
+        self.assertRaises(ValueError, aiohttp_kwargs, {'auth': lambda r: r})
+
+
+class TestOutstandingRequests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rtbl = RoutingTable()
+        rtbl.get_routing = MagicMock(return_value=RoutingRecord('foobar', ['a', 'b'], [1, 1]))
+        self.balancer = LeastOutstandingRequestsBalancer(rtbl)
+        self.router = HostRouter(self.balancer)
+
+    def test_request_is_outstanding_until_it_returns(self):
+        outstanding = list()
+
+        def mocked_request(*args, **kwargs):
+            outstanding.append(self.router.outstanding())
+            return MagicMock(status_code=200)
+
+        with patch.object(self.router.session, 'request', side_effect=mocked_request):
+            self.router.request(ServiceRequest('foobar', '/'))
+
+        self.assertEqual(1, sum(outstanding[0].values()))
+        self.assertEqual({}, self.router.outstanding())
+
+    def test_streamed_request_is_outstanding_until_closed(self):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(b'body')
+
+        with patch.object(self.router.session, 'request', return_value=response):
+            response = self.router.request(ServiceRequest('foobar', '/', stream=True))
+
+        self.assertEqual(1, sum(self.router.outstanding().values()))
+        response.close()
+        self.assertEqual({}, self.router.outstanding())
+        response.close()
+        self.assertEqual({}, self.router.outstanding())
+
+    def test_failed_request_is_released(self):
+        with patch.object(self.router.session, 'request', side_effect=ConnectionError):
+            self.assertRaises(ConnectionError, self.router.request, ServiceRequest('foobar', '/'))
+
+        self.assertEqual({}, self.router.outstanding())
+
+    def test_static_router_has_no_outstanding_requests(self):
+        self.assertEqual({}, StaticRouter('http://localhost').outstanding())
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'hello'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTimedRequest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.httpd = HTTPServer(('localhost', 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        self.router = StaticRouter('http://localhost:%d' % self.httpd.server_port)
+
+    def tearDown(self) -> None:
+        self.router.session.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join(2)
+
+    def test_request_without_timings(self):
+        req = ServiceRequest('foobar', '/')
+        self.assertEqual('hello', self.router.request(req).text)
+        self.assertIsNone(req.timings)
+
+    def test_timed_request(self):
+        req = ServiceRequest('foobar', '/')
+        req.timings = dict()
+
+        response = self.router.request(req)
+
+        self.assertEqual('hello', response.text)
+        self.assertEqual({'route', 'connect', 'server', 'read'}, set(req.timings.keys()))
+        self.assertGreater(req.timings['connect'], 0)
+        self.assertGreater(req.timings['server'], 0)
+
+        # the connection is re-used
+        req = ServiceRequest('foobar', '/')
+        req.timings = dict()
+        self.router.request(req)
+        self.assertEqual(0, req.timings['connect'])
+
+    def test_timed_streamed_request_does_not_read_body(self):
+        req = ServiceRequest('foobar', '/', stream=True)
+        req.timings = dict()
+
+        response = self.router.request(req)
+
+        self.assertNotIn('read', req.timings)
+        self.assertFalse(response._content_consumed)
+        self.assertEqual('hello', response.text)
+
+    def test_timed_async_request(self):
+        import aiohttp
+
+        async def request(req):
+            async with aiohttp.ClientSession() as session:
+                return await self.router.request_async(req, session)
+
+        req = ServiceRequest('foobar', '/', timeout=2)
+        req.timings = dict()
+
+        response = asyncio.run(request(req))
+
+        self.assertEqual('hello', response.text)
+        self.assertEqual({'route', 'server', 'read'}, set(req.timings.keys()))
+        self.assertGreater(req.timings['server'], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
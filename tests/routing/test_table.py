@@ -1,10 +1,12 @@
 import time
 import unittest
+from unittest.mock import patch
 
 from timeout_decorator import timeout_decorator
 
-from galileo.routing.table import RoutingTable, RoutingRecord, RedisRoutingTable, ReadOnlyListeningRedisRoutingTable
-from tests.testutils import RedisResource
+from galileo.routing.table import RoutingTable, RoutingRecord, RedisRoutingTable, ReadOnlyListeningRedisRoutingTable, \
+    RevalidatingRoutingTable
+from tests.testutils import RedisResource, assert_poll
 
 
 class TestRoutingTable(unittest.TestCase):
@@ -91,6 +93,102 @@ class TestRoutingTable(unittest.TestCase):
         pubsub.unsubscribe(RedisRoutingTable.update_channel)
         pubsub.close()
 
+    def test_versions(self):
+        self.assertIsNone(self.rtbl.get_version())
+        self.assertIsNone(self.rtbl.get_version('aservice'))
+
+        self.rtbl.set_routing(RoutingRecord('aservice', ['ahost'], [1.0]))
+        self.rtbl.set_routing(RoutingRecord('bservice', ['ahost'], [1.0]))
+        self.assertEqual(1, self.rtbl.get_version('aservice'))
+        self.assertEqual(2, self.rtbl.get_version())
+
+        self.rtbl.set_routing(RoutingRecord('aservice', ['bhost'], [1.0]))
+        self.assertEqual((2, RoutingRecord('aservice', ['bhost'], [1.0])), self.rtbl.get_versioned_routing('aservice'))
+
+        self.rtbl.remove_service('aservice')
+        self.assertEqual(3, self.rtbl.get_version('aservice'))
+        self.assertEqual(4, self.rtbl.get_version())
+        self.assertRaises(ValueError, self.rtbl.get_versioned_routing, 'aservice')
+
+        self.rtbl.clear()
+        self.assertEqual(2, self.rtbl.get_version('bservice'))
+
+
+class TestRevalidatingTable(unittest.TestCase):
+    redis = RedisResource()
+
+    def setUp(self) -> None:
+        self.redis.setUp()
+        self.rtbl_mutable = RedisRoutingTable(self.redis.rds)
+        self.rtbl = RevalidatingRoutingTable(RedisRoutingTable(self.redis.rds))
+
+    def tearDown(self) -> None:
+        self.redis.tearDown()
+
+    def test_unchanged_record_is_revalidated_with_version(self):
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['ahost', 'bhost'], [2.0, 3.0]))
+
+        record1 = self.rtbl.get_routing('aservice')
+        with patch.object(self.rtbl.rtable, 'get_versioned_routing') as get_versioned_routing:
+            record2 = self.rtbl.get_routing('aservice')
+            get_versioned_routing.assert_not_called()
+
+        self.assertIs(record1, record2)
+
+    def test_changed_record_is_reloaded(self):
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['ahost', 'bhost'], [2.0, 3.0]))
+        self.rtbl.get_routing('aservice')
+
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['ahost'], [2.0]))
+        self.assertEqual(['ahost'], self.rtbl.get_routing('aservice').hosts)
+
+        self.rtbl_mutable.remove_service('aservice')
+        self.assertRaises(ValueError, self.rtbl.get_routing, 'aservice')
+
+    def test_ttl_skips_revalidation(self):
+        self.rtbl.ttl = 60
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['ahost'], [2.0]))
+        record = self.rtbl.get_routing('aservice')
+
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['bhost'], [2.0]))
+        self.assertIs(record, self.rtbl.get_routing('aservice'))
+
+    def test_record_without_version_is_always_read(self):
+        self.redis.rds.rpush('routing:hosts:aservice', 'ahost')
+        self.redis.rds.rpush('routing:weights:aservice', '1')
+
+        self.assertEqual(['ahost'], self.rtbl.get_routing('aservice').hosts)
+        self.redis.rds.rpush('routing:hosts:aservice', 'bhost')
+        self.redis.rds.rpush('routing:weights:aservice', '1')
+        self.assertEqual(['ahost', 'bhost'], self.rtbl.get_routing('aservice').hosts)
+
+    def test_list_services(self):
+        self.assertEqual(set(), self.rtbl.list_services())
+
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['ahost'], [2.0]))
+        self.assertEqual({'aservice'}, self.rtbl.list_services())
+
+        services = self.rtbl.list_services()
+        self.assertIs(services, self.rtbl.list_services())
+
+        self.rtbl.set_routing(RoutingRecord('bservice', ['ahost'], [2.0]))
+        self.assertEqual({'aservice', 'bservice'}, self.rtbl.list_services())
+
+    def test_read_overtaken_by_local_update_is_not_stored(self):
+        self.rtbl.ttl = 60
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['ahost'], [2.0]))
+        get_versioned_routing = self.rtbl.rtable.get_versioned_routing
+
+        def read_then_update(service):
+            result = get_versioned_routing(service)
+            self.rtbl.set_routing(RoutingRecord('aservice', ['bhost'], [2.0]))
+            return result
+
+        with patch.object(self.rtbl.rtable, 'get_versioned_routing', side_effect=read_then_update):
+            self.assertEqual(['ahost'], self.rtbl.get_routing('aservice').hosts)
+
+        self.assertEqual(['bhost'], self.rtbl.get_routing('aservice').hosts)
+
 
 class TestListeningTable(unittest.TestCase):
     redis = RedisResource()
@@ -148,6 +246,16 @@ class TestListeningTable(unittest.TestCase):
         self.assertIn('bservice', self.rtbl.list_services())
         self.assertEqual(1, len(self.rtbl.list_services()))
 
+    def test_listeners_are_notified_on_update(self):
+        updates = list()
+        self.assertTrue(self.rtbl.add_listener(updates.append))
+
+        self.rtbl_mutable.set_routing(RoutingRecord('aservice', ['ahost'], [1.0]))
+        assert_poll(lambda: updates == ['aservice'], 'listener was not notified')
+
+    def test_default_table_does_not_notify(self):
+        self.assertFalse(self.rtbl_mutable.add_listener(lambda service: None))
+
 
 if __name__ == '__main__':
     unittest.main()
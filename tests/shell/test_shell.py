@@ -1,8 +1,14 @@
+import io
+import threading
 import unittest
-from unittest.mock import MagicMock
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock, call
 
-from galileo.shell.shell import ClientGroup
+from galileo.shell.shell import ClientGroup, Show
 from galileo.worker.api import ClientDescription
+from galileo.worker.metrics import MetricsPublisher
+from tests.testutils import RedisResource
+from tests.worker.test_metrics import StaticMetricsClient
 
 
 class TestClientGroup(unittest.TestCase):
@@ -52,3 +58,47 @@ class TestClientGroup(unittest.TestCase):
             self.fail('expected value error because of differing controllers in client groups')
         except ValueError:
             pass
+
+    def test_schedule(self):
+        ctrl = MagicMock()
+
+        cg = ClientGroup(ctrl, [
+            ClientDescription('id1', 'worker1', None),
+            ClientDescription('id2', 'worker2', None),
+        ])
+
+        cg.schedule([1, 2], 10, start=100)
+
+        ctrl.schedule_workload.assert_has_calls([call('id1', [1, 2], 10, 100), call('id2', [1, 2], 10, 100)])
+
+
+class TestShowLive(unittest.TestCase):
+    redis_resource: RedisResource = RedisResource()
+
+    def setUp(self) -> None:
+        self.redis_resource.setUp()
+        self.rds = self.redis_resource.rds
+
+    def tearDown(self) -> None:
+        self.redis_resource.tearDown()
+
+    def test_live(self):
+        g = MagicMock()
+        g.ctrl.rds = self.rds
+
+        publisher = MetricsPublisher(self.rds, lambda: [
+            StaticMetricsClient('c1'), StaticMetricsClient('c2', target_rate=None)
+        ])
+
+        out = io.StringIO()
+        timer = threading.Timer(0.05, publisher.publish)
+        timer.start()
+        with redirect_stdout(out):
+            Show(g).live(interval=0.1, duration=0.25)
+        timer.join()
+
+        output = out.getvalue()
+        self.assertIn('(2 clients)', output)
+        self.assertIn('c1', output)
+        self.assertIn('total', output)
+        self.assertIn('19.0', output)  # total rps
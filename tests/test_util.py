@@ -1,6 +1,8 @@
 import unittest
 
-from galileo.util import to_seconds
+import time
+
+from galileo.util import to_seconds, estimate_clock_offset, redis_time
 
 
 class TestUtil(unittest.TestCase):
@@ -11,3 +13,20 @@ class TestUtil(unittest.TestCase):
         self.assertEqual(60, to_seconds('1m'))
         self.assertEqual(600, to_seconds('10m'))
         self.assertEqual(610, to_seconds('10m 10s'))
+
+    def test_redis_time(self):
+        self.assertAlmostEqual(10.5, redis_time(FakeRedisClock(10.5)), delta=0.01)
+
+    def test_estimate_clock_offset(self):
+        offset = estimate_clock_offset(FakeRedisClock(time.time() + 10))
+        self.assertAlmostEqual(10, offset, delta=0.05)
+
+
+class FakeRedisClock:
+
+    def __init__(self, now: float) -> None:
+        self.offset = now - time.time()
+
+    def time(self):
+        now = time.time() + self.offset
+        return int(now), int(round((now - int(now)) * 1e6))
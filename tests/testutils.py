@@ -1,12 +1,21 @@
+import io
 import os
 import shutil
 import tempfile
+from queue import Queue
 
 import redislite
+import requests
+import urllib3
 from galileodb.sql.adapter import ExperimentSQLDatabase, SqlAdapter
 from galileodb.sql.driver.sqlite import SqliteAdapter
+from pymq.provider.simple import SimpleEventBus
+from requests.structures import CaseInsensitiveDict
 
 from galileo.util import poll
+from galileo.worker.api import ClientDescription, ClientConfig
+from galileo.worker.client import Client
+from galileo.worker.context import Context, DebugRouter
 
 
 class TestResource(object):
@@ -61,3 +70,66 @@ def assert_poll(condition, msg='Condition failed', timeout=2):
         poll(condition, timeout, 0.01)
     except TimeoutError:
         raise AssertionError(msg)
+
+
+BODY = b'  {"label": "cat", "confidence": 0.9}  '
+
+
+class BodyStream(io.BytesIO):
+    """
+    Counts the bytes that were read from the body.
+    """
+
+    def __init__(self, body: bytes) -> None:
+        super().__init__(body)
+        self.bytes_read = 0
+
+    def read(self, *args) -> bytes:
+        data = super().read(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        n = super().readinto(b)
+        self.bytes_read += n
+        return n
+
+
+def create_response(body=BODY, headers=None) -> requests.Response:
+    headers = headers or {'Content-Type': 'application/json', 'X-Server': 'node1'}
+    if not isinstance(body, io.IOBase):
+        body = io.BytesIO(body)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = 'utf-8'
+    response.raw = urllib3.HTTPResponse(body=body, headers=headers, preload_content=False)
+    return response
+
+
+class SynchronousExecutor:
+
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+    def shutdown(self, *args, **kwargs):
+        pass
+
+
+def create_test_client(cfg: ClientConfig = None, env: dict = None, router=None, trace_queue=None, eventbus=None,
+                       ping_ctrl=None, synchronous=True) -> Client:
+    """
+    Creates the client 'unittest_client' of 'unittest_worker', by default for the service 'aservice'. Requests go to a
+    DebugRouter, unless a router is given. With ``synchronous``, requests are performed in the thread that runs the
+    client, otherwise in the thread pool of the client.
+    """
+    ctx = Context(env or {})
+    router = router or DebugRouter()
+    ctx.create_router = lambda: router
+    ctx.create_ping_ctrl = lambda: ping_ctrl
+
+    description = ClientDescription('unittest_client', 'unittest_worker', cfg or ClientConfig('aservice'))
+    return Client(ctx, Queue() if trace_queue is None else trace_queue, description,
+                  eventbus=eventbus or SimpleEventBus(),
+                  request_executor=SynchronousExecutor() if synchronous else None)
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import unittest
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from galileo.worker.capture import ResponseCapture
+from tests.testutils import BODY, BodyStream, create_response
+
+
+class AsyncStream:
+
+    def __init__(self, body: bytes, chunk: int = 8) -> None:
+        self.body = body
+        self.chunk = chunk
+
+    async def read(self, n: int = -1) -> bytes:
+        n = self.chunk if n < 0 else min(n, self.chunk)
+        data, self.body = self.body[:n], self.body[n:]
+        return data
+
+    async def iter_chunked(self, n: int):
+        while self.body:
+            yield await self.read(n)
+
+    def at_eof(self) -> bool:
+        return not self.body
+
+
+class AsyncResponse:
+    """
+    Mimics the parts of an aiohttp.ClientResponse that are used by ResponseCapture.
+    """
+
+    def __init__(self, body=BODY, headers=None) -> None:
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.charset = 'utf-8'
+        self.content = AsyncStream(body)
+        self.closed = False
+
+    async def text(self, errors='strict') -> str:
+        data = b''
+        async for chunk in self.content.iter_chunked(1024):
+            data += chunk
+        return data.decode(self.charset, errors=errors)
+
+    def close(self):
+        self.closed = True
+
+
+class ResponseCaptureTest(unittest.TestCase):
+
+    def test_full(self):
+        capture = ResponseCapture()
+
+        self.assertFalse(capture.stream)
+        self.assertEqual('{"label": "cat", "confidence": 0.9}', capture.body(create_response()))
+
+    def test_none_does_not_read_body(self):
+        capture = ResponseCapture('none')
+        body = BodyStream(BODY)
+        response = create_response(body)
+
+        self.assertTrue(capture.stream)
+        self.assertIsNone(capture.body(response))
+        self.assertFalse(response._content_consumed)
+        self.assertEqual(0, body.bytes_read)
+        self.assertTrue(response.raw.closed)
+
+    def test_head(self):
+        capture = ResponseCapture('head:10')
+        body = BodyStream(BODY)
+        response = create_response(body)
+
+        self.assertEqual('{"label"', capture.body(response))
+        self.assertEqual(10, body.bytes_read)
+        self.assertTrue(response.raw.closed)
+
+    def test_hash(self):
+        capture = ResponseCapture('hash')
+        response = create_response()
+
+        self.assertEqual(hashlib.sha1(BODY).hexdigest(), capture.body(response))
+        self.assertTrue(response._content_consumed)
+
+    def test_length(self):
+        capture = ResponseCapture('length')
+
+        self.assertEqual(str(len(BODY)), capture.body(create_response()))
+
+        body = BodyStream(BODY)
+        self.assertEqual('1234', capture.body(create_response(body, headers={'Content-Length': '1234'})))
+        self.assertEqual(0, body.bytes_read)
+
+    def test_release(self):
+        capture = ResponseCapture('none')
+        response = create_response()
+
+        capture.release(response)
+        self.assertTrue(response.raw.closed)
+        capture.release(response)  # idempotent
+
+    def test_body_async(self):
+        body = BODY * 10
+
+        def capture(policy, headers=None, read=None, closed=False):
+            response = AsyncResponse(body, headers)
+            result = asyncio.run(ResponseCapture(policy).body_async(response))
+            self.assertEqual(len(body) if read is None else read, len(body) - len(response.content.body))
+            self.assertEqual(closed, response.closed)
+            return result
+
+        self.assertEqual(body.decode().strip(), capture('full'))
+        self.assertIsNone(capture('none', read=0, closed=True))
+        self.assertEqual('{"label": "cat"', capture('head:17', read=17, closed=True))
+        self.assertEqual(hashlib.sha1(body).hexdigest(), capture('hash'))
+        self.assertEqual(str(len(body)), capture('length'))
+        self.assertEqual('1234', capture('length', {'Content-Length': '1234'}, read=0, closed=True))
+
+    def test_body_async_closes_on_error(self):
+        response = AsyncResponse()
+
+        async def fail(n):
+            raise ConnectionResetError()
+            yield  # pragma: no cover
+
+        response.content.iter_chunked = fail
+        self.assertRaises(ConnectionResetError, asyncio.run, ResponseCapture('hash').body_async(response))
+        self.assertTrue(response.closed)
+
+    def test_response_without_raw(self):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = BODY
+
+        self.assertEqual('{"', ResponseCapture('head:4').body(response))
+        self.assertEqual(str(len(BODY)), ResponseCapture('length').body(response))
+        self.assertEqual(hashlib.sha1(BODY).hexdigest(), ResponseCapture('hash').body(response))
+
+    def test_header_whitelist(self):
+        capture = ResponseCapture('none', headers=['x-server', 'X-Missing'])
+        self.assertEqual({'x-server': 'node1'}, capture.headers(create_response()))
+
+        self.assertEqual(2, len(ResponseCapture().headers(create_response())))
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, ResponseCapture, 'foo')
+        self.assertRaises(ValueError, ResponseCapture, 'head')
+        self.assertRaises(ValueError, ResponseCapture, 'head:x')
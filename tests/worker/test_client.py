@@ -1,4 +1,9 @@
+import asyncio
+import itertools
+import json
+import math
 import os
+import tempfile
 import threading
 import time
 import unittest
@@ -10,10 +15,14 @@ from pymq.provider.simple import SimpleEventBus
 from timeout_decorator import timeout_decorator
 
 from galileo.routing import ServiceRequest, RedisRoutingTable, RoutingRecord
-from galileo.worker.api import ClientDescription, ClientConfig, SetWorkloadCommand
-from galileo.worker.client import Client, RequestGenerator, single_request
+from galileo.worker.api import ClientDescription, ClientConfig, SetWorkloadCommand, CloseClientCommand, \
+    ScheduleWorkloadCommand, WorkloadDoneEvent, StopWorkloadCommand, StartTracingCommand
+from galileo.worker.client import Client, RequestGenerator, single_request, AsyncClient, create_client, ClientHost, \
+    scheduled, workload_rate, ClosedLoop
 from galileo.worker.context import Context, DebugRouter
-from tests.testutils import RedisResource
+from galileo.worker.sampling import sample_weight
+from galileo.worker.trace import TraceBatcher, ingest_spill_files
+from tests.testutils import RedisResource, assert_poll, create_response, create_test_client
 
 
 class StaticRequestGenerator:
@@ -21,9 +30,12 @@ class StaticRequestGenerator:
     def __init__(self, requests: List[ServiceRequest]) -> None:
         super().__init__()
         self.requests = requests
+        self.generated = 0
 
     def run(self):
-        yield from self.requests
+        for request in self.requests:
+            self.generated += 1
+            yield request
 
     def close(self):
         pass
@@ -31,6 +43,16 @@ class StaticRequestGenerator:
     def set_rps(self, *args, **kwargs):
         pass
 
+    async def run_async(self):
+        for request in self.requests:
+            yield request
+
+
+class StaticPingController:
+
+    def get_ping(self):
+        return 0
+
 
 class ClientTest(unittest.TestCase):
 
@@ -103,6 +125,410 @@ class ClientTest(unittest.TestCase):
         self.assertAlmostEqual(trace2.sent, time.time(), delta=2)
 
 
+class AsyncClientTest(unittest.TestCase):
+
+    def _create_context(self, router=None):
+        ctx = Context()
+        router = router or DebugRouter()
+        ctx.create_router = lambda: router
+        ctx.create_ping_ctrl = lambda: None
+        return ctx
+
+    def test_create_client_engine(self):
+        ctx = self._create_context()
+        description = ClientDescription('unittest_client', 'unittest_worker', ClientConfig('aservice', engine='asyncio'))
+
+        client = create_client(ctx, Queue(), description, eventbus=SimpleEventBus())
+        self.assertIsInstance(client, AsyncClient)
+
+        description = ClientDescription('unittest_client', 'unittest_worker', ClientConfig('aservice', engine='foo'))
+        self.assertRaises(ValueError, create_client, ctx, Queue(), description, SimpleEventBus())
+
+    @timeout_decorator.timeout(5)
+    def test_async_client(self):
+        ctx = self._create_context()
+        trace_queue = Queue()
+
+        description = ClientDescription('unittest_client', 'unittest_worker', ClientConfig('aservice'))
+        client = AsyncClient(ctx, trace_queue, description, eventbus=SimpleEventBus(), max_inflight=1)
+
+        client.request_generator = StaticRequestGenerator([
+            ServiceRequest('aservice'),
+            ServiceRequest('aservice'),
+        ])
+
+        client.run()
+
+        trace1 = trace_queue.get(timeout=2)
+        trace2 = trace_queue.get(timeout=2)
+
+        self.assertEqual('debughost', trace1.server)
+        self.assertEqual('debughost', trace2.server)
+        self.assertEqual(200, trace1.status)
+        self.assertNotEqual(trace1.request_id, trace2.request_id)
+
+        self.assertNotIn('X-Galileo-Scheduled', json.loads(trace1.headers))
+        self.assertLessEqual(trace1.scheduled, trace1.created)
+        self.assertEqual(2, client.get_info().corrected_latency['count'])
+
+    def test_async_client_has_no_executor_or_queue(self):
+        ctx = self._create_context()
+        description = ClientDescription('unittest_client', 'unittest_worker', ClientConfig('aservice'))
+        client = AsyncClient(ctx, Queue(), description, eventbus=SimpleEventBus())
+
+        self.assertIsNone(client.request_executor)
+        self.assertIsNone(client.get_info().queued)
+        self.assertIsNone(client.sample_metrics().queued)
+
+    def test_async_request_generator(self):
+        workload = SetWorkloadCommand('myclient', num=3, parameters=(0.01,))
+        request_generator = RequestGenerator(lambda: 1)
+        request_generator.set_workload(workload)
+
+        async def collect():
+            items = []
+            async for item in request_generator.run_async():
+                items.append(item)
+                if item is RequestGenerator.DONE:
+                    break
+            return items
+
+        items = asyncio.run(collect())
+        self.assertEqual([1, 1, 1, RequestGenerator.DONE], items)
+
+
+class BlockingRouter(DebugRouter):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+
+    def request(self, req: ServiceRequest) -> 'requests.Response':
+        self.release.wait(2)
+        return super().request(req)
+
+
+class OverloadPolicyTest(unittest.TestCase):
+
+    def _create_client(self, router, **kwargs):
+        client = create_test_client(ClientConfig('aservice', **kwargs), router=router, synchronous=False)
+        client.request_generator = StaticRequestGenerator([ServiceRequest('aservice') for _ in range(5)])
+        return client
+
+    @timeout_decorator.timeout(5)
+    def test_drop(self):
+        router = BlockingRouter()
+        client = self._create_client(router, max_pending=2, overload_policy='drop')
+
+        client.run()
+
+        info = client.get_info()
+        self.assertEqual(3, info.rejected)
+        self.assertEqual(2, info.queued + info.inflight)
+        self.assertEqual(0, info.failed)
+
+        router.release.set()
+        assert_poll(lambda: client.get_info().inflight == 0 and client.get_info().queued == 0)
+        self.assertEqual(2, client.traces.qsize())
+
+    @timeout_decorator.timeout(5)
+    def test_fail(self):
+        router = BlockingRouter()
+        client = self._create_client(router, max_pending=2, overload_policy='fail')
+
+        client.run()
+
+        info = client.get_info()
+        self.assertEqual(3, info.rejected)
+        self.assertEqual(3, info.failed)
+        self.assertEqual(-1, client.traces.get(timeout=1).status)
+
+        router.release.set()
+
+    @timeout_decorator.timeout(5)
+    def test_fail_records_trace_outside_of_lock(self):
+        router = BlockingRouter()
+        client = self._create_client(router, max_pending=2, overload_policy='fail')
+        lock_free = list()
+
+        def try_lock():
+            if client._pending.acquire(blocking=False):
+                client._pending.release()
+                lock_free.append(True)
+            else:
+                lock_free.append(False)
+
+        record_trace = client._record_trace
+
+        def checked_record_trace(request, t):
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            record_trace(request, t)
+
+        client._record_trace = checked_record_trace
+        client.run()
+        router.release.set()
+
+        self.assertEqual([True, True, True], lock_free[:3])
+
+    @timeout_decorator.timeout(5)
+    def test_block(self):
+        router = BlockingRouter()
+        client = self._create_client(router, max_pending=2, overload_policy='block')
+
+        t = threading.Thread(target=client.run)
+        t.start()
+
+        assert_poll(lambda: client.get_info().queued + client.get_info().inflight == 2)
+        self.assertTrue(t.is_alive())
+
+        router.release.set()
+        t.join(2)
+
+        assert_poll(lambda: client.traces.qsize() == 5)
+        self.assertEqual(0, client.get_info().rejected)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, self._create_client, DebugRouter(), overload_policy='foo')
+
+
+class TraceOverflowTest(unittest.TestCase):
+
+    def _run_client(self, trace_queue, env=None):
+        client = create_test_client(env=env, trace_queue=trace_queue)
+        client.request_generator = StaticRequestGenerator([ServiceRequest('aservice') for _ in range(3)])
+        client.run()
+        return client
+
+    def test_dropped_traces_are_counted(self):
+        client = self._run_client(Queue(maxsize=1))
+
+        info = client.get_info()
+        self.assertEqual(2, info.dropped_traces)
+        self.assertEqual(0, info.spilled_traces)
+
+    def test_dropped_traces_are_reported_once(self):
+        client = self._run_client(Queue(maxsize=1))
+
+        self.assertEqual(2, client.sample_metrics().dropped_traces)
+        self.assertEqual(0, client.sample_metrics().dropped_traces)
+        self.assertEqual(0, client.take_dropped_traces())
+        self.assertEqual(2, client.get_info().dropped_traces)
+
+    def test_dropped_batches_are_counted(self):
+        trace_queue = Queue(maxsize=1)
+        batcher = TraceBatcher(trace_queue, size=1)
+        client = self._run_client(batcher)
+
+        self.assertEqual(2, client.get_info().dropped_traces)
+
+    def test_overflow_is_spilled(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            trace_queue = Queue(maxsize=1)
+            client = self._run_client(trace_queue, {'galileo_trace_spill_dir': spill_dir})
+
+            info = client.get_info()
+            self.assertEqual(0, info.dropped_traces)
+            self.assertEqual(2, info.spilled_traces)
+
+            spilled = ingest_spill_files(spill_dir)
+            self.assertEqual(['unittest_client', 'unittest_client'], [t.client for t in spilled])
+            self.assertEqual(3, len({trace_queue.get().request_id} | {t.request_id for t in spilled}))
+            self.assertEqual([], os.listdir(spill_dir))
+
+
+class CaptureTest(unittest.TestCase):
+
+    def test_client_applies_capture_policy(self):
+        trace_queue = Queue()
+        client = create_test_client(ClientConfig('aservice', capture='length', capture_headers=['X-Server']),
+                                    trace_queue=trace_queue)
+        request = ServiceRequest('aservice')
+        client.request_generator = StaticRequestGenerator([request])
+        client.run()
+
+        trace = trace_queue.get(timeout=1)
+        self.assertTrue(request.kwargs['stream'])
+        self.assertEqual('0', trace.response)
+        self.assertEqual([], list(json.loads(trace.headers).keys()))
+
+    def test_streamed_response_is_released_on_error(self):
+        response = create_response()
+        router = DebugRouter()
+        router.request = lambda req: response
+
+        trace_queue = Queue()
+        client = create_test_client(ClientConfig('aservice', capture='none'), router=router, trace_queue=trace_queue)
+        client.request_generator = StaticRequestGenerator([ServiceRequest('aservice')])
+
+        with patch.object(client, '_capture_body', side_effect=ValueError('broken')):
+            client.run()
+
+        trace = trace_queue.get(timeout=1)
+        self.assertEqual(-1, trace.status)
+        self.assertTrue(response.raw.closed)
+
+
+class SampleMetricsTest(unittest.TestCase):
+
+    def test_sample_metrics(self):
+        client = create_test_client()
+        client.request_generator = StaticRequestGenerator([ServiceRequest('aservice') for _ in range(3)])
+        client.run()
+
+        metrics = client.sample_metrics()
+        self.assertEqual('unittest_client', metrics.client_id)
+        self.assertEqual('aservice', metrics.service)
+        self.assertAlmostEqual(3, metrics.rate * metrics.interval)
+        self.assertEqual(0, metrics.target_rate)  # no workload was set
+        self.assertEqual(0, metrics.errors)
+        self.assertGreater(metrics.p99, 0)
+
+        # the next interval starts empty
+        metrics = client.sample_metrics()
+        self.assertEqual(0, metrics.rate)
+        self.assertTrue(math.isnan(metrics.p50))
+
+    def test_target_rate_is_configured_rate(self):
+        client = create_test_client()
+        try:
+            client._on_set_workload_command(SetWorkloadCommand('unittest_client', parameters=(0.01,)))
+            self.assertAlmostEqual(100, client.sample_metrics().target_rate)
+
+            client._on_stop_workload_command(StopWorkloadCommand('unittest_client'))
+            self.assertEqual(0, client.sample_metrics().target_rate)
+        finally:
+            client.close()
+
+    def test_rejected_requests_are_not_completed(self):
+        client = create_test_client(ClientConfig('aservice', overload_policy='fail'))
+        client._reject(ServiceRequest('aservice'))
+
+        metrics = client.sample_metrics()
+        self.assertEqual(0, metrics.rate)
+        self.assertEqual(1, metrics.errors)
+
+
+class WorkloadRateTest(unittest.TestCase):
+
+    def test_open_loop(self):
+        self.assertEqual(0, workload_rate(None, 0))
+        self.assertAlmostEqual(20, workload_rate(SetWorkloadCommand('c', parameters=(0.05,)), 0))
+        self.assertAlmostEqual(20, workload_rate(SetWorkloadCommand('c', distribution='expovariate',
+                                                                    parameters=(20,)), 0))
+        self.assertEqual(0, workload_rate(SetWorkloadCommand('c', parameters=(0.05,), start_at=10), 5))
+        self.assertIsNone(workload_rate(SetWorkloadCommand('c', distribution='prerecorded'), 0))
+
+    def test_closed_loop(self):
+        self.assertIsNone(workload_rate(SetWorkloadCommand('c', parameters=(0.05,), users=4), 0))
+
+    def test_schedule(self):
+        cmd = ScheduleWorkloadCommand('c', ticks=[10, 0, 30], interval=2, start=100)
+
+        self.assertEqual(0, workload_rate(cmd, 99))
+        self.assertEqual(10, workload_rate(cmd, 101))
+        self.assertEqual(0, workload_rate(cmd, 103))
+        self.assertEqual(30, workload_rate(cmd, 105.5))
+        self.assertEqual(0, workload_rate(cmd, 106))
+        self.assertEqual(10, workload_rate(cmd._replace(start=None), 51, received=50))
+
+
+class TraceSamplingTest(unittest.TestCase):
+
+    def _run(self, client, n):
+        client.request_generator = StaticRequestGenerator([ServiceRequest('aservice') for _ in range(n)])
+        client.run()
+
+    def test_start_tracing_sets_sampler(self):
+        trace_queue = Queue()
+        client = create_test_client(trace_queue=trace_queue)
+
+        client._on_start_tracing_command(StartTracingCommand('ratio:5'))
+        self._run(client, 20)
+
+        self.assertEqual(4, trace_queue.qsize())
+        self.assertEqual(20, client.get_info().requests)
+
+    def test_client_config_overrides_start_tracing(self):
+        trace_queue = Queue()
+        client = create_test_client(ClientConfig('aservice', sampling='reservoir:3'), trace_queue=trace_queue)
+
+        client._on_start_tracing_command(StartTracingCommand('all'))
+        self._run(client, 10)
+        self.assertEqual(0, trace_queue.qsize())
+
+        client.close()  # releases the reservoir
+        traces = [trace_queue.get_nowait() for _ in range(trace_queue.qsize())]
+        self.assertEqual(3, len(traces))
+        self.assertAlmostEqual(10, sum(sample_weight(t) for t in traces))
+
+
+class PhaseTimingTest(unittest.TestCase):
+
+    def _run_client(self, env):
+        client = create_test_client(env=env, ping_ctrl=StaticPingController())
+        client.request_generator.set_workload(SetWorkloadCommand('unittest_client', num=3, parameters=(0.001,)))
+
+        rgen = client.request_generator.run()
+        for _ in range(3):
+            client.perform_request(next(rgen))
+        client.request_generator.close()
+        return client
+
+    def test_timing_disabled(self):
+        client = self._run_client({})
+
+        self.assertEqual({}, client.stats.phases)
+        self.assertEqual({}, client.get_info().phases)
+
+    def test_timing_enabled(self):
+        client = self._run_client({'galileo_client_timing': 'true'})
+
+        self.assertEqual({'generate', 'read', 'trace'}, set(client.stats.phases.keys()))
+        self.assertEqual(3, client.stats.phases['generate'].count)
+        self.assertEqual(3, client.get_info().phases['trace']['count'])
+
+
+class ClientHostTest(unittest.TestCase):
+
+    @timeout_decorator.timeout(5)
+    def test_clients_share_router_and_executor(self):
+        ctx = Context()
+        ctx.create_router = lambda: DebugRouter()
+        ctx.create_ping_ctrl = lambda: StaticPingController()
+        eventbus = SimpleEventBus()
+        eventbus.run()
+        trace_queue = Queue()
+
+        host = ClientHost(ctx, trace_queue, eventbus=eventbus)
+        try:
+            c1 = host.add(ClientDescription('client1', 'unittest_worker', ClientConfig('aservice')))
+            c2 = host.add(ClientDescription('client2', 'unittest_worker', ClientConfig('aservice')))
+
+            self.assertIs(c1.router, c2.router)
+            self.assertIs(c1.request_executor, c2.request_executor)
+
+            eventbus.publish(SetWorkloadCommand('client2', num=2, parameters=(0.01,)))
+
+            trace1 = trace_queue.get(timeout=2)
+            trace2 = trace_queue.get(timeout=2)
+            self.assertEqual('client2', trace1.client)
+            self.assertEqual('client2', trace2.client)
+
+            infos = {info.description.client_id: info for info in host.get_info()}
+            self.assertEqual(0, infos['client1'].requests)
+            self.assertEqual(2, infos['client2'].requests)
+
+            eventbus.publish(CloseClientCommand('client1'))
+            assert_poll(lambda: list(host.clients.keys()) == ['client2'], 'client1 was not closed')
+        finally:
+            host.close()
+            eventbus.close()
+
+        host.join()
+
+
 class TestSingleRequest(unittest.TestCase):
     redis_resource = RedisResource()
 
@@ -114,7 +540,7 @@ class TestSingleRequest(unittest.TestCase):
     def tearDown(self) -> None:
         self.redis_resource.tearDown()
 
-    @patch('galileo.routing.router.requests.request')
+    @patch('galileo.routing.router.requests.Session.request')
     def test_single_request(self, mock_request):
         # mock http server
         Response = NamedTuple('Response', status_code=int, text=str, url=str, method=str)
@@ -201,3 +627,253 @@ class RequestGeneratorTest(unittest.TestCase):
         finally:
             request_generator.close()
             t.join(2)
+
+
+class RequestGeneratorScheduleTest(unittest.TestCase):
+
+    def test_slow_factory_does_not_drift(self):
+        def slow_factory():
+            time.sleep(0.005)
+            return ServiceRequest('aservice')
+
+        workload = SetWorkloadCommand('myclient', num=50, parameters=(0.01,))
+        request_generator = RequestGenerator(slow_factory)
+        request_generator.set_workload(workload)
+
+        then = time.time()
+        requests = []
+        for request in request_generator.run():
+            if request is RequestGenerator.DONE:
+                break
+            requests.append(request)
+        duration = time.time() - then
+
+        self.assertEqual(50, len(requests))
+        self.assertAlmostEqual(0.5, duration, delta=0.1)
+
+        for a, b in zip(requests, requests[1:]):
+            self.assertAlmostEqual(0.01, b.scheduled - a.scheduled, delta=0.004)
+
+    def test_lag_is_exposed(self):
+        def blocking_factory():
+            time.sleep(0.05)
+            return ServiceRequest('aservice')
+
+        workload = SetWorkloadCommand('myclient', num=3, parameters=(0.01,))
+        request_generator = RequestGenerator(blocking_factory)
+        request_generator.set_workload(workload)
+
+        requests = []
+        for request in request_generator.run():
+            if request is RequestGenerator.DONE:
+                break
+            requests.append(request)
+
+        # the generator is behind schedule, so it sends the remaining requests immediately
+        self.assertGreater(requests[2].lag, 0.05)
+        self.assertGreater(request_generator.lag, 0.05)
+
+    def test_max_lag_resets_schedule(self):
+        request_generator = RequestGenerator(lambda: 1, max_lag=0.01)
+
+        first = request_generator._next_deadline(0.001)
+        time.sleep(0.05)
+        second = request_generator._next_deadline(0.001)
+
+        self.assertGreater(second - first, 0.04)
+
+    def test_stall_longer_than_max_lag_resets_schedule(self):
+        stalled = threading.Event()
+
+        def factory():
+            if not stalled.is_set():
+                stalled.set()
+                time.sleep(0.1)
+            return ServiceRequest('aservice')
+
+        request_generator = RequestGenerator(factory, max_lag=0.02)
+        request_generator.set_workload(SetWorkloadCommand('myclient', num=5, parameters=(0.01,)))
+
+        requests = list()
+        for request in request_generator.run():
+            if request is RequestGenerator.DONE:
+                break
+            requests.append(request)
+
+        # without max_lag, the requests after the stall would be released at once, each ~0.1s late
+        self.assertEqual(5, len(requests))
+        for request in requests[1:]:
+            self.assertLess(request.lag, 0.02)
+
+    def test_client_max_lag(self):
+        def create_client(env, cfg):
+            return create_test_client(cfg, env=env, synchronous=False)
+
+        self.assertEqual(1., create_client({}, ClientConfig('aservice')).request_generator.max_lag)
+        self.assertEqual(0.5, create_client({'galileo_client_max_lag': '0.5'},
+                                            ClientConfig('aservice')).request_generator.max_lag)
+        self.assertEqual(2., create_client({'galileo_client_max_lag': '0.5'},
+                                           ClientConfig('aservice', max_lag=2)).request_generator.max_lag)
+        self.assertIsNone(create_client({}, ClientConfig('aservice', max_lag=0)).request_generator.max_lag)
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def test_scheduled_interarrivals(self):
+        ias = list(scheduled([2, 0, 4], interval=1, start=time.time() + 1))
+
+        self.assertAlmostEqual(1, ias[0], delta=0.05)
+        self.assertEqual([0.5, 1.5, 0.25, 0.25, 0.25], [round(a, 6) for a in ias[1:]])
+
+    def test_scheduled_skips_past_ticks(self):
+        ias = list(scheduled([10, 2], interval=1, start=time.time() - 1.25))
+
+        self.assertEqual(1, len(ias))
+        self.assertAlmostEqual(0.25, ias[0], delta=0.05)
+
+    @timeout_decorator.timeout(5)
+    def test_client_follows_schedule(self):
+        eventbus = SimpleEventBus()
+        eventbus.run()
+
+        done = threading.Event()
+
+        def on_done(_: WorkloadDoneEvent):
+            done.set()
+
+        eventbus.subscribe(on_done)
+
+        trace_queue = Queue()
+        client = create_test_client(trace_queue=trace_queue, eventbus=eventbus, ping_ctrl=StaticPingController(),
+                                    synchronous=False)
+        t = threading.Thread(target=client.run)
+        t.start()
+
+        try:
+            eventbus.publish(ScheduleWorkloadCommand('unittest_client', [20, 0, 40], 0.1, time.time() + 0.1))
+            self.assertTrue(done.wait(2))
+            assert_poll(lambda: trace_queue.qsize() == 6)
+        finally:
+            client.close()
+            eventbus.close()
+            t.join(2)
+
+
+class StartAtTest(unittest.TestCase):
+
+    class OffsetContext(Context):
+
+        def __init__(self, offset) -> None:
+            super().__init__({})
+            self.offset = offset
+
+        def clock_offset(self) -> float:
+            return self.offset
+
+    def test_start_at_delays_schedule(self):
+        # the redis server clock is 10 seconds ahead of the local clock
+        request_generator = RequestGenerator(lambda: ServiceRequest('aservice'), self.OffsetContext(10))
+        start_at = time.time() + 10 + 0.2
+        request_generator.set_workload(SetWorkloadCommand('client', num=1, parameters=(0.05,), start_at=start_at))
+
+        gen = request_generator.run()
+        request = next(gen)
+
+        self.assertAlmostEqual(start_at - 10 + 0.05, request.scheduled, delta=0.5)
+        self.assertGreaterEqual(time.time(), start_at - 10 + 0.05)
+        request_generator.close()
+
+    def test_schedule_start_is_translated(self):
+        request_generator = RequestGenerator(lambda: ServiceRequest('aservice'), self.OffsetContext(-5))
+        start = time.time() - 5 + 0.1
+        request_generator.set_workload(ScheduleWorkloadCommand('client', [20], 0.1, start))
+
+        requests = list(itertools.takewhile(lambda r: r is not RequestGenerator.DONE, request_generator.run()))
+
+        self.assertEqual(2, len(requests))
+        self.assertAlmostEqual(start + 5, requests[0].scheduled, delta=0.5)
+
+
+class ClosedLoopTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.router = BlockingRouter()
+        self.eventbus = SimpleEventBus()
+        self.eventbus.run()
+
+        self.done = threading.Event()
+
+        def on_done(_: WorkloadDoneEvent):
+            self.done.set()
+
+        self.eventbus.subscribe(on_done)
+
+        self.trace_queue = Queue()
+        self.client = create_test_client(router=self.router, trace_queue=self.trace_queue, eventbus=self.eventbus,
+                                         ping_ctrl=StaticPingController(), synchronous=False)
+        self.thread = threading.Thread(target=self.client.run)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.router.release.set()
+        self.client.close()
+        self.eventbus.close()
+        self.thread.join(2)
+
+    @timeout_decorator.timeout(5)
+    def test_users_bound_concurrency(self):
+        self.eventbus.publish(SetWorkloadCommand('unittest_client', num=6, users=3))
+
+        assert_poll(lambda: self.client.get_info().inflight == 3)
+        time.sleep(0.1)
+        self.assertEqual(3, self.client.get_info().inflight)
+        self.assertEqual(0, self.client.get_info().queued)
+
+        self.router.release.set()
+        self.assertTrue(self.done.wait(2))
+        assert_poll(lambda: self.trace_queue.qsize() == 6)
+
+    @timeout_decorator.timeout(5)
+    def test_stop_workload_stops_users(self):
+        self.router.release.set()
+        self.eventbus.publish(SetWorkloadCommand('unittest_client', parameters=(0.01,), users=2))
+
+        assert_poll(lambda: self.trace_queue.qsize() >= 4)
+        self.eventbus.publish(StopWorkloadCommand('unittest_client'))
+        time.sleep(0.1)
+
+        n = self.trace_queue.qsize()
+        time.sleep(0.1)
+        self.assertEqual(n, self.trace_queue.qsize())
+        self.assertFalse(self.done.is_set())
+
+
+class ClosedLoopThinkTimeTest(unittest.TestCase):
+
+    class StubClient(NamedTuple):
+        client_id: str
+        ctx: Context
+
+    def test_users_draw_different_think_times(self):
+        client = self.StubClient('unittest_client', Context({'galileo_sampler': 'numpy', 'galileo_sampler_seed': '1'}))
+        cmd = SetWorkloadCommand('unittest_client', distribution='expovariate', parameters=(10,), users=2)
+
+        user0 = list(itertools.islice(ClosedLoop(client, cmd)._think_times(0), 10))
+        user1 = list(itertools.islice(ClosedLoop(client, cmd)._think_times(1), 10))
+
+        self.assertNotEqual(user0, user1)
+        self.assertEqual(user0, list(itertools.islice(ClosedLoop(client, cmd)._think_times(0), 10)))
+
+    def test_users_share_prerecorded_profile(self):
+        client = self.StubClient('unittest_client', Context({}))
+        cmd = SetWorkloadCommand('unittest_client', distribution='prerecorded', users=2)
+
+        with patch('galileo.worker.client.create_sampler', return_value=iter([0.1, 0.2, 0.3])) as create_sampler:
+            closed_loop = ClosedLoop(client, cmd)
+            user0 = closed_loop._think_times(0)
+            user1 = closed_loop._think_times(1)
+
+            self.assertEqual([0.1, 0.2], [next(user0), next(user1)])
+            self.assertEqual([0.3], list(user1))
+            self.assertEqual([], list(user0))
+            self.assertEqual(1, create_sampler.call_count)
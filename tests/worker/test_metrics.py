@@ -0,0 +1,72 @@
+import math
+import unittest
+
+from galileo.worker.api import ClientMetrics
+from galileo.worker.metrics import MetricsPublisher, read_metrics, last_metrics_id, METRICS_STREAM
+from tests.testutils import RedisResource
+
+
+class StaticMetricsClient:
+
+    def __init__(self, client_id, target_rate=10., dropped_traces=0) -> None:
+        super().__init__()
+        self.client_id = client_id
+        self.target_rate = target_rate
+        self.dropped_traces = dropped_traces
+
+    def sample_metrics(self) -> ClientMetrics:
+        return ClientMetrics(self.client_id, 'unittest_worker', 'aservice', 1000., 1., 9.5, self.target_rate, 1,
+                             0.01, 0.05, float('nan'), 2, 3, self.dropped_traces)
+
+
+class MetricsPublisherTest(unittest.TestCase):
+    redis_resource: RedisResource = RedisResource()
+
+    def setUp(self) -> None:
+        self.redis_resource.setUp()
+        self.rds = self.redis_resource.rds
+
+    def tearDown(self) -> None:
+        self.redis_resource.tearDown()
+
+    def test_publish_and_read(self):
+        clients = [StaticMetricsClient('c1'), StaticMetricsClient('c2', target_rate=None)]
+        publisher = MetricsPublisher(self.rds, lambda: clients)
+
+        self.assertEqual('0-0', last_metrics_id(self.rds))
+        published = publisher.publish()
+
+        last_id, records = read_metrics(self.rds, '0-0')
+        self.assertEqual(last_metrics_id(self.rds), last_id)
+        self.assertEqual(2, len(records))
+
+        self.assertEqual(published[0][:-4], records[0][:-4])
+        self.assertEqual((2, 3), (records[0].queued, records[0].inflight))
+        self.assertTrue(math.isnan(records[0].p999))
+        self.assertIsNone(records[1].target_rate)
+
+        self.assertEqual((last_id, []), read_metrics(self.rds, last_id))
+
+    def test_publish_reports_dropped_traces(self):
+        clients = [StaticMetricsClient('c1', dropped_traces=2), StaticMetricsClient('c2', dropped_traces=3)]
+        publisher = MetricsPublisher(self.rds, lambda: clients)
+
+        publisher.publish()
+        publisher.publish()
+
+        _, records = read_metrics(self.rds, '0-0')
+        self.assertEqual([2, 3, 2, 3], [r.dropped_traces for r in records])
+        self.assertEqual(10, publisher.ctrl.get_dropped_traces('unittest_worker'))
+
+    def test_publish_without_clients(self):
+        self.assertEqual([], MetricsPublisher(self.rds, lambda: []).publish())
+        self.assertEqual(0, self.rds.xlen(METRICS_STREAM))
+
+    def test_stream_is_capped(self):
+        clients = [StaticMetricsClient('c%d' % i) for i in range(10)]
+        publisher = MetricsPublisher(self.rds, lambda: clients, maxlen=5)
+
+        for _ in range(50):
+            publisher.publish()
+
+        self.assertLess(self.rds.xlen(METRICS_STREAM), 500)
@@ -0,0 +1,172 @@
+import itertools
+import math
+import tempfile
+import unittest
+
+from galileo.worker.context import Context
+from galileo.worker.random import create_sampler, numpy_sampler, numpy_distributions, distributions, \
+    InvalidDistributionException, sampler_seed, pre_recorded_profile, upload_profile, packed_profile, \
+    save_profile_file, distribution_mean
+import redislite
+
+from tests.testutils import RedisResource
+
+
+def take(gen, n):
+    return list(itertools.islice(gen, n))
+
+
+class NumpySamplerTest(unittest.TestCase):
+
+    def test_supports_all_distributions(self):
+        self.assertEqual(set(distributions.keys()), set(numpy_distributions.keys()))
+
+    def test_samples_across_blocks(self):
+        samples = take(numpy_sampler('uniform', (1, 2), seed=42, block_size=16), 40)
+
+        self.assertEqual(40, len(samples))
+        self.assertTrue(all(isinstance(x, float) for x in samples))
+        self.assertTrue(all(1 <= x <= 2 for x in samples))
+
+    def test_seed_is_reproducible(self):
+        a = take(numpy_sampler('expovariate', (10,), seed=[1, 2]), 100)
+        b = take(numpy_sampler('expovariate', (10,), seed=[1, 2]), 100)
+        c = take(numpy_sampler('expovariate', (10,), seed=[1, 3]), 100)
+
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_parameter_conventions(self):
+        def mean(distribution, *args):
+            return sum(take(numpy_sampler(distribution, args, seed=1), 20000)) / 20000
+
+        # expovariate takes the rate, not the scale
+        self.assertAlmostEqual(0.1, mean('expovariate', 10), delta=0.01)
+        # gammavariate takes shape and scale
+        self.assertAlmostEqual(6, mean('gammavariate', 2, 3), delta=0.2)
+        # paretovariate is pareto type I with a minimum of 1
+        self.assertAlmostEqual(1.5, mean('paretovariate', 3), delta=0.1)
+        # weibullvariate takes scale and shape
+        self.assertAlmostEqual(2, mean('weibullvariate', 2, 1), delta=0.1)
+        self.assertTrue(all(0 <= x < 2 * math.pi for x in take(numpy_sampler('vonmisesvariate', (0, 1), 1), 1000)))
+        self.assertEqual([0.5, 0.5], take(numpy_sampler('constant', (0.5,)), 2))
+
+    def test_distribution_mean(self):
+        def mean(distribution, *args):
+            return sum(take(numpy_sampler(distribution, args, seed=1), 20000)) / 20000
+
+        for distribution, args in [('uniform', (1, 3)), ('triangular', (0, 1, 0.2)), ('lognormvariate', (0, 0.5)),
+                                   ('expovariate', (10,)), ('gammavariate', (2, 3)), ('betavariate', (2, 5)),
+                                   ('paretovariate', (3,)), ('weibullvariate', (2, 1.5))]:
+            expected = distribution_mean(distribution, args)
+            self.assertAlmostEqual(expected, mean(distribution, *args), delta=expected * 0.05, msg=distribution)
+
+        self.assertEqual(0.5, distribution_mean('constant', (0.5,)))
+        self.assertIsNone(distribution_mean('prerecorded', ()))
+        self.assertIsNone(distribution_mean('expovariate', (0,)))
+
+    def test_invalid_distribution(self):
+        self.assertRaises(InvalidDistributionException, next, numpy_sampler('foo', ()))
+        self.assertRaises(InvalidDistributionException, next, numpy_sampler('expovariate', (1, 2, 3)))
+
+
+class CreateSamplerTest(unittest.TestCase):
+
+    def test_numpy_sampler_is_selected_and_seeded_per_client(self):
+        ctx = Context({'galileo_sampler': 'numpy', 'galileo_sampler_seed': '7'})
+
+        a = take(create_sampler('expovariate', (10,), ctx, client_id='client1'), 10)
+        b = take(create_sampler('expovariate', (10,), ctx, client_id='client1'), 10)
+        c = take(create_sampler('expovariate', (10,), ctx, client_id='client2'), 10)
+
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_sampler_seed(self):
+        self.assertIsNone(sampler_seed(Context({}), 'client1'))
+        self.assertEqual(sampler_seed(Context({'galileo_sampler_seed': '1'}), 'client1'),
+                         sampler_seed(Context({'galileo_sampler_seed': '1'}), 'client1'))
+        self.assertNotEqual(sampler_seed(Context({'galileo_sampler_seed': '1'}), 'client1', 0),
+                            sampler_seed(Context({'galileo_sampler_seed': '1'}), 'client1', 1))
+
+
+class PreRecordedProfileTest(unittest.TestCase):
+    redis_resource = RedisResource()
+
+    def setUp(self) -> None:
+        self.redis_resource.setUp()
+        rds = self.redis_resource.rds
+
+        class TestContext(Context):
+            def create_redis(self, decode_responses=True):
+                if decode_responses:
+                    return rds
+                return redislite.Redis(rds.db, decode_responses=False)
+
+        self.ctx = TestContext({})
+        self.rds = rds
+
+    def tearDown(self) -> None:
+        self.redis_resource.tearDown()
+
+    def test_streams_values_from_tail_in_pages(self):
+        self.rds.rpush('client1', *range(25))
+
+        values = list(pre_recorded_profile(self.ctx, 'client1', page_size=10))
+
+        self.assertEqual([float(x) for x in reversed(range(25))], values)
+        self.assertFalse(self.rds.exists('client1'))
+
+    def test_first_value_is_available_before_list_is_read(self):
+        self.rds.rpush('client1', *range(100))
+
+        gen = pre_recorded_profile(self.ctx, 'client1', page_size=10)
+        self.assertEqual(99., next(gen))
+        self.assertEqual(100, self.rds.llen('client1'))
+
+        gen.close()
+        self.assertFalse(self.rds.exists('client1'))
+
+    def test_empty_profile(self):
+        self.assertEqual([], list(pre_recorded_profile(self.ctx, 'client1', page_size=10)))
+
+    def test_create_sampler(self):
+        self.rds.rpush('client1', 1, 2, 3)
+        self.assertEqual([3., 2., 1.], list(create_sampler('prerecorded', None, self.ctx, client_id='client1')))
+
+
+class PackedProfileTest(PreRecordedProfileTest):
+
+    def test_upload_and_stream(self):
+        upload_profile(self.rds, 'client1', [0.5, 0.25, 1.5, 2.], chunk_size=3)
+
+        self.assertEqual('2', self.rds.hget('client1:meta', 'chunks'))
+        self.assertEqual([0.5, 0.25, 1.5, 2.], list(create_sampler('prerecorded', None, self.ctx, 'client1')))
+        self.assertFalse(self.rds.exists('client1:meta', 'client1:chunks'))
+
+    def test_float32(self):
+        upload_profile(self.rds, 'client1', [0.5, 0.25], dtype='float32')
+        self.assertEqual([0.5, 0.25], list(create_sampler('prerecorded', None, self.ctx, 'client1')))
+
+    def test_upload_replaces_list_profile(self):
+        self.rds.rpush('client1', 1, 2)
+        upload_profile(self.rds, 'client1', [3.])
+
+        self.assertFalse(self.rds.exists('client1'))
+        self.assertEqual([3.], list(create_sampler('prerecorded', None, self.ctx, 'client1')))
+
+    def test_empty_profile(self):
+        upload_profile(self.rds, 'client1', [])
+        self.assertEqual([], list(packed_profile(self.ctx.create_redis(decode_responses=False), 'client1')))
+
+    def test_invalid_dtype(self):
+        self.assertRaises(ValueError, upload_profile, self.rds, 'client1', [1.], dtype='int32')
+
+    def test_mapped_file_takes_precedence(self):
+        upload_profile(self.rds, 'client1', [3.])
+
+        with tempfile.TemporaryDirectory() as profile_dir:
+            save_profile_file(profile_dir, 'client1', [1., 2.])
+            self.ctx.env['galileo_profile_dir'] = profile_dir
+
+            self.assertEqual([1., 2.], list(create_sampler('prerecorded', None, self.ctx, 'client1')))
@@ -0,0 +1,88 @@
+import json
+import random
+import unittest
+
+from galileo.worker.sampling import create_trace_sampler, sample_weight, KeepAllSampler, RatioSampler, \
+    ReservoirSampler, TailSampler
+from galileo.worker.trace import ClientTrace, SAMPLE_WEIGHT_HEADER
+
+
+def trace(i, done=100., latency=0.1, status=200) -> ClientTrace:
+    return ClientTrace('r%d' % i, 'client', 'aservice', done - latency, done - latency, done, status,
+                       headers=json.dumps({'X-Server': 'host1'}), scheduled=done - latency)
+
+
+class TraceSamplerTest(unittest.TestCase):
+
+    def test_keep_all(self):
+        t = trace(0)
+        self.assertEqual((t,), KeepAllSampler().sample(t))
+        self.assertEqual(1, sample_weight(t))
+
+    def test_ratio(self):
+        sampler = RatioSampler(10)
+
+        kept = [s for i in range(100) for s in sampler.sample(trace(i))]
+
+        self.assertEqual(10, len(kept))
+        self.assertEqual(['r0', 'r10'], [t.request_id for t in kept[:2]])
+        self.assertEqual(100, sum(sample_weight(t) for t in kept))
+        self.assertEqual(10, kept[0].weight)
+        self.assertEqual({'X-Server': 'host1'}, json.loads(kept[0].headers))
+        self.assertEqual(kept[0].done - 0.1, kept[0].scheduled)
+
+    def test_reservoir_releases_window_on_next_window(self):
+        sampler = ReservoirSampler(5, window=1., rnd=random.Random(42))
+
+        kept = []
+        for i in range(100):
+            kept.extend(sampler.sample(trace(i, done=10 + i / 100)))  # 100 traces within [10, 11)
+        self.assertEqual([], kept)
+
+        kept.extend(sampler.sample(trace(100, done=11.5)))
+        self.assertEqual(5, len(kept))
+        self.assertEqual(100, sum(sample_weight(t) for t in kept))
+
+        flushed = sampler.flush()
+        self.assertEqual(['r100'], [t.request_id for t in flushed])
+        self.assertEqual(1, sample_weight(flushed[0]))
+        self.assertEqual(1, flushed[0].weight)
+        self.assertEqual([], sampler.flush())
+
+    def test_tail(self):
+        sampler = TailSampler(0.5, n=10)
+
+        kept = []
+        for i in range(100):
+            kept.extend(sampler.sample(trace(i)))
+        kept.extend(sampler.sample(trace(100, latency=1)))
+        kept.extend(sampler.sample(trace(101, status=503)))
+        kept.extend(sampler.sample(trace(102, status=-1)))
+
+        self.assertEqual(13, len(kept))
+        self.assertEqual(['r100', 'r101', 'r102'], [t.request_id for t in kept[-3:]])
+        self.assertEqual(103, sum(sample_weight(t) for t in kept))
+
+    def test_tail_drops_rest_by_default(self):
+        sampler = create_trace_sampler('tail:0.5')
+        self.assertEqual((), sampler.sample(trace(0)))
+
+    def test_request_trace_has_weight_header(self):
+        weighted = RatioSampler(10).sample(trace(0))[0].request_trace()
+
+        self.assertEqual(10, json.loads(weighted.headers)[SAMPLE_WEIGHT_HEADER])
+        self.assertEqual(10, sample_weight(weighted))
+        self.assertEqual({'X-Server': 'host1'}, json.loads(trace(0).request_trace().headers))
+        self.assertEqual(1, sample_weight(trace(0).request_trace()))
+
+    def test_create(self):
+        self.assertIsInstance(create_trace_sampler(None), KeepAllSampler)
+        self.assertEqual(4, create_trace_sampler('ratio:4').n)
+        reservoir = create_trace_sampler('reservoir:8:2')
+        self.assertEqual((8, 2.), (reservoir.size, reservoir.window))
+        tail = create_trace_sampler('tail:0.25:100')
+        self.assertEqual((0.25, 100), (tail.threshold, tail.n))
+
+    def test_create_invalid(self):
+        for policy in ['foo', 'ratio', 'ratio:0', 'ratio:x', 'reservoir:1:2:3', 'all:1', 'tail:0.1:-1']:
+            self.assertRaises(ValueError, create_trace_sampler, policy)
@@ -0,0 +1,124 @@
+import json
+import math
+import unittest
+
+from galileo.worker.stats import percentile, LatencyHistogram, ClientStats, status_class
+
+
+class StatsTest(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertTrue(math.isnan(percentile([], 50)))
+
+    def test_status_class(self):
+        self.assertEqual('2xx', status_class(200))
+        self.assertEqual('5xx', status_class(503))
+        self.assertEqual('error', status_class(-1))
+
+    def test_corrected_latency_includes_scheduling_delay(self):
+        stats = ClientStats()
+
+        # scheduled at 0, but only sent at 1 because the client was backlogged
+        stats.record(scheduled=0, sent=1, done=1.5)
+
+        self.assertEqual(0.5, stats.latency.summary()['max'])
+        self.assertEqual(1.5, stats.corrected_latency.summary()['max'])
+
+    def test_request_that_was_not_sent(self):
+        stats = ClientStats()
+        stats.record(scheduled=0, sent=-1, done=1, service='aservice', status=-1)
+
+        self.assertEqual(0, stats.latency.summary()['count'])
+        self.assertEqual(1, stats.corrected_latency.summary()['count'])
+        self.assertEqual({}, stats.histograms)
+
+    def test_histograms_per_service_and_status_class(self):
+        stats = ClientStats()
+        stats.record(0, 0.1, 0.2, 'aservice', 200)
+        stats.record(0, 0.1, 0.3, 'aservice', 201)
+        stats.record(0, 0.1, 0.4, 'aservice', 500)
+        stats.record(0, 0.1, 0.5, 'bservice', 200)
+
+        self.assertEqual({'aservice 2xx', 'aservice 5xx', 'bservice 2xx'}, set(stats.histograms.keys()))
+        self.assertEqual(2, stats.histograms['aservice 2xx'].count)
+
+    def test_record_phases(self):
+        stats = ClientStats()
+        stats.record_phases({'generate': 1000, 'server': 2000000})
+        stats.record_phases({'generate': 3000})
+
+        self.assertEqual(2, stats.phases['generate'].count)
+        self.assertAlmostEqual(0.002, stats.phases['server'].max)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_percentiles_within_relative_error(self):
+        histogram = LatencyHistogram()
+
+        for i in range(1, 1001):
+            histogram.record(i / 1000)
+
+        self.assertAlmostEqual(0.5, histogram.percentile(50), delta=0.5 * 0.01)
+        self.assertAlmostEqual(0.99, histogram.percentile(99), delta=0.99 * 0.01)
+        self.assertAlmostEqual(0.999, histogram.percentile(99.9), delta=0.999 * 0.01)
+        self.assertEqual(1., histogram.percentile(100))
+
+    def test_summary(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.002)
+        histogram.record(0.004)
+
+        summary = histogram.summary()
+        self.assertEqual(2, summary['count'])
+        self.assertAlmostEqual(0.003, summary['mean'])
+        self.assertEqual(0.004, summary['max'])
+        self.assertIn('p999', summary)
+
+    def test_empty(self):
+        self.assertEqual({'count': 0}, LatencyHistogram().summary())
+        self.assertTrue(math.isnan(LatencyHistogram().percentile(50)))
+
+    def test_memory_is_bounded(self):
+        histogram = LatencyHistogram()
+
+        for i in range(100000):
+            histogram.record(0.001 + (i % 100) / 100000)
+        histogram.record(1e9)
+        histogram.record(0)
+
+        self.assertLess(len(histogram.counts), 75)  # 1-2ms spans ~70 buckets with 1% growth
+        self.assertEqual(100002, histogram.count)
+
+    def test_merge(self):
+        h1 = LatencyHistogram()
+        h2 = LatencyHistogram()
+
+        for i in range(100):
+            h1.record(0.01)
+            h2.record(0.1)
+
+        h1.merge(h2)
+
+        self.assertEqual(200, h1.count)
+        self.assertAlmostEqual(0.01, h1.percentile(50), delta=0.0001)
+        self.assertAlmostEqual(0.1, h1.percentile(51), delta=0.001)
+
+    def test_merge_different_parameters_raises(self):
+        self.assertRaises(ValueError, LatencyHistogram().merge, LatencyHistogram(growth=1.1))
+
+    def test_dict_round_trip_through_json(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.01)
+        histogram.record(0.02)
+
+        doc = json.loads(json.dumps(histogram.to_dict()))
+        merged = LatencyHistogram.merged([doc, doc, None])
+
+        self.assertEqual(4, merged.count)
+        self.assertEqual(histogram.percentile(99), merged.percentile(99))
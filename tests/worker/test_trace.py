@@ -0,0 +1,345 @@
+import csv
+import json
+import multiprocessing
+import os
+import pickle
+import queue
+import tempfile
+import unittest
+
+from galileodb.model import RequestTrace
+from galileodb.trace import TraceLogger, TraceWriter, POISON
+
+from galileo.worker.trace import TraceBatcher, TraceQueueReader, TraceRing, AttachTraceRing, DetachTraceRing, \
+    TraceSpillFile, ingest_spill_files, ClientTrace, RequestTraceWriter, ClientTraceFileWriter, SAMPLE_WEIGHT_HEADER
+
+
+class ListTraceWriter(TraceWriter):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.traces = list()
+
+    def write(self, traces):
+        self.traces.extend(traces)
+
+
+class TraceBatcherTest(unittest.TestCase):
+
+    def test_flush_on_size(self):
+        q = queue.Queue()
+        batcher = TraceBatcher(q, size=3, interval=10)
+
+        for i in range(7):
+            batcher.put_nowait(i)
+
+        self.assertEqual([0, 1, 2], q.get_nowait())
+        self.assertEqual([3, 4, 5], q.get_nowait())
+        self.assertTrue(q.empty())
+
+        batcher.close()
+        self.assertEqual([6], q.get_nowait())
+
+    def test_flush_on_interval(self):
+        q = queue.Queue()
+        batcher = TraceBatcher(q, size=100, interval=0.05).start()
+
+        try:
+            batcher.put_nowait(1)
+            batcher.put_nowait(2)
+            self.assertEqual([1, 2], q.get(timeout=1))
+        finally:
+            batcher.close()
+
+    def test_full_queue_raises_on_put(self):
+        q = queue.Queue(maxsize=1)
+        batcher = TraceBatcher(q, size=1)
+
+        batcher.put_nowait(1)
+        self.assertRaises(queue.Full, batcher.put_nowait, 2)
+
+    def test_full_queue_calls_overflow(self):
+        q = queue.Queue(maxsize=1)
+        overflow = list()
+        batcher = TraceBatcher(q, size=2, overflow=overflow.append)
+
+        for i in range(5):
+            batcher.put_nowait(i)
+        batcher.close()
+
+        self.assertEqual([0, 1], q.get_nowait())
+        self.assertEqual([[2, 3], [4]], overflow)
+
+
+class TraceQueueReaderTest(unittest.TestCase):
+
+    def test_unpacks_batches(self):
+        q = queue.Queue()
+        q.put([1, 2])
+        q.put('single')
+        q.put([])
+        q.put([3])
+
+        reader = TraceQueueReader(q)
+
+        self.assertEqual([1, 2, 'single', 3], [reader.get(timeout=1) for _ in range(4)])
+        self.assertRaises(queue.Empty, reader.get, timeout=0.01)
+
+    def test_trace_logger_receives_batched_traces(self):
+        q = queue.Queue()
+        writer = ListTraceWriter()
+        trace_logger = TraceLogger(TraceQueueReader(q), writer)
+
+        batcher = TraceBatcher(q, size=2)
+        for i in range(5):
+            batcher.put_nowait(i)
+        batcher.close()
+        q.put(POISON)
+
+        trace_logger.run()
+
+        self.assertEqual([0, 1, 2, 3, 4], writer.traces)
+
+    def test_reads_attached_rings(self):
+        q = queue.Queue()
+        ring = TraceRing.create(capacity=8)
+        try:
+            q.put(AttachTraceRing(ring.name))
+            reader = TraceQueueReader(q)
+
+            self.assertRaises(queue.Empty, reader.get, timeout=0.05)
+
+            ring.put_nowait(create_trace('r1'))
+            ring.put_nowait(create_trace('r2'))
+            q.put('single')
+
+            self.assertEqual('r1', reader.get(timeout=1).request_id)
+            self.assertEqual('r2', reader.get(timeout=1).request_id)
+            self.assertEqual('single', reader.get(timeout=1))
+
+            ring.put_nowait(create_trace('r3'))
+            q.put(DetachTraceRing(ring.name))
+            self.assertEqual('r3', reader.get(timeout=1).request_id)
+            self.assertRaises(queue.Empty, reader.get, timeout=0.05)
+        finally:
+            ring.close()
+
+        self.assertRaises(FileNotFoundError, TraceRing.attach, ring.name)
+        self.assertFalse(os.path.exists(TraceRing.lock_path(ring.name)))
+
+    def test_poison_closes_attached_rings(self):
+        q = queue.Queue()
+        ring = TraceRing.create(capacity=8)
+        try:
+            q.put(AttachTraceRing(ring.name))
+            reader = TraceQueueReader(q)
+            self.assertRaises(queue.Empty, reader.get, timeout=0.05)
+
+            ring.put_nowait(create_trace('r1'))
+            q.put(POISON)
+
+            self.assertEqual('r1', reader.get(timeout=1).request_id)
+            self.assertEqual(POISON, reader.get(timeout=1))
+        finally:
+            ring.close()
+
+        self.assertRaises(FileNotFoundError, TraceRing.attach, ring.name)
+
+    def test_trace_logger_receives_ring_traces_before_poison(self):
+        q = queue.Queue()
+        ring = TraceRing.create(capacity=8)
+        try:
+            q.put(AttachTraceRing(ring.name))
+            write_traces(ring, 3)
+            q.put(POISON)
+
+            writer = ListTraceWriter()
+            TraceLogger(TraceQueueReader(q), writer).run()
+        finally:
+            ring.close()
+
+        self.assertEqual(['r0', 'r1', 'r2'], [t.request_id for t in writer.traces])
+
+
+class ClientTraceWriterTest(unittest.TestCase):
+
+    def test_request_trace_writer_strips_scheduled(self):
+        writer = ListTraceWriter()
+        RequestTraceWriter(writer).write([create_trace('r1')])
+
+        self.assertEqual(RequestTrace, type(writer.traces[0]))
+        self.assertEqual(create_trace('r1')[:-2], tuple(writer.traces[0]))
+
+    def test_request_trace_writer_keeps_weight_in_headers(self):
+        writer = ListTraceWriter()
+        RequestTraceWriter(writer).write([create_trace('r1')._replace(weight=4.)])
+
+        self.assertEqual({'X-Server': 'host1', SAMPLE_WEIGHT_HEADER: 4.}, json.loads(writer.traces[0].headers))
+
+    def test_file_writer_has_scheduled_and_weight_columns(self):
+        with tempfile.TemporaryDirectory() as target_dir:
+            writer = ClientTraceFileWriter('host1', target_dir)
+            writer.write([create_trace('r1')._replace(weight=4.), RequestTrace('r2', 'client1', 'aservice', 1., 2., 3.)])
+
+            with open(writer.file_path) as fd:
+                rows = list(csv.reader(fd))
+
+        self.assertEqual(['scheduled', 'weight'], rows[0][-2:])
+        self.assertEqual(['0.5', '4.0'], rows[1][-2:])
+        self.assertEqual(['', '1.0'], rows[2][-2:])
+        self.assertEqual('{"X-Server": "host1"}', rows[1][-4])
+
+
+class TraceSpillTest(unittest.TestCase):
+
+    def test_spill_and_ingest(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            spill = TraceSpillFile(spill_dir, 'worker:client1')
+            spill.write([create_trace('r1'), create_trace('r2')._replace(weight=4.)])
+            spill.write([create_trace('r3')])
+
+            traces = ingest_spill_files(spill_dir)
+            self.assertEqual(['r1', 'r2', 'r3'], [t.request_id for t in traces])
+            self.assertEqual(create_trace('r1'), traces[0])
+            self.assertEqual(4., traces[1].weight)
+            self.assertEqual([], os.listdir(spill_dir))
+
+            # the writer re-creates the file after it was ingested
+            spill.write([create_trace('r4')])
+            self.assertEqual(['r4'], [t.request_id for t in ingest_spill_files(spill_dir)])
+
+    def test_reader_ingests_spill_files_when_idle(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            q = queue.Queue()
+            q.put('single')
+            TraceSpillFile(spill_dir, 'client1').write([create_trace('r1')])
+
+            reader = TraceQueueReader(q, spill_dir)
+            self.assertEqual('single', reader.get(timeout=1))
+            self.assertEqual('r1', reader.get(timeout=1).request_id)
+            self.assertRaises(queue.Empty, reader.get, timeout=0.05)
+
+
+def create_trace(request_id, response='ok') -> ClientTrace:
+    return ClientTrace(request_id, 'client1', 'aservice', 1., 2., 3., 200, server='host1',
+                       headers='{"X-Server": "host1"}', response=response, scheduled=0.5)
+
+
+def write_traces(ring: TraceRing, n):
+    for i in range(n):
+        ring.put_nowait(create_trace('r%d' % i))
+
+
+def write_until_done(ring: TraceRing, n):
+    i = 0
+    while i < n:
+        try:
+            ring.put_nowait(create_trace('r%d' % i))
+            i += 1
+        except queue.Full:
+            pass
+
+
+class TraceRingTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ring = TraceRing.create(capacity=4)
+
+    def tearDown(self) -> None:
+        self.ring.close()
+        self.ring.unlink()
+
+    def test_put_and_drain(self):
+        trace = create_trace('r1')
+        self.ring.put_nowait(trace)
+
+        self.assertEqual(1, len(self.ring))
+        self.assertEqual([trace], self.ring.drain())
+        self.assertEqual(0, len(self.ring))
+        self.assertEqual([], self.ring.drain())
+
+    def test_scheduled_is_preserved(self):
+        self.ring.put_nowait(create_trace('r1'))
+        self.assertEqual(0.5, self.ring.drain()[0].scheduled)
+
+    def test_weight_is_preserved(self):
+        self.ring.put_nowait(create_trace('r1')._replace(weight=2.5))
+        self.ring.put_nowait(create_trace('r2'))
+
+        self.assertEqual([2.5, 1.], [t.weight for t in self.ring.drain()])
+
+    def test_none_fields_are_preserved(self):
+        trace = ClientTrace('r1', 'client1', 'aservice', 1., -1, 3., -1)
+        self.ring.put_nowait(trace)
+
+        self.assertEqual([trace], self.ring.drain())
+
+    def test_large_fields_span_multiple_slots(self):
+        headers = json.dumps({'X-Header-%d' % i: 'value-%d' % i for i in range(30)})
+        self.assertGreater(len(headers), TraceRing.slot_size)
+
+        trace = create_trace('r1', response='\u00e4' * 200)._replace(headers=headers)
+        self.ring.put_nowait(trace)
+
+        self.assertLess(1, len(self.ring))
+        self.assertEqual([trace], self.ring.drain())
+        self.assertEqual(headers, trace.headers)
+        self.assertEqual(0, len(self.ring))
+
+    def test_large_record_wraps_around(self):
+        write_traces(self.ring, 3)
+        self.ring.drain()
+
+        trace = create_trace('r1', response='x' * 1000)
+        self.ring.put_nowait(trace)
+
+        self.assertEqual([trace], self.ring.drain())
+
+    def test_record_larger_than_ring_raises(self):
+        self.assertRaises(queue.Full, self.ring.put_nowait, create_trace('r1', response='x' * 4 * TraceRing.slot_size))
+        self.assertEqual(0, len(self.ring))
+
+    def test_empty_strings_are_preserved(self):
+        trace = create_trace('r1', response='')
+        self.ring.put_nowait(trace)
+
+        self.assertEqual('', self.ring.drain()[0].response)
+
+    def test_full_ring_raises(self):
+        write_traces(self.ring, 4)
+        self.assertRaises(queue.Full, self.ring.put_nowait, create_trace('r5'))
+
+        self.assertEqual(['r0', 'r1'], [t.request_id for t in self.ring.drain(limit=2)])
+        self.ring.put_nowait(create_trace('r4'))
+        self.ring.put_nowait(create_trace('r5'))
+
+        self.assertEqual(['r2', 'r3', 'r4', 'r5'], [t.request_id for t in self.ring.drain()])
+
+    def test_pickle_attaches_to_same_memory(self):
+        other = pickle.loads(pickle.dumps(self.ring))
+        try:
+            other.put_nowait(create_trace('r1'))
+            self.assertEqual(4, other.capacity)
+            self.assertEqual(['r1'], [t.request_id for t in self.ring.drain()])
+        finally:
+            other.close()
+
+    def test_write_from_other_process(self):
+        process = multiprocessing.Process(target=write_traces, args=(self.ring, 3))
+        process.start()
+        process.join(5)
+
+        self.assertEqual(['r0', 'r1', 'r2'], [t.request_id for t in self.ring.drain()])
+
+    def test_concurrent_write_and_drain(self):
+        process = multiprocessing.Process(target=write_until_done, args=(self.ring, 200))
+        process.start()
+
+        traces = list()
+        while len(traces) < 200 and process.is_alive() or len(self.ring):
+            traces.extend(self.ring.drain())
+        process.join(5)
+        traces.extend(self.ring.drain())
+
+        self.assertEqual(['r%d' % i for i in range(200)], [t.request_id for t in traces])
+        self.assertEqual({create_trace('r0').headers}, {t.headers for t in traces})